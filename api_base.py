@@ -1,6 +1,8 @@
 # Copyright (c) 2012 - 2015 Lars Hupfeldt Nielsen, Hupfeldt IT
 # All rights reserved. This work is under a BSD license, see LICENSE.TXT.
 
+import re, urllib
+
 from enum import Enum
 from .ordered_enum import OrderedEnum
 
@@ -28,6 +30,73 @@ class UnknownJobException(Exception):
         super(UnknownJobException, self).__init__("Job not found: " + job_url + (", " + repr(api_ex) if api_ex is not None else ""))
 
 
+def job_path(job_name):
+    """Return the path of a job relative to the Jenkins uri. Jobs in folders are named by their full name, 'folder/sub/job'."""
+    return '/job/' + '/job/'.join(job_name.split('/'))
+
+
+def job_name_from_url(url):
+    """Return the full name of a job from the url of the job or one of its builds, absolute or relative to the Jenkins uri"""
+    return '/'.join(urllib.unquote(name) for name in re.findall(r'(?:^|/)job/([^/]+)', url))
+
+
 class ApiInvocationMixin(object):
     def console_url(self):
         return (self.job.public_uri + '/' + repr(self.build_number) + '/console') if self.build_number is not None else None
+
+
+class ApiJenkinsMixin(object):
+    """Default implementations of the Jenkins api methods used by the flow, for apis which poll and invoke one job at a time"""
+
+    def start_polling(self, interval):
+        """Called by the flow before it starts polling, with the seconds between the start of each poll"""
+        pass
+
+    def stop_polling(self):
+        """Called by the flow when it has stopped polling"""
+        pass
+
+    def prefetch_jobs(self, job_names):
+        """Called by the flow after the first poll, with the names of all the jobs it will get"""
+        pass
+
+    def close(self):
+        """Called by the flow when it has finished, to release threads and connections"""
+        pass
+
+    def poll_interval(self, interval):
+        """Return the seconds to wait before the next poll, given the interval of the flow"""
+        return interval
+
+    def poll_status(self):
+        """Return a string describing the polling for the status output, or None"""
+        return None
+
+    def invoke_jobs(self, invocations):
+        """Invoke several jobs. Return the Invocation, or the exception raised when invoking, for each (job, kwargs) in 'invocations'."""
+        results = []
+        for job, kwargs in invocations:
+            try:
+                results.append(job.invoke(**kwargs))
+            except Exception as ex:  # pylint: disable=broad-except
+                results.append(ex)
+        return results
+
+    def flush(self):
+        """Called by the flow before it finishes, to complete anything still being sent to Jenkins"""
+        pass
+
+    def stop_all_jobs(self, jobs):
+        """Stop all running and queued builds of 'jobs'. Return (cancelled, stopped) counts, or (None, None) if not known."""
+        for job in jobs:
+            job.stop_all()
+        return None, None
+
+    def stop_invocations(self, invocations, dequeue):
+        """Stop the builds of 'invocations', see the stop method of the invocations"""
+        for invocation in invocations:
+            invocation.stop(dequeue)
+
+    def free_executors(self):
+        """Return the number of executors free for new builds, or None if not known, which disables admission control"""
+        return None
@@ -17,6 +17,7 @@ if __package__ is None:
 
 from .set_build_result import set_build_result
 from .set_build_description import set_build_description
+from .notify import notify
 
 
 @click.group()
@@ -27,6 +28,7 @@ def cli():
 
 cli.add_command(set_build_result)
 cli.add_command(set_build_description)
+cli.add_command(notify)
 
 
 if __name__ == "__main__":
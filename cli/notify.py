@@ -0,0 +1,19 @@
+# Copyright (c) 2012 - 2015 Lars Hupfeldt Nielsen, Hupfeldt IT
+# All rights reserved. This work is under a BSD license, see LICENSE.TXT.
+
+import click
+
+from ..notifications import send_notification
+
+
+@click.command()
+@click.option('--url', help="URL of the flow's notification receiver", required=True)
+@click.option('--job-name', help='Job Name', envvar='JOB_NAME', required=True)
+@click.option('--build-number', help="Build Number", type=click.INT, envvar='BUILD_NUMBER', required=True)
+@click.option('--phase', help="Build phase", type=click.Choice(['QUEUED', 'STARTED', 'COMPLETED', 'FINALIZED']), required=True)
+@click.option('--status', help="Build result, e.g. SUCCESS, for the COMPLETED and FINALIZED phases")
+@click.option('--queue-id', help="Id of the queue item the build was started from", type=click.INT)
+def notify(url, job_name, build_number, phase, status, queue_id):
+    """Send a build notification to a flow, in the format of the Jenkins Notification plugin."""
+    # %(file)s --url <url> --job-name <job_name> --build-number <build_number> --phase <phase> [--status <status>] [--queue-id <queue_id>]
+    send_notification(url, job_name, build_number, phase, status, queue_id)
@@ -7,6 +7,7 @@ import os, re, abc, signal
 from os.path import join as jp
 from collections import OrderedDict
 from itertools import chain
+from multiprocessing.pool import ThreadPool
 from enum import Enum
 
 from .ordered_enum import OrderedEnum
@@ -99,6 +100,48 @@ class Killed(Exception):
     pass
 
 
+class _AdmissionControl(object):
+    """Holds invocations while Jenkins is not likely to have a free executor, instead of piling up builds in the Jenkins queue
+
+    The free executors are read at most every 'interval' seconds and counted down for each job admitted in between.
+    When executors become free, the held jobs with the highest priority are admitted first.
+    """
+
+    def __init__(self, api, interval):
+        self.api = api
+        self.interval = interval
+        self.free = None
+        self._read_time = None
+        self._held = OrderedDict()  # id(job) -> job, in the order the jobs were held
+        self._reserved = set()
+
+    def start_tick(self):
+        """Must be called before the jobs are checked in each poll"""
+        now = hyperspeed.time()
+        if self._read_time is None or now - self._read_time >= self.interval:
+            self._read_time = now
+            self.free = self.api.free_executors()
+
+        if self.free is None:
+            return
+        held = sorted(self._held.values(), key=lambda job: -job._priority)
+        self._reserved = set(id(job) for job in held[:self.free])
+
+    def admit(self, job):
+        """True if job may be invoked now, otherwise the job is held"""
+        if self.free is None:
+            return True
+
+        if id(job) in self._reserved or self.free > len(self._reserved):
+            self._reserved.discard(id(job))
+            self._held.pop(id(job), None)
+            self.free -= 1
+            return True
+
+        self._held[id(job)] = job
+        return False
+
+
 class _JobControl(object):
     __metaclass__ = abc.ABCMeta
 
@@ -250,7 +293,12 @@ class _SingleJob(_JobControl):
         self.repr_str = ("unchecked " if self.propagation == Propagation.UNCHECKED else "") + "job: " + repr(self.name)
         self.jenkins_baseurl = None
         self._reported_invoked = False
+        self._triggered_invocation = None
         self._killed = False
+        self._stop_sent = False
+        self._priority = 0
+        self._admitted = False
+        self._api = None
         self._display_params = []
         self._set_display_params()
 
@@ -319,24 +367,91 @@ class _SingleJob(_JobControl):
         super(_SingleJob, self)._prepare_to_invoke(reset_tried_times)
         _, _, self.old_build_num = self.job.job_status()
         self._reported_invoked = False
+        self._admitted = False
+
+    def priority(self, priority):
+        """Define the priority of the job, when the flow holds invocations until Jenkins has free executors.
+
+        See the :py:obj:`admission_interval` argument of the top level flow.
+
+        Args:
+            priority (int): Held jobs with higher priority are invoked first. The default priority is 0.
+
+        Returns:
+            The job, so that the priority can be set directly on the result of :py:meth:`_Flow.invoke`.
+        """
+
+        self._priority = priority
+        return self
+
+    def master(self, jenkins_api):
+        """Invoke the job on another Jenkins master than the one used by the top level flow.
+
+        The jobs of one flow may be spread over several Jenkins masters. The masters are polled at the same time.
+
+        Args:
+            jenkins_api (:py:class:`.jenkins_api.Jenkins` or :py:class:`.script_api.Jenkins`): Jenkins Api instance for the master.
+
+        Returns:
+            The job, so that the master can be set directly on the result of :py:meth:`_Flow.invoke`.
+        """
+
+        self._api = jenkins_api
+        return self
+
+    @property
+    def api(self):
+        return self._api or self.top_flow._api
+
+    def _admit(self):
+        """True if the job may be invoked now, always True unless the top level flow controls admission"""
+        if not self._admitted:
+            admission = self.top_flow.admission.get(id(self.api)) if self.top_flow.admission is not None else None
+            self._admitted = admission is None or admission.admit(self)
+        return self._admitted
+
+    def _invoke_kwargs(self):
+        params = self.params if self.params else None
+        return dict(securitytoken=self.securitytoken, build_params=params, cause=self.top_flow.cause, description=self.top_flow.description)
+
+    def _invocation_due(self):
+        """True if the next _check will invoke the job"""
+        if self.checking_status == Checking.FINISHED or self.job is None or self.invocation_time:
+            return False
+        return self.propagation != Propagation.UNCHECKED or not self.job_invocation or self.job_invocation.status()[1] == Progress.IDLE
+
+    def _invoke(self):
+        """Invoke the job, or return the invocation already made by the parent flow"""
+        invocation, self._triggered_invocation = self._triggered_invocation, None
+        if invocation is None:
+            return self.job.invoke(**self._invoke_kwargs())
+        if isinstance(invocation, Exception):
+            raise invocation  # pylint: disable=raising-bad-type
+        return invocation
+
+    def _claim_triggered_invocation(self):
+        """Pick up a build triggered by the parent flow which was not yet picked up by _check, so that a kill will stop it"""
+        if self._triggered_invocation is not None and not isinstance(self._triggered_invocation, Exception):
+            self.job_invocation = self._invoke()
 
     def _check(self, report_now):
         if self.job is None:
             self._prepare_first(require_job=True)
 
         self.job.poll()
+        if self._invocation_due() and not self._admit():
+            if report_now:
+                print(self._status_message(Progress.QUEUED, None, "Held by flow until Jenkins has a free executor"))
+            return
+
         if self._must_invoke_set_invocation_time():
             # Don't re-invoke unchecked jobs that are still running
             if self.propagation != Propagation.UNCHECKED:
                 self._invocation_message('Job', self.job.public_uri)
-                params = self.params if self.params else None
-                self.job_invocation = self.job.invoke(securitytoken=self.securitytoken, build_params=params,
-                                                      cause=self.top_flow.cause, description=self.top_flow.description)
+                self.job_invocation = self._invoke()
             elif not self.job_invocation or self.job_invocation.status()[1] == Progress.IDLE:
                 self._invocation_message('Job', self.job.public_uri)
-                params = self.params if self.params else None
-                self.job_invocation = self.job.invoke(securitytoken=self.securitytoken, build_params=params, cause=self.top_flow.cause,
-                                                      description=self.top_flow.description)
+                self.job_invocation = self._invoke()
 
         result, progress = self.job_invocation.status()
         if not self._reported_invoked and self.job_invocation.build_number is not None:
@@ -376,17 +491,22 @@ class _SingleJob(_JobControl):
             self.checking_status = Checking.FINISHED
             return
 
+        self._claim_triggered_invocation()
         self.job.poll()
         if not self._killed:
             self._killed = not dequeue
+            # The top flow may already have sent the requests for all jobs together
+            stop_sent, self._stop_sent = self._stop_sent, False
             if self.top_flow.kill == KillType.ALL:
                 if not dequeue:
                     print("Killing all running builds for:", repr(self.name))
-                self.job.stop_all()
+                if not stop_sent:
+                    self.job.stop_all()
             elif self.job_invocation:
                 if not dequeue:
                     print("Killing build:", repr(self.name), '-', self.job_invocation.console_url())
-                self.job_invocation.stop(dequeue)
+                if not stop_sent:
+                    self.job_invocation.stop(dequeue)
             else:
                 print("Not invoked:", repr(self.name))
 
@@ -651,6 +771,14 @@ class _Flow(_JobControl):
             self._invocation_message('Flow', self)
         return self._check_report()
 
+    def _single_jobs(self):
+        for job in self.jobs:
+            if isinstance(job, _SingleJob):
+                yield job
+            else:
+                for single_job in job._single_jobs():
+                    yield single_job
+
     def _kill_check(self, report_now, dequeue):
         report_now = self._check_report()
 
@@ -696,9 +824,30 @@ class _Parallel(_Flow):
     _enter_str = "parallel flow: ("
     _exit_str = ")\n"
 
+    def _invoke_due_jobs(self):
+        """Invoke all the single jobs due for invocation at the same time, instead of one by one in their _check
+
+        The results are picked up by _SingleJob._check, so the output is the same as when invoking one by one.
+        """
+        due_jobs = [job for job in self.jobs if isinstance(job, _SingleJob) and job._invocation_due()]
+        # Offer the free executors to the jobs with the highest priority first
+        admitted = set(id(job) for job in sorted(due_jobs, key=lambda job: -job._priority) if job._admit())
+        due_jobs = [job for job in due_jobs if id(job) in admitted]
+
+        by_master = OrderedDict()
+        for job in due_jobs:
+            by_master.setdefault(id(job.api), []).append(job)
+        for master_jobs in by_master.values():
+            if len(master_jobs) < 2:
+                continue
+            invocations = master_jobs[0].api.invoke_jobs([(job.job, job._invoke_kwargs()) for job in master_jobs])
+            for job, invocation in zip(master_jobs, invocations):
+                job._triggered_invocation = invocation
+
     def _check(self, report_now):
         report_now = self._check_invoke_report()
 
+        self._invoke_due_jobs()
         checking_status = Checking.FINISHED
         for job in self.jobs:
             try:
@@ -873,7 +1022,8 @@ class _TopLevelControllerMixin(object):
     __metaclass__ = abc.ABCMeta
 
     def toplevel_init(self, jenkins_api, securitytoken, username, password, top_level_job_name_prefix, poll_interval, direct_url, require_idle,
-                      json_dir, json_indent, json_strip_top_level_prefix, params_display_order, just_dump, kill_all, description):
+                      json_dir, json_indent, json_strip_top_level_prefix, params_display_order, just_dump, kill_all, description,
+                      admission_interval):
         self._start_msg()
         # pylint: disable=attribute-defined-outside-init
         # Note: Special handling in top level flow, these atributes will be modified in proper flow init
@@ -914,6 +1064,11 @@ class _TopLevelControllerMixin(object):
 
         self.params_display_order = params_display_order
         self.description = description
+        self.admission_interval = admission_interval
+        # id(api) -> _AdmissionControl for each master, if enabled
+        self.admission = None
+        self._masters = [jenkins_api]
+        self._master_pool = None
 
         # Set signalhandler to kill entire flow
         def set_kill(_sig, _frame):
@@ -926,6 +1081,40 @@ class _TopLevelControllerMixin(object):
         # Allow test framework to set securitytoken, so that we won't have to litter all the testcases with it
         return self.securitytoken or jenkins_api.securitytoken if hasattr(jenkins_api, 'securitytoken') else None
 
+    def _stop_all(self, dequeue):
+        """Send the kill requests for all jobs in the flow together, instead of one job at a time from _kill_check"""
+        for job in self._single_jobs():
+            job._claim_triggered_invocation()
+        jobs = [job for job in self._single_jobs() if job.job is not None and not job._killed and job.checking_status != Checking.FINISHED]
+        if not jobs:
+            return
+
+        before = hyperspeed.time()
+        cancelled = stopped = 0
+        for api in self._masters:
+            master_jobs = [job for job in jobs if job.api is api]
+            if not master_jobs:
+                continue
+            if self.kill == KillType.ALL:
+                master_cancelled, master_stopped = api.stop_all_jobs([job.job for job in master_jobs])
+            else:
+                api.stop_invocations([job.job_invocation for job in master_jobs if job.job_invocation], dequeue)
+                master_cancelled = master_stopped = None
+            cancelled = cancelled + master_cancelled if cancelled is not None and master_cancelled is not None else None
+            stopped = stopped + master_stopped if stopped is not None and master_stopped is not None else None
+        for job in jobs:
+            job._stop_sent = True
+
+        if not dequeue or self.kill == KillType.ALL:
+            counts = (" removed " + repr(cancelled) + " queued and aborted " + repr(stopped) + " running builds,") if cancelled is not None else ""
+            print("Kill sent for", len(jobs), "jobs," + counts, "in %.3fs" % (hyperspeed.time() - before))
+
+    def _each_master(self, call):
+        """Return [call(api)] for the api of each Jenkins master used by the flow, calling for all masters at the same time"""
+        if self._master_pool is None:
+            return [call(api) for api in self._masters]
+        return self._master_pool.map(call, self._masters)
+
     @staticmethod
     def _start_msg():
         print()
@@ -953,7 +1142,14 @@ class _TopLevelControllerMixin(object):
         # Wait for jobs to finish
         print()
         print("--- Getting initial job status ---")
-        self.api.poll()
+        for job in self._single_jobs():
+            if all(job.api is not api for api in self._masters):
+                self._masters.append(job.api)
+        if self.admission_interval is not None:
+            self.admission = dict((id(api), _AdmissionControl(api, self.admission_interval)) for api in self._masters)
+
+        self._each_master(lambda api: api.poll())
+        self._each_master(lambda api: api.prefetch_jobs([job.name for job in self._single_jobs() if job.api is api]))
         self._prepare_first()
         self._show_job_definition()
 
@@ -973,23 +1169,43 @@ class _TopLevelControllerMixin(object):
             print("--- Starting kill of all builds in flow ---")
 
         sleep_time = min(self.poll_interval, self.report_interval)
+        last_poll_status_time = self.start_time
+        polling = []
         try:
+            if len(self._masters) > 1:
+                self._master_pool = ThreadPool(len(self._masters))
+            for api in self._masters:
+                # A master which fails to start polling may have started part of it, so it is stopped too
+                polling.append(api)
+                api.start_polling(sleep_time)
+
             dequeue = True
             while self.checking_status == Checking.MUST_CHECK:
-                self.api.quick_poll()
+                self._each_master(lambda api: api.quick_poll())
                 if not self.kill:
                     try:
                         self._can_raise_kill = True
+                        for admission in (self.admission or {}).values():
+                            admission.start_tick()
                         self._check(None)
                         self._can_raise_kill = False
                     except Killed:
                         pass
                 else:
-                    self.api.queue_poll()
+                    self._each_master(lambda api: api.queue_poll())
+                    self._stop_all(dequeue)
                     self._kill_check(None, dequeue)
                     dequeue = False
 
-                hyperspeed.sleep(sleep_time)
+                now = hyperspeed.time()
+                if now - last_poll_status_time >= self.report_interval:
+                    last_poll_status_time = now
+                    for api in self._masters:
+                        poll_status = api.poll_status()
+                        if poll_status:
+                            print("Polling Jenkins" + (" " + api.baseurl if len(self._masters) > 1 else "") + ":", poll_status)
+
+                hyperspeed.sleep(max(api.poll_interval(sleep_time) for api in self._masters))
                 if self.json_file:
                     now = hyperspeed.time()
                     json_now = now - last_json_time >= json_interval
@@ -997,12 +1213,32 @@ class _TopLevelControllerMixin(object):
                         last_json_time = now
                     self.json(self.json_file, self.json_indent)
         finally:
+            for api in polling:
+                api.stop_polling()
             print()
             print("--- Final status ---")
-            self.api.quick_poll()
+            self._each_master(lambda api: api.quick_poll())
             self._final_status()
-            if self.json_file:
-                self.json(self.json_file, self.json_indent)
+            flush_exception = None
+            try:
+                if self.json_file:
+                    self.json(self.json_file, self.json_indent)
+                for api in self._masters:
+                    try:
+                        api.flush()
+                    except Exception as ex:  # pylint: disable=broad-except
+                        # Don't hide the exception which ended the flow, if any
+                        print("ERROR: Failed writing build descriptions:", ex)
+                        flush_exception = flush_exception or ex
+            finally:
+                if self._master_pool is not None:
+                    self._master_pool.close()
+                    self._master_pool = None
+                for api in self._masters:
+                    api.close()
+
+        if flush_exception:
+            raise flush_exception  # pylint: disable=raising-bad-type
 
         if self.result == BuildResult.UNSTABLE:
             set_build_result(self.username, self.password, 'unstable', direct_url=self.top_flow.direct_url)
@@ -1017,10 +1253,11 @@ class parallel(_Parallel, _TopLevelControllerMixin):
     def __init__(self, jenkins_api, timeout, securitytoken=None, username=None, password=None, job_name_prefix='', max_tries=1, propagation=Propagation.NORMAL,
                  report_interval=_default_report_interval, poll_interval=_default_poll_interval, secret_params=_default_secret_params_re, allow_missing_jobs=False,
                  json_dir=None, json_indent=None, json_strip_top_level_prefix=True, direct_url=None, require_idle=True, just_dump=False, params_display_order=(),
-                 kill_all=False, description=None):
+                 kill_all=False, description=None, admission_interval=None):
         assert isinstance(propagation, Propagation)
         securitytoken = self.toplevel_init(jenkins_api, securitytoken, username, password, job_name_prefix, poll_interval, direct_url, require_idle,
-                                           json_dir, json_indent, json_strip_top_level_prefix, params_display_order, just_dump, kill_all, description)
+                                           json_dir, json_indent, json_strip_top_level_prefix, params_display_order, just_dump, kill_all, description,
+                                           admission_interval)
         super(parallel, self).__init__(self, timeout, securitytoken, job_name_prefix, max_tries, propagation, report_interval, secret_params, allow_missing_jobs)
         self.parent_flow = None
 
@@ -1040,6 +1277,7 @@ class serial(_Serial, _TopLevelControllerMixin):
     Args:
         jenkins_api (:py:class:`.jenkins_api.Jenkins` or :py:class:`.script_api.Jenkins`): Jenkins Api instance used for accessing jenkins.
             If jenkins_api is instantiated with username/password you do not need to specify username/password to the flow (see below).
+            Individual jobs may be invoked on other Jenkins masters, see :py:meth:`_SingleJob.master`.
         securitytoken (str): Token to use on security enabled Jenkins instead of username/password. The Jenkins job must have the token configured.
         username (str): Name of user authorized to run Jenkins 'cli' and change job status.
         password (str): Password of user.
@@ -1065,6 +1303,11 @@ class serial(_Serial, _TopLevelControllerMixin):
             started the build.
             Note: It also possible to send SIGTERM to an already running flow to make the flow abort all builds started by the current
             invocation of the flow, but not builds started by other invocations of the same flow.
+        admission_interval (float): If not None, jobs are held by the flow instead of being put in the Jenkins queue, while Jenkins
+            has no free executors. The number of free executors is read from Jenkins at most every admission_interval seconds.
+            Held jobs are invoked in order of their :py:meth:`_SingleJob.priority`.
+            Note: Executors are counted for all of Jenkins, not per label.
+            Jobs are not held on a Jenkins with no executors at all, e.g. with only cloud agents provisioned on demand for queued builds.
 
     Returns:
         serial flow object
@@ -1076,10 +1319,11 @@ class serial(_Serial, _TopLevelControllerMixin):
     def __init__(self, jenkins_api, timeout, securitytoken=None, username=None, password=None, job_name_prefix='', max_tries=1, propagation=Propagation.NORMAL,
                  report_interval=_default_report_interval, poll_interval=_default_poll_interval, secret_params=_default_secret_params_re, allow_missing_jobs=False,
                  json_dir=None, json_indent=None, json_strip_top_level_prefix=True, direct_url=None, require_idle=True, just_dump=False, params_display_order=(),
-                 kill_all=False, description=None):
+                 kill_all=False, description=None, admission_interval=None):
         assert isinstance(propagation, Propagation)
         securitytoken = self.toplevel_init(jenkins_api, securitytoken, username, password, job_name_prefix, poll_interval, direct_url, require_idle,
-                                           json_dir, json_indent, json_strip_top_level_prefix, params_display_order, just_dump, kill_all, description=description)
+                                           json_dir, json_indent, json_strip_top_level_prefix, params_display_order, just_dump, kill_all, description=description,
+                                           admission_interval=admission_interval)
         super(serial, self).__init__(self, timeout, securitytoken, job_name_prefix, max_tries, propagation, report_interval, secret_params, allow_missing_jobs)
         self.parent_flow = None
 
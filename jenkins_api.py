@@ -3,19 +3,64 @@
 
 from __future__ import print_function
 
-import time, json
-from collections import OrderedDict
+import os, time, re, json, math, base64, hashlib, urllib, threading, socket, httplib, warnings
+from collections import OrderedDict, namedtuple
+from Queue import Queue, Empty
+from multiprocessing.pool import ThreadPool
 
-from restkit import Resource, BasicAuth, errors
-
-from .api_base import BuildResult, Progress, UnknownJobException, ApiInvocationMixin
+from .api_base import BuildResult, Progress, UnknownJobException, ApiInvocationMixin, ApiJenkinsMixin, job_path, job_name_from_url
+from .transport import PooledTransport, RestkitTransport, RequestFailed, ResourceNotFound, Unauthorized
+from .json_codec import JsonCodec, default_codec
 
 
 _superseded = -1
 _dequeued = -2
+_not_notified = object()
 
 _ct_url_enc = {'Content-Type': 'application/x-www-form-urlencoded'}
 
+# Script console script triggering a list of builds, given as base64 encoded json, printing the queue item ids as a json list.
+# Parameters not given get their default value, like with buildWithParameters. The id is null if the job can't be built by the script.
+# A failing trigger must not stop the script, the builds already queued would be triggered again when falling back to invoking one by one.
+_bulk_trigger_script = """
+import hudson.model.*
+import jenkins.model.Jenkins
+import groovy.json.JsonSlurper
+import groovy.json.JsonOutput
+
+def triggers = new JsonSlurper().parseText(new String('%s'.decodeBase64(), 'UTF-8'))
+def queueIds = triggers.collect { trigger ->
+    try {
+        def job = Jenkins.instance.getItemByFullName(trigger.job, Job)
+        if (job == null || !job.buildable) {
+            return null
+        }
+        def actions = [new CauseAction(trigger.cause ? new Cause.RemoteCause('jenkinsflow', trigger.cause) : new Cause.UserIdCause())]
+        def property = job.getProperty(ParametersDefinitionProperty)
+        if (property) {
+            actions << new ParametersAction(property.parameterDefinitions.collect { definition ->
+                trigger.params.containsKey(definition.name) ? definition.createValue(trigger.params[definition.name] as String) : definition.defaultParameterValue
+            })
+        }
+        return Jenkins.instance.queue.schedule2(job, 0, actions).item?.id
+    } catch (Exception ex) {
+        return null
+    }
+}
+println(JsonOutput.toJson(queueIds))
+"""
+
+
+def _queue_id(queued_item_path):
+    return int(queued_item_path.strip('/').split('/')[2])
+
+
+def _parameter_definitions(job_dct):
+    for action in job_dct.get('actions') or []:
+        if action.get('parameterDefinitions'):
+            return action['parameterDefinitions']
+    return []
+
 
 def _result_and_progress(build_dct):
     result = build_dct['result']
@@ -24,9 +69,474 @@ def _result_and_progress(build_dct):
     return (result, progress)
 
 
-class Jenkins(Resource):
+class ResponseCache(object):
+    """Cache of decoded json responses from Jenkins, keyed by url.
+
+    Requests are sent with the ETag and Last-Modified values from the previous response for the same url, if Jenkins sent any.
+    If Jenkins answers 'Not Modified', or the body is byte identical to the previous body, the previously decoded json is returned
+    instead of decoding the body again. The returned json is shared between calls and must not be modified.
+    Only the most recently used urls are kept, so that one-shot urls, e.g. queue items, don't accumulate.
+
+    Args:
+        codec (json_codec.JsonCodec): Used for decoding the responses. Default is the standard library json.
+        max_entries (int): Number of urls to keep responses for.
+
+    Attributes:
+        hits (int): Number of responses for which decoding was skipped.
+        misses (int): Number of responses which had to be decoded.
+    """
+
+    def __init__(self, codec=None, max_entries=1000):
+        self.codec = codec or JsonCodec()
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # Least recently used first
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(path, params):
+        return path + '?' + urllib.urlencode(sorted(params.items()))
+
+    def request_headers(self, key):
+        entry = self._entries.get(key)
+        if not entry:
+            return None
+
+        etag, last_modified, _digest, _dct = entry
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+        return headers or None
+
+    def decode(self, key, response):
+        """Return the decoded json of the response, or None if it is a '304 Not Modified' for which the entry is no longer cached"""
+        body = response.body_string()
+        entry = self._entries.get(key)
+        if response.status_int == 304:
+            if not entry:
+                return None
+            with self._lock:
+                self.hits += 1
+                self._store(key, entry)
+            return entry[3]
+
+        digest = hashlib.sha1(body).digest()
+        if entry and entry[2] == digest:
+            with self._lock:
+                self.hits += 1
+                self._store(key, entry)
+            return entry[3]
+
+        dct = self.codec.decode(body)
+        with self._lock:
+            self.misses += 1
+            self._store(key, (response.headers.get('ETag'), response.headers.get('Last-Modified'), digest, dct))
+        return dct
+
+    def _store(self, key, entry):
+        """Store entry as the most recently used, evicting the least recently used. Must be called with the lock held."""
+        self._entries.pop(key, None)
+        self._entries[key] = entry
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+_json_decoder = json.JSONDecoder()
+_json_whitespace = re.compile(r'[ \t\n\r]*')
+
+
+class _JsonChunkReader(object):
+    """Decode json values one at a time from a document received in chunks, keeping only the not yet decoded part in memory"""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buf = ''
+        self._pos = 0
+
+    def _read_more(self):
+        for chunk in self._chunks:
+            if chunk:
+                self._buf = self._buf[self._pos:] + chunk
+                self._pos = 0
+                return True
+        return False
+
+    def peek(self):
+        """Skip whitespace and return the next character"""
+        while True:
+            self._pos = _json_whitespace.match(self._buf, self._pos).end()
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._read_more():
+                raise ValueError("Unexpected end of json document")
+
+    def end(self):
+        """Read the rest of the document, which must be whitespace"""
+        while True:
+            self._pos = _json_whitespace.match(self._buf, self._pos).end()
+            if self._pos < len(self._buf):
+                raise ValueError("Extra data after json document: " + repr(self._buf[self._pos:self._pos + 20]))
+            if not self._read_more():
+                return
+
+    def expect(self, chars):
+        char = self.peek()
+        if char not in chars:
+            raise ValueError("Expected one of " + repr(chars) + " in json document, got " + repr(char))
+        self._pos += 1
+        return char
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = _json_decoder.raw_decode(self._buf, self._pos)
+            except ValueError:
+                # Assume the value is incomplete
+                if self._read_more():
+                    continue
+                raise
+
+            if end == len(self._buf) and not isinstance(value, (dict, list, basestring)) and self._read_more():
+                # A number or literal may continue in the next chunk
+                continue
+            self._pos = end
+            return value
+
+
+def _iter_json_array_member(chunks, array_key, other_members):
+    """Yield the elements of the array member 'array_key' of the top level json object, one at a time while the document is received
+
+    The other members of the object are decoded and put in the 'other_members' dict.
+    """
+    reader = _JsonChunkReader(chunks)
+    reader.expect('{')
+    if reader.peek() == '}':
+        reader.expect('}')
+        reader.end()
+        return
+
+    while True:
+        key = reader.value()
+        reader.expect(':')
+        if key == array_key and reader.peek() == '[':
+            reader.expect('[')
+            if reader.peek() != ']':
+                while True:
+                    yield reader.value()
+                    if reader.expect(',]') == ']':
+                        break
+            else:
+                reader.expect(']')
+        else:
+            other_members[key] = reader.value()
+
+        if reader.expect(',}') == '}':
+            reader.end()
+            return
+
+
+class JobMetadataCache(object):
+    """On disk cache of the properties of a Jenkins and its jobs which rarely change
+
+    The file may be shared by several Jenkins instances and flows. It is updated when a job is found to be new, changed or deleted,
+    and may be deleted at any time to force a full poll.
+
+    Args:
+        file_path (str): The json file to store the cache in.
+        uri (str): The direct uri of the Jenkins, used as key in the file.
+    """
+
+    def __init__(self, file_path, uri):
+        self.file_path = file_path
+        self.uri = uri
+
+    def _load_all(self):
+        try:
+            with open(self.file_path) as cache_file:
+                return json.load(cache_file)
+        except (IOError, ValueError):
+            # Missing or broken, start over
+            return {}
+
+    def load(self):
+        """Return dict with 'public_uri', 'ci_version', 'is_jenkins' and 'jobs' (job name -> parameter definitions) or None if not cached"""
+        return self._load_all().get(self.uri)
+
+    def save(self, cached):
+        from atomicfile import AtomicFile
+
+        all_cached = self._load_all()
+        all_cached[self.uri] = cached
+        cache_dir = os.path.dirname(os.path.abspath(self.file_path))
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        with AtomicFile(self.file_path, 'w+') as cache_file:
+            json.dump(all_cached, cache_file)
+
+
+class PollRateController(object):
+    """Adjusts the poll interval to the load on Jenkins, so that flows back off when Jenkins is overloaded
+
+    The response time and failures of the GET requests sent by :py:class:`Jenkins` are recorded. After each poll, the interval is multiplied
+    by 'backoff_factor' if the mean response time was above 'latency_threshold' or a request failed, otherwise it is decreased by
+    'recover_step' (AIMD, as used for TCP congestion control). The interval is kept between the poll interval of the flow and 'max_interval'.
+
+    Args:
+        max_interval (float): Max seconds between polls.
+        latency_threshold (float): Mean response time in seconds above which Jenkins is considered overloaded.
+        backoff_factor (float): Multiply the interval by this when Jenkins is overloaded.
+        recover_step (float): Seconds to subtract from the interval when Jenkins is not overloaded. Default is a tenth of 'max_interval'.
+        smoothing (float): Weight of the latest poll in the reported response time, between 0 and 1.
+
+    Attributes:
+        interval (float): The current seconds between polls.
+        latency (float): Smoothed mean response time in seconds, None until a request has been sent.
+        error_rate (float): Fraction of failed requests in the latest poll.
+    """
+
+    def __init__(self, max_interval=30, latency_threshold=1.0, backoff_factor=2, recover_step=None, smoothing=0.3):
+        self.max_interval = max_interval
+        self.latency_threshold = latency_threshold
+        self.backoff_factor = backoff_factor
+        self.recover_step = recover_step if recover_step is not None else max_interval / 10.0
+        self.smoothing = smoothing
+        self.interval = 0
+        self.latency = None
+        self.error_rate = 0.0
+        self._lock = threading.Lock()
+        self._count = 0
+        self._errors = 0
+        self._total_latency = 0.0
+        self._reported_count = 0
+        self._total_count = 0
+        self._last_status_time = time.time()
+
+    def record(self, latency, failed=False):
+        """Record a request. Thread safe."""
+        with self._lock:
+            self._count += 1
+            self._total_count += 1
+            self._total_latency += latency
+            if failed:
+                self._errors += 1
+
+    def update(self, min_interval):
+        """Adjust the interval from the requests recorded since the last update, return the new interval
+
+        Args:
+            min_interval (float): The poll interval of the flow.
+        """
+        with self._lock:
+            count, errors, total_latency = self._count, self._errors, self._total_latency
+            self._count = self._errors = 0
+            self._total_latency = 0.0
+
+        interval = max(self.interval, min_interval)
+        if count:
+            mean_latency = total_latency / count
+            self.latency = mean_latency if self.latency is None else self.latency + self.smoothing * (mean_latency - self.latency)
+            self.error_rate = float(errors) / count
+            if errors or mean_latency > self.latency_threshold:
+                interval = max(interval * self.backoff_factor, self.recover_step)
+            else:
+                interval -= self.recover_step
+        self.interval = min(max(interval, min_interval), self.max_interval)
+        return self.interval
+
+    def status(self):
+        """Return the current poll rate and response time as a string, for the periodic status output"""
+        now = time.time()
+        with self._lock:
+            requests = self._total_count - self._reported_count
+            self._reported_count = self._total_count
+        elapsed = now - self._last_status_time
+        self._last_status_time = now
+        rate = requests / elapsed if elapsed > 0 else 0.0
+        latency = "%.0fms" % (self.latency * 1000) if self.latency is not None else "-"
+        return "poll interval %.2fs, %.1f requests/s, response time %s, errors %.0f%%" % (self.interval, rate, latency, self.error_rate * 100)
+
+
+class RequestBudget(object):
+    """Limits the rate of requests sent to Jenkins, using a token bucket
+
+    Each request takes a token, and tokens are added at 'rate' per second, up to 'burst'. When no token is available the request waits.
+    Waiting requests with priority URGENT get tokens before waiting requests with priority NORMAL, so that invoking and stopping builds is
+    not delayed by polling. The budget may be shared by several :py:class:`Jenkins` instances, to limit the requests of a whole flow.
+
+    Args:
+        rate (float): Max requests per second, on average.
+        burst (int): Max requests sent without waiting, after a period with fewer requests. Default is 'rate', rounded up.
+
+    Attributes:
+        requests (int): Number of requests sent.
+        waited (float): Total seconds requests have waited for a token.
+    """
+
+    URGENT = 0
+    NORMAL = 1
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = burst if burst is not None else max(1, int(math.ceil(rate)))
+        self.requests = 0
+        self.waited = 0.0
+        self._tokens = float(self.burst)
+        self._refill_time = time.time()
+        self._waiting = [0, 0]
+        self._cond = threading.Condition()
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._refill_time) * self.rate)
+        self._refill_time = now
+
+    def acquire(self, priority=NORMAL):
+        """Wait until a request with 'priority' may be sent. Thread safe."""
+        start = time.time()
+        with self._cond:
+            self._waiting[priority] += 1
+            try:
+                while True:
+                    now = time.time()
+                    self._refill(now)
+                    urgent_waiting = priority == self.NORMAL and self._waiting[self.URGENT]
+                    if self._tokens >= 1 and not urgent_waiting:
+                        self._tokens -= 1
+                        self.requests += 1
+                        self.waited += now - start
+                        # Let the other waiting requests check the tokens and priorities again
+                        self._cond.notify_all()
+                        return
+                    self._cond.wait(max((1 - self._tokens) / self.rate, 0.001))
+            finally:
+                self._waiting[priority] -= 1
+
+
+class _DescriptionWriter(object):
+    """Writes build descriptions from a background thread, so that setting a description never delays polling
+
+    The descriptions queued while a batch is written are written together in the next batch, concurrently if the Jenkins
+    allows concurrent requests. Failed writes are retried. The first write that finally failed is raised by :py:meth:`flush`.
+    """
+
+    def __init__(self, jenkins, tries=3, retry_delay=1):
+        self.jenkins = jenkins
+        self.tries = tries
+        self.retry_delay = retry_delay
+        self.exception = None
+        self._queue = Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def put(self, build_url, description):
+        self._queue.put((build_url, description))
+        with self._lock:
+            if not self._thread:
+                self._thread = threading.Thread(target=self._run, name="jenkinsflow description writer: " + self.jenkins.direct_uri)
+                self._thread.daemon = True
+                self._thread.start()
+
+    def _write(self, item):
+        build_url, description = item
+        for tried in range(1, self.tries + 1):
+            try:
+                self.jenkins.post(build_url + '/submitDescription', headers=_ct_url_enc, payload={'description': description},
+                                  priority=RequestBudget.NORMAL)
+                return None
+            except ResourceNotFound as ex:
+                return Exception("Build deleted while flow running? " + repr(build_url), ex)
+            except (RequestFailed, httplib.HTTPException, socket.error) as ex:
+                if tried == self.tries:
+                    return ex
+                time.sleep(self.retry_delay)
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except Empty:
+                    break
+
+            try:
+                for ex in self.jenkins._map(self._write, batch):  # pylint: disable=protected-access
+                    if ex and not self.exception:
+                        self.exception = ex
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def flush(self, timeout):
+        """Wait until all queued descriptions have been written, at most 'timeout' seconds"""
+        deadline = time.time() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise Exception("Timeout after %ss waiting for %d build descriptions to be written" % (timeout, self._queue.unfinished_tasks))
+                self._queue.all_tasks_done.wait(remaining)
+        if self.exception:
+            ex = self.exception
+            self.exception = None
+            raise ex  # pylint: disable=raising-bad-type
+
+
+# The result of one background poll cycle. Never modified after creation.
+_PollSnapshot = namedtuple('_PollSnapshot', 'version, job_dcts, queued_whys, build_numbers, builds')
+
+
+class _BackgroundPoller(object):
+    """Polls Jenkins from a separate thread, publishing a new _PollSnapshot after each cycle"""
+
+    def __init__(self, jenkins, interval):
+        self.jenkins = jenkins
+        self.interval = interval
+        self.snapshot = None
+        self.exception = None
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="jenkinsflow poller: " + jenkins.direct_uri)
+        self._thread.daemon = True
+
+    def _poll(self, version):
+        queued_item_paths, builds_job_names = self.jenkins._poll_requests  # pylint: disable=protected-access
+        self.snapshot = self.jenkins._fetch_snapshot(version, queued_item_paths, builds_job_names)  # pylint: disable=protected-access
+
+    def _run(self):
+        version = 1
+        while not self._stop_event.wait(self.jenkins.poll_interval(self.interval)):
+            version += 1
+            try:
+                self._poll(version)
+            except Exception as ex:  # pylint: disable=broad-except
+                # Raised in the flow thread by 'latest'
+                self.exception = ex
+                return
+
+    def start(self):
+        # The first poll is done synchronously, so that there is always a snapshot
+        self._poll(1)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self._thread.join()
+
+    def latest(self):
+        if self.exception:
+            raise self.exception  # pylint: disable=raising-bad-type
+        return self.snapshot
+
+
+class Jenkins(ApiJenkinsMixin):
     """Optimized minimal set of methods needed for jenkinsflow to access Jenkins jobs.
 
+    Jobs in folders are named by their full name, 'folder/sub/job'. Only the top level jobs are listed by :py:meth:`poll`, jobs in folders
+    are looked up by :py:meth:`get_job`, and while a flow is running only the folders containing jobs of the flow are polled.
+
     Args:
         direct_uri (str): Should be a non-proxied uri if possible (e.g. http://localhost:<port> if flow job is running on master)
             The public URI will be retrieved from Jenkins and used in output.
@@ -35,25 +545,175 @@ class Jenkins(Resource):
             which only has access to the jobs in the flow that it is executing. That way the job list will be filtered serverside.
         username (str): Name of user authorized to execute all jobs in flow.
         password (str): Password of user.
+        flow_scoped_poll (bool): If True, polling while a flow is running only queries the jobs looked up through :py:meth:`get_job`, using one
+            small request per job, instead of listing all jobs on Jenkins. Use this if Jenkins has many more jobs than the flows you run.
+        background_poll (bool): If True, a flow using this api will poll Jenkins from a separate thread, so that a slow Jenkins response
+            does not delay the flow. The flow then works on the latest completed poll, which may be up to a poll interval older.
+        concurrent_requests (int): Max number of requests sent to Jenkins at the same time when polling. The requests needed for the jobs,
+            queue items and builds in one poll do not depend on each other, so with more than one, a poll takes roughly as long as the slowest
+            request instead of the sum of all of them.
+        transport (transport.Transport): Used for sending requests to Jenkins. Default is a :py:class:`transport.PooledTransport`,
+            which keeps connections open between requests.
+        pool_size (int): Max number of idle connections kept open by the default transport.
+        timeout (float): Seconds to wait for a response from Jenkins when using the default transport. Default is to wait forever.
+        job_cache_file (str): If set, the public uri of Jenkins, the Jenkins/Hudson detection and the parameter definitions of jobs are
+            cached in this file, see :py:class:`JobMetadataCache`. When cached, :py:meth:`poll` does not list all jobs on Jenkins,
+            instead each job is looked up when the flow needs it. If a job can't be invoked as cached, it is looked up again.
+            Implies flow_scoped_poll.
+        notifications (notifications.NotificationReceiver): If set, build notifications received from Jenkins update the state of the
+            invocations directly, and Jenkins is polled much less often while notifications arrive.
+        adaptive_poll_max_interval (float): If set, a job with a running build is polled less often while the build is far from
+            its estimated end, at most this many seconds apart, and again on every poll when the build is close to the estimated end.
+            Jobs which are idle, queued or have no estimated duration are polled on every poll.
+        poll_rate (PollRateController): If set, the poll interval is stretched while Jenkins responds slowly or fails, and the poll rate
+            and response time are shown in the status output of the flow.
+        request_budget (RequestBudget): If set, all requests to Jenkins wait for the budget, so that the flow never sends more requests
+            per second than the budget allows. Invoking, stopping and dequeueing builds has priority over other requests.
+        deferred_descriptions (bool): If True, build descriptions are written by a background thread instead of in the middle of a poll.
+            Call :py:meth:`flush` to wait until they are written, the flow does that before it finishes.
+        bulk_trigger (bool): If True, :py:meth:`invoke_jobs` triggers all the builds with a single script console request, which requires
+            the user to have permission to run scripts. If the script console is not allowed or not found, the jobs are invoked one by one.
+            Jobs are never invoked again after the script may have run, a script failure is returned as the result for each job.
+        json_codec (json_codec.JsonCodec): Used for decoding the responses from Jenkins. Default is the fastest json library installed,
+            see :py:func:`json_codec.default_codec`. The job list of :py:meth:`poll` is always decoded with the standard library, while it is received.
+        **kwargs: Deprecated, options for restkit.Resource as accepted by earlier versions. If given, a :py:class:`transport.RestkitTransport`
+            is used instead of the default transport. Pass a transport instead.
     """
 
-    def __init__(self, direct_uri, job_prefix_filter=None, username=None, password=None, **kwargs):
+    def __init__(self, direct_uri, job_prefix_filter=None, username=None, password=None, flow_scoped_poll=False, background_poll=False,
+                 concurrent_requests=1, transport=None, pool_size=10, timeout=None, job_cache_file=None, notifications=None,
+                 adaptive_poll_max_interval=None, poll_rate=None, request_budget=None, bulk_trigger=False, deferred_descriptions=False,
+                 json_codec=None, **kwargs):
         if username or password:
             if not (username and password):
                 raise Exception("You must specify both username and password or neither")
-            filters = kwargs.get('filters', [])
-            filters.append(BasicAuth(username, password))
-            kwargs['filters'] = filters
-        super(Jenkins, self).__init__(direct_uri, **kwargs)
+        if kwargs and not transport:
+            warnings.warn("Passing restkit options to Jenkins is deprecated, pass transport=RestkitTransport(...)", DeprecationWarning, stacklevel=2)
+            if timeout is not None:
+                kwargs.setdefault('timeout', timeout)
+            transport = RestkitTransport(direct_uri, username, password, **kwargs)
+        elif kwargs:
+            raise TypeError("Unexpected arguments, restkit options can't be used with a transport: " + repr(sorted(kwargs)))
+        self.transport = transport or PooledTransport(direct_uri, username, password, pool_size=pool_size, timeout=timeout)
         self.direct_uri = direct_uri
         self.username = username
         self.password = password
         self.job_prefix_filter = job_prefix_filter
+        self.flow_scoped_poll = flow_scoped_poll or bool(job_cache_file)
+        self._job_cache = JobMetadataCache(job_cache_file, direct_uri) if job_cache_file else None
+        self._cached = None
+        self._flow_job_names = OrderedDict()
         self._public_uri = self._baseurl = None
         self.jobs = None
         self.queue_items = {}
+        self._queued_invocations = OrderedDict()
+        self._poll_count = 0
+        self.background_poll = background_poll
+        self._poller = None
+        self._snapshot = None
+        # job name -> oldest build number needed by an invocation
+        self._builds_wanted = {}
+        # Number of builds in the first range fetched by _fetch_builds, each following range is twice as big
+        self.builds_window = 16
+        self._poll_requests = ((), frozenset())
+        self.notifications = notifications
+        self._last_poll_time = None
+        self.adaptive_poll_max_interval = adaptive_poll_max_interval
+        # job name -> time of next poll of job, when polling adaptively
+        self._job_poll_times = {}
+        self._last_build_query = "lastBuild[number,result,estimatedDuration,timestamp]" if adaptive_poll_max_interval else "lastBuild[number,result]"
+        self.poll_rate = poll_rate
+        self.request_budget = request_budget
+        self.bulk_trigger = bulk_trigger
+        self._description_writer = _DescriptionWriter(self) if deferred_descriptions else None
+        self._min_poll_interval = 0
+        self.concurrent_requests = concurrent_requests
+        # Created on first use, by whichever of the flow, background poller or description writer thread gets there first
+        self._pool = None
+        self._pool_lock = threading.Lock()
         self.is_jenkins = True
         self.ci_version = None
+        self.json_codec = json_codec or default_codec()
+        self.response_cache = ResponseCache(self.json_codec)
+        # CSRF protection header sent with all POSTs, None until fetched, empty if Jenkins does not use crumbs
+        self._crumb = None
+        self._crumb_lock = threading.Lock()
+
+    def get(self, path, headers=None, timeout=None, stream=False, priority=RequestBudget.NORMAL, **params):
+        if self.request_budget:
+            self.request_budget.acquire(priority)
+        if not self.poll_rate:
+            return self.transport.request('GET', path, headers=headers, params=params, timeout=timeout, stream=stream)
+
+        start = time.time()
+        try:
+            response = self.transport.request('GET', path, headers=headers, params=params, timeout=timeout, stream=stream)
+        except RequestFailed as ex:
+            # Missing jobs and queue items are expected, only server errors indicate overload
+            self.poll_rate.record(time.time() - start, failed=ex.status_int >= 500)
+            raise
+        except Exception:
+            self.poll_rate.record(time.time() - start, failed=True)
+            raise
+        self.poll_rate.record(time.time() - start)
+        return response
+
+    def _crumb_header(self, priority, stale=None):
+        """Return the CSRF protection header for POSTs, fetched from Jenkins the first time and again when 'stale' is rejected
+
+        The crumb is fetched with the priority of the POST, an urgent POST must not wait behind polling while holding the lock.
+        """
+        with self._crumb_lock:
+            if self._crumb is None or self._crumb == stale:
+                try:
+                    dct = self.json_codec.decode(self.get('/crumbIssuer/api/json', priority=priority).body_string())
+                    self._crumb = {str(dct['crumbRequestField']): str(dct['crumb'])}
+                except ResourceNotFound:
+                    # CSRF protection is not enabled
+                    self._crumb = {}
+            return self._crumb
+
+    def post(self, path, headers=None, payload=None, timeout=None, priority=RequestBudget.URGENT, **params):
+        if self.request_budget:
+            self.request_budget.acquire(priority)
+        crumb = self._crumb_header(priority)
+        try:
+            return self.transport.request('POST', path, headers=dict(headers or {}, **crumb), payload=payload, params=params, timeout=timeout)
+        except Unauthorized:
+            # The crumb is no longer valid after a restart of Jenkins, try once more with a new one
+            new_crumb = self._crumb_header(priority, stale=crumb)
+            if new_crumb == crumb:
+                raise
+            if self.request_budget:
+                self.request_budget.acquire(priority)
+            return self.transport.request('POST', path, headers=dict(headers or {}, **new_crumb), payload=payload, params=params, timeout=timeout)
+
+    def head(self, path='/', headers=None, timeout=None, **params):
+        if self.request_budget:
+            self.request_budget.acquire(RequestBudget.NORMAL)
+        return self.transport.request('HEAD', path, headers=headers, params=params, timeout=timeout)
+
+    def _get_json_response(self, path, **params):
+        key = self.response_cache.key(path, params)
+        response = self.get(path, headers=self.response_cache.request_headers(key), **params)
+        dct = self.response_cache.decode(key, response)
+        if dct is None and response.status_int == 304:
+            # The entry was evicted or cleared after the request was sent, get the response again without the conditional headers
+            response = self.get(path, **params)
+            dct = self.response_cache.decode(key, response)
+        return response, dct
+
+    def _get_json(self, path, **params):
+        return self._get_json_response(path, **params)[1]
+
+    def _map(self, func, args):
+        """Return [func(arg) for arg in args], with up to concurrent_requests calls running at the same time"""
+        if self.concurrent_requests <= 1 or len(args) <= 1:
+            return [func(arg) for arg in args]
+        with self._pool_lock:
+            if not self._pool:
+                self._pool = ThreadPool(self.concurrent_requests)
+        return self._pool.map(func, args)
 
     @property
     def baseurl(self):
@@ -63,17 +723,27 @@ class Jenkins(Resource):
     def public_uri(self):
         if not self._public_uri:
             query = "primaryView[url]"
-            response = self.get("/api/json", tree=query)
-            dct = json.loads(response.body_string())
+            dct = self._get_json("/api/json", tree=query)
             self._public_uri = self._baseurl = dct['primaryView']['url'].rstrip('/')
         return self._public_uri
 
     def _public_job_url(self, job_name):
-        return self.public_uri + '/job/' + job_name
+        return self.public_uri + job_path(job_name)
 
     def poll(self):
-        query = "jobs[name,lastBuild[number,result],queueItem[why],actions[parameterDefinitions[name,type]]],primaryView[url]"
-        response = self.get("/api/json", tree=query)
+        if self._job_cache:
+            self._cached = self._job_cache.load()
+            if self._cached:
+                # Jobs are looked up by get_job
+                self.ci_version = self._cached['ci_version']
+                self.is_jenkins = self._cached['is_jenkins']
+                self._public_uri = self._baseurl = self._cached['public_uri']
+                self.jobs = {}
+                return
+
+        query = "jobs[name," + self._last_build_query + ",queueItem[why],actions[parameterDefinitions[name,type]]],primaryView[url]"
+        # The job list may be huge, so it is parsed while it is received, one job at a time, and not cached
+        response = self.get("/api/json", stream=True, tree=query)
 
         # Determine whether we are talking to Jenkins or Hudson
         self.ci_version = response.headers.get("X-Jenkins")
@@ -91,49 +761,554 @@ class Jenkins(Resource):
                 raise Exception("Not connected to Jenkins or Hudson (expected X-Jenkins or X-Hudson header, got: " + repr(head_response.headers))
             self.is_jenkins = False
 
-        dct = json.loads(response.body_string())
-        self._public_uri = self._baseurl = dct['primaryView']['url'].rstrip('/')
-
         self.jobs = {}
-        for job_dct in dct.get('jobs') or []:
+        cached_jobs = {}
+        other_members = {}
+        for job_dct in _iter_json_array_member(response.iter_body(), 'jobs', other_members):
             job_name = str(job_dct['name'])
             if self.job_prefix_filter and not job_name.startswith(self.job_prefix_filter):
                 continue
             self.jobs[job_name] = ApiJob(self, job_dct, job_name)
+            if self._job_cache:
+                cached_jobs[job_name] = _parameter_definitions(job_dct)
+
+        self._public_uri = self._baseurl = other_members['primaryView']['url'].rstrip('/')
+
+        if self._job_cache:
+            self._cached = dict(public_uri=self._public_uri, ci_version=self.ci_version, is_jenkins=self.is_jenkins, jobs=cached_jobs)
+            self._job_cache.save(self._cached)
+
+    def _get_cached_job(self, job_name):
+        """Create the ApiJob for a job from the job cache, getting the current state of the job. Jobs not cached are looked up."""
+        self._apply_cached_job(job_name, self._fetch_cached_job(job_name))
+
+    def _fetch_cached_job(self, job_name):
+        """Return the current state of a job in the job cache, including the parameter definitions if not cached, or None if deleted"""
+        query = self._last_build_query + ",queueItem[why]"
+        if self._cached['jobs'].get(job_name) is None:
+            query += ",actions[parameterDefinitions[name,type]]"
+        try:
+            return self._get_json(job_path(job_name) + "/api/json", tree=query)
+        except ResourceNotFound:
+            return None
+
+    def _apply_cached_job(self, job_name, dct):
+        parameter_definitions = self._cached['jobs'].get(job_name)
+        if dct is None:
+            if parameter_definitions is not None:
+                # Deleted
+                del self._cached['jobs'][job_name]
+                self._job_cache.save(self._cached)
+            return
+
+        if parameter_definitions is None:
+            self._cached['jobs'][job_name] = _parameter_definitions(dct)
+            self._job_cache.save(self._cached)
+        else:
+            # The dict is shared with the response cache
+            dct = dict(dct, actions=[{'parameterDefinitions': parameter_definitions}])
+        self.jobs[job_name] = ApiJob(self, dct, job_name)
+
+    def prefetch_jobs(self, job_names):
+        """Look up the jobs in the job cache which the flow will use, all at the same time, instead of one by one from :py:meth:`get_job`
+
+        Called by the flow after :py:meth:`poll`. Does nothing without a job cache, then :py:meth:`poll` has already listed all jobs.
+        """
+        if self._cached is None:
+            return
+        job_names = [name for name in OrderedDict.fromkeys(job_names)
+                     if name not in self.jobs and (not self.job_prefix_filter or name.startswith(self.job_prefix_filter))]
+        for job_name, dct in zip(job_names, self._map(self._fetch_cached_job, job_names)):
+            self._apply_cached_job(job_name, dct)
+
+    def _revalidate_cached_job(self, job):
+        """Look up the parameter definitions of a job again, after it could not be invoked as cached
+
+        Return (bool): True if the job was cached and still exists.
+        """
+        if not self._cached or job.name not in self._cached['jobs']:
+            return False
+
+        try:
+            dct = self._get_json(job_path(job.name) + "/api/json", tree="actions[parameterDefinitions[name,type]]")
+        except ResourceNotFound:
+            del self._cached['jobs'][job.name]
+            self._job_cache.save(self._cached)
+            return False
+
+        parameter_definitions = _parameter_definitions(dct)
+        self._cached['jobs'][job.name] = parameter_definitions
+        self._job_cache.save(self._cached)
+        job._set_build_trigger_path(parameter_definitions)  # pylint: disable=protected-access
+        return True
 
     def quick_poll(self):
-        query = "jobs[name,lastBuild[number,result],queueItem[why]]"
-        response = self.get("/api/json", tree=query)
-        dct = json.loads(response.body_string())
+        self._poll_count += 1
+        if self.notifications:
+            self._apply_notifications(self.notifications.events())
+            # Queued invocations can only be resolved from notifications if they contain the queue id
+            queue_resolved = self.notifications.queue_ids_seen or not self._pending_queued_item_paths()
+            if queue_resolved and not self.notifications.poll_due(self._last_poll_time):
+                return
+            self._last_poll_time = time.time()
 
-        for job_dct in dct.get('jobs') or []:
-            job_name = str(job_dct['name'])
-            if self.job_prefix_filter and not job_name.startswith(self.job_prefix_filter):
+        if self._poller:
+            self._apply_snapshot(self._poller.latest())
+            return
+
+        # Resolve queue items before getting the job state, so that the lastBuild of a job is never older than a resolved build
+        self._apply_queue_state(*self._fetch_queue_state(self._pending_queued_item_paths()))
+        self._apply_job_dcts(self._fetch_job_dcts())
+        if self.concurrent_requests > 1:
+            self._prefetch_builds()
+        if self.poll_rate:
+            self.poll_rate.update(self._min_poll_interval)
+
+    # The _fetch_* methods only read from Jenkins, they don't modify any state, so they can also be called from the background poller.
+    # The _apply_* methods are called from the flow thread.
+
+    def _fetch_job_dcts(self):
+        """Return OrderedDict job_name -> dct for the polled jobs. Jobs not in self.jobs will also have their parameter definitions."""
+        if self.flow_scoped_poll:
+            return self._fetch_scoped_job_dcts()
+        return self._fetch_listed_job_dcts()
+
+    def _job_due(self, job_name, now):
+        return self._job_poll_times.get(job_name, 0) <= now
+
+    def _due_flow_job_names(self):
+        now = time.time()
+        return [job_name for job_name in list(self._flow_job_names)
+                if (not self.job_prefix_filter or job_name.startswith(self.job_prefix_filter)) and self._job_due(job_name, now)]
+
+    @staticmethod
+    def _folders(job_names):
+        """Return the folders of the jobs in job_names, '' for the top level, in order of first use"""
+        return list(OrderedDict((job_name.rpartition('/')[0], True) for job_name in job_names))
+
+    def _fetch_folder_job_dcts(self, folder, query):
+        """Return [(job_name, dct)] for the jobs directly in 'folder', '' for the top level, using a tree query only for that folder"""
+        try:
+            dct = self._get_json((job_path(folder) if folder else '') + "/api/json", tree=query)
+        except ResourceNotFound:
+            # The folder was deleted or is not created yet
+            return []
+        prefix = folder + '/' if folder else ''
+        return [(prefix + str(job_dct['name']), job_dct) for job_dct in dct.get('jobs') or []]
+
+    def _fetch_listed_job_dcts(self):
+        due_job_names = self._due_flow_job_names()
+        if self._flow_job_names and not due_job_names:
+            # Polling adaptively and no job needs to be polled yet
+            return OrderedDict()
+
+        # The top level and the folders with jobs in the flow are listed at the same time, jobs in other folders are never polled
+        folders = [''] + [folder for folder in self._folders(due_job_names) if folder]
+        query = "jobs[name," + self._last_build_query + ",queueItem[why]]"
+        listings = self._map(lambda folder: self._fetch_folder_job_dcts(folder, query), folders)
+
+        job_dcts = OrderedDict()
+        new_job_names = []
+        for folder, listing in zip(folders, listings):
+            for job_name, job_dct in listing:
+                if self.job_prefix_filter and not job_name.startswith(self.job_prefix_filter):
+                    continue
+                if job_name in self.jobs:
+                    job_dcts[job_name] = job_dct
+                    continue
+                if folder and job_name not in self._flow_job_names:
+                    continue
+
+                # A new job was created while flow was running, get the remaining properties
+                new_job_names.append(job_name)
+
+        for job_name, job_dct in zip(new_job_names, self._map(self._fetch_job_dct, new_job_names)):
+            # None if the job came and went
+            if job_dct is not None:
+                job_dcts[job_name] = job_dct
+        return job_dcts
+
+    def _fetch_scoped_job_dcts(self):
+        job_names = self._due_flow_job_names()
+
+        job_dcts = OrderedDict()
+        for job_name, job_dct in zip(job_names, self._map(self._fetch_job_dct, job_names)):
+            # None if still missing, or the job came and went
+            if job_dct is not None:
+                job_dcts[job_name] = job_dct
+        return job_dcts
+
+    def _fetch_job_dct(self, job_name):
+        query = self._last_build_query + ",queueItem[why]"
+        if job_name not in self.jobs:
+            # Missing at flow start or created while flow was running, so get the remaining properties
+            query += ",actions[parameterDefinitions[name,type]]"
+
+        try:
+            return self._get_json(job_path(job_name) + "/api/json", tree=query)
+        except ResourceNotFound:
+            return None
+
+    def _apply_notifications(self, events):
+        for event in events:
+            job = self.jobs.get(event['name'])
+            if not job:
                 continue
+
+            number = event['number']
+            if event['queue_id'] is not None and event['phase'] != 'QUEUED':
+                invocation = self._queued_invocations.pop('/queue/item/' + repr(event['queue_id']) + '/api/json', None)
+                if invocation and invocation.build_number is None:
+                    invocation.build_number = number
+                    invocation.queued_why = None
+                    invocation.set_description()
+
+            if event['phase'] in ('COMPLETED', 'FINALIZED') and event['status'] in BuildResult.__members__:
+                job._notified_results[number] = event['status']  # pylint: disable=protected-access
+            elif event['phase'] == 'STARTED':
+                job._notified_results.setdefault(number, None)  # pylint: disable=protected-access
+
+    def _next_job_poll_time(self, job_name, job_dct, now):
+        """Poll a running build with an estimated duration less often while it is far from the estimated end"""
+        last_build = job_dct.get('lastBuild')
+        if job_dct.get('queueItem') or not last_build or last_build['result'] is not None:
+            return now
+
+        if job_name in self._builds_wanted:
+            # An invocation is waiting for an earlier build than the last build
+            return now
+
+        estimated_duration = last_build.get('estimatedDuration')
+        start_time = last_build.get('timestamp')
+        if not estimated_duration or estimated_duration < 0 or not start_time:
+            return now
+
+        remaining = (start_time + estimated_duration) / 1000.0 - now
+        return now + min(max(remaining / 2, 0), self.adaptive_poll_max_interval)
+
+    def _apply_job_dcts(self, job_dcts):
+        if self.adaptive_poll_max_interval:
+            now = time.time()
+            for job_name, job_dct in job_dcts.items():
+                self._job_poll_times[job_name] = self._next_job_poll_time(job_name, job_dct, now)
+
+        for job_name, job_dct in job_dcts.items():
             job = self.jobs.get(job_name)
             if job:
                 job.dct = job_dct
                 continue
+            self.jobs[job_name] = ApiJob(self, job_dct, job_name)
+
+    def _pending_queued_item_paths(self):
+        for queued_item_path, invocation in self._queued_invocations.items():
+            if invocation.build_number is not None:
+                # Superseded or dequeued
+                del self._queued_invocations[queued_item_path]
+        return tuple(self._queued_invocations)
+
+    def _fetch_queue_state(self, queued_item_paths):
+        """Get the state of queued invocations, of all jobs, using a single request for the queue
+
+        Only items that have left the queue are queried individually.
+
+        Return (queued_whys, build_numbers) (dict, dict): Both keyed by queued_item_path.
+        """
+
+        queued_whys = {}
+        build_numbers = {}
+        if not queued_item_paths:
+            return queued_whys, build_numbers
+
+        dct = self._get_json("/queue/api/json", tree="items[id,why]")
+        whys_by_id = dict((qi_dct['id'], qi_dct['why']) for qi_dct in dct.get('items') or [])
+
+        left_queue_paths = []
+        for queued_item_path in queued_item_paths:
+            qid = _queue_id(queued_item_path)
+            if qid in whys_by_id:
+                queued_whys[queued_item_path] = whys_by_id[qid]
+                continue
+            left_queue_paths.append(queued_item_path)
+
+        def get_queue_item(queued_item_path):
+            return self._get_json(queued_item_path, tree="executable[number],why")
+
+        for queued_item_path, dct in zip(left_queue_paths, self._map(get_queue_item, left_queue_paths)):
+            executable = dct.get('executable')
+            if executable:
+                build_numbers[queued_item_path] = executable['number']
+            else:
+                queued_whys[queued_item_path] = dct['why']
+        return queued_whys, build_numbers
+
+    def _apply_queue_state(self, queued_whys, build_numbers):
+        for queued_item_path, invocation in self._queued_invocations.items():
+            if invocation.build_number is not None:
+                continue
+
+            if queued_item_path in build_numbers:
+                invocation.build_number = build_numbers[queued_item_path]
+                invocation.queued_why = None
+                del self._queued_invocations[queued_item_path]
+                invocation.set_description()
+            elif queued_item_path in queued_whys:
+                invocation.queued_why = queued_whys[queued_item_path]
+
+    def _fetch_builds(self, job_name, oldest=None):
+        """Return dict build_number -> build dct for the builds of job back to build number 'oldest', or all builds if oldest is None
+
+        The builds are read newest first, in ranges of increasing size, so that the history of jobs keeping many builds is not read.
+        """
+        path = job_path(job_name) + "/api/json"
+        if oldest is None:
+            dct = self._get_json(path, tree="builds[number,result]")
+            return dict((build['number'], build) for build in dct['builds'])
+
+        builds = {}
+        start = 0
+        size = self.builds_window
+        while True:
+            dct = self._get_json(path, tree="builds[number,result]{%d,%d}" % (start, start + size))
+            range_builds = dct['builds']
+            builds.update((build['number'], build) for build in range_builds)
+            if len(range_builds) < size or range_builds[-1]['number'] <= oldest:
+                return builds
+            start += size
+            size *= 2
+
+    def _fetch_snapshot(self, version, queued_item_paths, builds_wanted):
+        queued_whys, build_numbers = self._fetch_queue_state(queued_item_paths)
+        job_dcts = self._fetch_job_dcts()
+        builds_wanted = list(builds_wanted)
+        fetched = self._map(lambda wanted: self._fetch_builds(*wanted), builds_wanted)
+        builds = dict((job_name, (oldest, job_builds)) for (job_name, oldest), job_builds in zip(builds_wanted, fetched))
+        if self.poll_rate:
+            self.poll_rate.update(self._min_poll_interval)
+        return _PollSnapshot(version, job_dcts, queued_whys, build_numbers, builds)
+
+    def _prefetch_builds(self):
+        """Fetch builds for the jobs which needed them in the previous poll, all at the same time instead of one by one from Invocation.status"""
+        wanted = [(job_name, oldest) for job_name, oldest in self._builds_wanted.items() if job_name in self.jobs]
+        self._builds_wanted = {}
+        for (job_name, oldest), builds in zip(wanted, self._map(lambda args: self._fetch_builds(*args), wanted)):
+            self.jobs[job_name]._builds_snapshot = (self._poll_count, oldest, builds)  # pylint: disable=protected-access
+
+    def _apply_snapshot(self, snapshot):
+        if self._snapshot is None or snapshot.version != self._snapshot.version:
+            self._apply_queue_state(snapshot.queued_whys, snapshot.build_numbers)
+            self._apply_job_dcts(snapshot.job_dcts)
+            self._snapshot = snapshot
+
+        # Tell the poller what to get in the next cycles
+        self._poll_requests = (self._pending_queued_item_paths(), frozenset(self._builds_wanted.items()))
+        self._builds_wanted = {}
+
+    def start_polling(self, interval):
+        """Start the background poller and the notification receiver, if enabled. Called by the flow before it starts polling.
+
+        Args:
+            interval (float): Seconds between the start of each poll cycle.
+        """
+        self._min_poll_interval = interval
+        if self.notifications:
+            self.notifications.start()
+        if not self.background_poll or self._poller:
+            return
+        self._snapshot = None
+        self._builds_wanted = {}
+        self._poll_requests = (self._pending_queued_item_paths(), frozenset())
+        self._poller = _BackgroundPoller(self, interval)
+        self._poller.start()
+
+    def invoke_jobs(self, invocations):
+        """Invoke several jobs, sending up to concurrent_requests build triggers at the same time
+
+        Args:
+            invocations (list of (ApiJob, dict)): The jobs and the keyword arguments for :py:meth:`ApiJob.invoke`.
 
-            # A new job was created while flow was running, get the remaining properties
+        Return (list): The Invocation, or the exception raised when invoking, for each job in the same order.
+        """
+        if self.bulk_trigger and self.is_jenkins and len(invocations) > 1:
+            results = self._bulk_invoke(invocations)
+            if results is not None:
+                return results
+
+        if self.concurrent_requests <= 1 or len(invocations) <= 1:
+            return super(Jenkins, self).invoke_jobs(invocations)
+
+        def trigger(invocation):
+            job, kwargs = invocation
             try:
-                query = "lastBuild[number,result],queueItem[why],actions[parameterDefinitions[name,type]]"
-                response = self.get("/job/" + job_name + "/api/json", tree=query)
-                job_dct = json.loads(response.body_string())
-                job = ApiJob(self, job_dct, job_name)
-                self.jobs[job_name] = job
-            except errors.ResourceNotFound:  # pragma: no cover
-                # Ignore this, the job came and went
-                pass
+                return job._trigger(kwargs['securitytoken'], kwargs['build_params'], kwargs['cause'])  # pylint: disable=protected-access
+            except Exception as ex:  # pylint: disable=broad-except
+                return ex
+
+        results = []
+        for (job, kwargs), response in zip(invocations, self._map(trigger, invocations)):
+            try:
+                if isinstance(response, RequestFailed):
+                    results.append(job._trigger_failed(response, **kwargs))  # pylint: disable=protected-access
+                elif isinstance(response, Exception):
+                    results.append(response)
+                else:
+                    results.append(job._invoked(response.location[len(self.direct_uri):] + 'api/json', kwargs['description']))  # pylint: disable=protected-access
+            except Exception as ex:  # pylint: disable=broad-except
+                results.append(ex)
+        return results
+
+    def _bulk_invoke(self, invocations):
+        """Trigger all builds with one script console request. Return the result as for invoke_jobs, or None if the script console can't be used."""
+        triggers = []
+        for job, kwargs in invocations:
+            triggers.append(dict(job=job.name, params=kwargs['build_params'] or {}, cause=kwargs['cause']))
+        script = _bulk_trigger_script % base64.b64encode(json.dumps(triggers))
+
+        try:
+            response = self.post('/scriptText', headers=_ct_url_enc, payload={'script': script})
+        except (Unauthorized, ResourceNotFound):
+            # Not allowed to run scripts, don't try again
+            self.bulk_trigger = False
+            return None
+        except Exception as ex:  # pylint: disable=broad-except
+            # The script may have run, invoking the jobs again could queue the builds twice
+            return [ex] * len(invocations)
+
+        output = response.body_string().strip()
+        try:
+            # Anything else than the list of ids is an error message from the script
+            queue_ids = self.json_codec.decode(output.splitlines()[-1])
+            if not isinstance(queue_ids, list) or len(queue_ids) != len(invocations):
+                raise ValueError()
+        except (ValueError, IndexError):
+            # The script failed after it may have queued some of the builds, so the jobs are not invoked again, and the script is not tried again
+            self.bulk_trigger = False
+            ex = ValueError("Unexpected script console output, builds may have been queued: " + repr(output))
+            return [ex] * len(invocations)
+
+        results = []
+        for (job, kwargs), queue_id in zip(invocations, queue_ids):
+            try:
+                if queue_id is None:
+                    # The script did not queue the build, let invoke report why it can't be built
+                    results.append(job.invoke(**kwargs))
+                else:
+                    results.append(job._invoked('/queue/item/' + repr(queue_id) + '/api/json', kwargs['description']))  # pylint: disable=protected-access
+            except Exception as ex:  # pylint: disable=broad-except
+                results.append(ex)
+        return results
+
+    def free_executors(self):
+        """Return the number of executors likely to be free for new builds: idle executors on online nodes minus builds waiting in the queue
+
+        Returns None if Jenkins has no executors at all, e.g. when all builds run on cloud agents provisioned for the queued builds.
+        """
+        computers = self._get_json("/computer/api/json", tree="busyExecutors,totalExecutors")
+        if not computers['totalExecutors']:
+            return None
+        queue = self._get_json("/queue/api/json", tree="items[buildable]")
+        waiting = len([item for item in queue.get('items') or [] if item.get('buildable')])
+        return max(computers['totalExecutors'] - computers['busyExecutors'] - waiting, 0)
+
+    def _fetch_running_builds(self):
+        """Return dict job_name -> [build_number] for all running builds, read from the executors instead of from the builds of the jobs"""
+        query = "computer[executors[currentExecutable[number,url]],oneOffExecutors[currentExecutable[number,url]]]"
+        dct = self._get_json("/computer/api/json", tree=query)
+        running = {}
+        for computer in dct.get('computer') or []:
+            for executor in (computer.get('executors') or []) + (computer.get('oneOffExecutors') or []):
+                build = executor.get('currentExecutable')
+                if build and build.get('url'):
+                    build_numbers = running.setdefault(str(job_name_from_url(build['url'])), [])
+                    if build['number'] not in build_numbers:
+                        build_numbers.append(build['number'])
+        return running
+
+    def stop_all_jobs(self, jobs):
+        """Remove the queued builds and abort the running builds of all 'jobs', sending up to concurrent_requests requests at the same time
+
+        The queued builds are taken from the latest :py:meth:`queue_poll`, and the running builds of all jobs are found with a single request
+        for the executors.
+
+        Return (cancelled, stopped) (int, int): Number of queued builds removed and running builds aborted.
+        """
+        cancel_requests = [('/queue/cancelItem', {'id': repr(qid)}) for job in jobs for qid in self.queue_items.get(job.name) or []]
+
+        running = self._fetch_running_builds()
+        stop_requests = []
+        for job in jobs:
+            for build_number in running.get(job.name) or []:
+                stop_requests.append((job._path + '/' + repr(build_number) + '/stop', {}))  # pylint: disable=protected-access
+
+        def send(request):
+            path, params = request
+            try:
+                self.post(path, **params)
+                return 1
+            except ResourceNotFound:
+                # No longer queued or build deleted
+                # NOTE: bug https://issues.jenkins-ci.org/browse/JENKINS-21311 also brings us here!
+                return 0
+
+        sent = self._map(send, cancel_requests + stop_requests)
+        return sum(sent[:len(cancel_requests)]), sum(sent[len(cancel_requests):])
+
+    def stop_invocations(self, invocations, dequeue):
+        """Call :py:meth:`Invocation.stop` for all 'invocations', with up to concurrent_requests calls running at the same time"""
+        self._map(lambda invocation: invocation.stop(dequeue), invocations)
+
+    def flush(self, timeout=60):
+        """Wait until deferred build descriptions have been written. Called by the flow before it finishes.
+
+        Args:
+            timeout (float): Seconds to wait before giving up on the descriptions not yet written.
+
+        Raises:
+            The first failed description write, or an Exception if the descriptions were not written within 'timeout'.
+        """
+        if self._description_writer:
+            self._description_writer.flush(timeout)
+
+    def poll_interval(self, interval):
+        """Return the seconds to wait before the next poll, 'interval' stretched if Jenkins is overloaded"""
+        if not self.poll_rate:
+            return interval
+        return max(interval, self.poll_rate.interval)
+
+    def poll_status(self):
+        """Return the poll rate and response time for the status output, or None"""
+        return self.poll_rate.status() if self.poll_rate else None
+
+    def stop_polling(self):
+        """Stop the background poller and the notification receiver, if running. Following calls to :py:meth:`quick_poll` will poll Jenkins directly."""
+        if self.notifications:
+            self.notifications.stop()
+        if self._poller:
+            poller = self._poller
+            self._poller = None
+            poller.stop()
+
+    def close(self):
+        """Stop the threads making concurrent requests and close the connections to Jenkins. Called by the flow when it has finished.
+
+        The api can still be used, the threads and connections are created again when needed.
+        """
+        with self._pool_lock:
+            pool = self._pool
+            self._pool = None
+        if pool:
+            pool.close()
+            pool.join()
+        self.transport.close()
 
     def queue_poll(self):
-        query = "items[task[name],id]"
-        response = self.get("/queue/api/json", tree=query)
-        dct = json.loads(response.body_string())
+        query = "items[task[name,url],id]"
+        dct = self._get_json("/queue/api/json", tree=query)
 
         queue_items = {}
         for qi_dct in dct.get('items') or []:
-            job_name = str(qi_dct['task']['name'])
+            # The name of the task is not the full name for jobs in folders
+            task = qi_dct['task']
+            job_name = str(job_name_from_url(task['url']) if task.get('url') else task['name'])
             if self.job_prefix_filter and not job_name.startswith(self.job_prefix_filter):
                 continue
 
@@ -141,18 +1316,29 @@ class Jenkins(Resource):
         self.queue_items = queue_items
 
     def get_job(self, name):
+        # Remember the jobs used by the flow, these are the only jobs polled when using flow_scoped_poll
+        self._flow_job_names[name] = True
+        if name not in self.jobs and (not self.job_prefix_filter or name.startswith(self.job_prefix_filter)):
+            if self._cached is not None:
+                self._get_cached_job(name)
+            elif '/' in name:
+                # Only the top level jobs are listed by poll, jobs in folders are looked up when the flow uses them
+                job_dct = self._fetch_job_dct(name)
+                if job_dct is not None:
+                    self.jobs[name] = ApiJob(self, job_dct, name)
         try:
             return self.jobs[name]
         except KeyError:
             raise UnknownJobException(self._public_job_url(name))
 
     def create_job(self, job_name, config_xml):
-        self.post('/createItem', name=job_name, headers={'Content-Type': 'application/xml header'}, payload=config_xml)
+        folder, _, name = job_name.rpartition('/')
+        self.post((job_path(folder) if folder else '') + '/createItem', name=name, headers={'Content-Type': 'application/xml header'}, payload=config_xml)
 
     def delete_job(self, job_name):
         try:
-            self.post('/job/' + job_name + '/doDelete')
-        except errors.ResourceNotFound as ex:
+            self.post(job_path(job_name) + '/doDelete')
+        except ResourceNotFound as ex:
             # TODO: Check error
             raise UnknownJobException(self._public_job_url(job_name), ex)
 
@@ -167,95 +1353,142 @@ class Jenkins(Resource):
         """
         self.poll()
 
-        job_path = "/job/" + job_name
-        build_url = job_path + '/' + str(build_number)
+        build_url = job_path(job_name) + '/' + str(build_number)
         try:
             if not replace:
-                response = self.get(build_url + '/api/json', tree="description")
-                dct = json.loads(response.body_string())
+                dct = self._get_json(build_url + '/api/json', tree="description")
                 existing_description = dct['description']
                 if existing_description:
                     description = existing_description + separator + description
 
-            self.post(build_url + '/submitDescription', headers=_ct_url_enc, payload={'description': description})
-        except errors.ResourceNotFound as ex:
+            self.post(build_url + '/submitDescription', headers=_ct_url_enc, payload={'description': description}, priority=RequestBudget.NORMAL)
+        except ResourceNotFound as ex:
             raise Exception("Build not found " + repr(build_url), ex)
 
 
 class ApiJob(object):
     def __init__(self, jenkins, dct, name):
         self.jenkins = jenkins
-        self.dct = dct.copy()
+        # The actions are only needed here, don't keep the parameter definitions of all jobs
+        self.dct = dict((key, value) for key, value in dct.items() if key != 'actions')
         self.name = name
-        self.public_uri = self.baseurl = self.jenkins._public_job_url(self.name)  # pylint: disable=protected-access
-
-        actions = self.dct.get('actions') or []
-        self._path = "/job/" + self.name
-        for action in actions:
-            if action.get('parameterDefinitions'):
-                self._build_trigger_path = self._path + "/buildWithParameters"
-                break
-        else:
-            self._build_trigger_path = self._path + "/build"
+
+        self._path = job_path(self.name)
+        self._set_build_trigger_path(_parameter_definitions(dct))
         self.old_build_number = None
         self._invocations = OrderedDict()
         self.queued_why = None
+        self._builds_snapshot = (None, None, None)
+        # build number -> result name from build notifications, None if the build was notified as started
+        self._notified_results = {}
+
+    @property
+    def public_uri(self):
+        # Not known while the job list is being received by Jenkins.poll
+        return self.jenkins._public_job_url(self.name)  # pylint: disable=protected-access
+
+    baseurl = public_uri
+
+    def _set_build_trigger_path(self, parameter_definitions):
+        self._build_trigger_path = self._path + ("/buildWithParameters" if parameter_definitions else "/build")
+
+    def _trigger(self, securitytoken, build_params, cause):
+        """Send the build trigger, return the response. Thread safe."""
+        if cause:
+            build_params = build_params or {}
+            build_params['cause'] = cause
+        headers = _ct_url_enc if build_params else None
+        params = {}
+        if securitytoken:
+            params['token'] = securitytoken
+        return self.jenkins.post(self._build_trigger_path, headers=headers, payload=build_params, **params)
 
     def invoke(self, securitytoken, build_params, cause, description):
         try:
-            if cause:
-                build_params = build_params or {}
-                build_params['cause'] = cause
-            headers = _ct_url_enc if build_params else None
-            params = {}
-            if securitytoken:
-                params['token'] = securitytoken
-            response = self.jenkins.post(self._build_trigger_path, headers=headers, payload=build_params, **params)
-        except errors.ResourceNotFound as ex:
-            raise UnknownJobException(self.jenkins._public_job_url(self.name), ex)  # pylint: disable=protected-access
-
-        location = response.location[len(self.jenkins.direct_uri):] + 'api/json'
+            response = self._trigger(securitytoken, build_params, cause)
+        except RequestFailed as ex:
+            return self._trigger_failed(ex, securitytoken, build_params, cause, description)
+        return self._invoked(response.location[len(self.jenkins.direct_uri):] + 'api/json', description)
+
+    def _trigger_failed(self, ex, securitytoken, build_params, cause, description):
+        """Handle a build trigger which failed with 'ex'. Used by invoke and by Jenkins.invoke_jobs.
+
+        The trigger is only sent again if the job was deleted or changed since it was cached, where Jenkins did not queue the build.
+        Return the Invocation, or raise.
+        """
+        try:
+            if ex.status_int not in (400, 404, 405, 500) or not self.jenkins._revalidate_cached_job(self):  # pylint: disable=protected-access
+                raise ex
+            response = self._trigger(securitytoken, build_params, cause)
+        except ResourceNotFound as not_found:
+            raise UnknownJobException(self.jenkins._public_job_url(self.name), not_found)  # pylint: disable=protected-access
+        return self._invoked(response.location[len(self.jenkins.direct_uri):] + 'api/json', description)
+
+    def _invoked(self, location, description):
+        """Create the Invocation for a triggered build, 'location' is the path of the queue item api"""
+        # Poll the job again
+        self.jenkins._job_poll_times.pop(self.name, None)  # pylint: disable=protected-access
+
         old_inv = self._invocations.get(location)
         if old_inv:
             old_inv.build_number = _superseded
         inv = Invocation(self, location, description)
         self._invocations[location] = inv
+        if self.jenkins.is_jenkins:
+            # Build numbers for all jobs are resolved together by Jenkins.quick_poll
+            self.jenkins._queued_invocations[location] = inv  # pylint: disable=protected-access
+            if self.jenkins._poller:  # pylint: disable=protected-access
+                queued_item_paths, builds_job_names = self.jenkins._poll_requests  # pylint: disable=protected-access
+                self.jenkins._poll_requests = (queued_item_paths + (location,), builds_job_names)  # pylint: disable=protected-access
         return inv
 
     def poll(self):
+        if self.jenkins.is_jenkins:
+            return
+
+        # Hudson does not return queue item from invoke, instead it returns the job URL :(
         for invocation in self._invocations.values():
             if not invocation.build_number:
-                # Hudson does not return queue item from invoke, instead it returns the job URL :(
-                query = "executable[number],why" if self.jenkins.is_jenkins else "queueItem[why],lastBuild[number]"
-                qi_response = self.jenkins.get(invocation.queued_item_path, tree=query)
-                dct = json.loads(qi_response.body_string())
-
-                if self.jenkins.is_jenkins:
-                    executable = dct.get('executable')
-                    if executable:
-                        invocation.build_number = executable['number']
-                        invocation.queued_why = None
+                query = "queueItem[why],lastBuild[number]"
+                dct = self.jenkins._get_json(invocation.queued_item_path, tree=query)  # pylint: disable=protected-access
+
+                # Note, this is not guaranteed to be correct in case of simultaneously running flows!
+                # Should handle multiple invocations in same flow
+                qi = dct.get('queueItem')
+                if qi:
+                    invocation.queued_why = qi['why']
+
+                last_build = dct.get('lastBuild')
+                if last_build:
+                    last_build_number = last_build['number']
+                    if last_build_number > self.old_build_number:
+                        invocation.build_number = last_build['number']
+                        self.old_build_number = invocation.build_number
                         invocation.set_description()
                     else:
-                        invocation.queued_why = dct['why']
-                        # If we still have invocations in the queue, wait until next poll to query again
                         break
-                else:  # Hudson
-                    # Note, this is not guaranteed to be correct in case of simultaneously running flows!
-                    # Should handle multiple invocations in same flow
-                    qi = dct.get('queueItem')
-                    if qi:
-                        invocation.queued_why = qi['why']
-
-                    last_build = dct.get('lastBuild')
-                    if last_build:
-                        last_build_number = last_build['number']
-                        if last_build_number > self.old_build_number:
-                            invocation.build_number = last_build['number']
-                            self.old_build_number = invocation.build_number
-                            invocation.set_description()
-                        else:
-                            break
+
+    def _builds(self, build_number):
+        """Map of build number to build dct for the builds back to 'build_number', fetched at most once per quick_poll and shared by all invocations
+
+        The job is remembered, so that the builds can be fetched together with other jobs' builds in the next poll.
+        When background polling, the builds are fetched by the poller and None is returned until the poller has fetched them.
+        """
+        # pylint: disable=protected-access
+        wanted = self.jenkins._builds_wanted
+        wanted[self.name] = min(wanted.get(self.name, build_number), build_number)
+        if self.jenkins._poller:
+            snapshot = self.jenkins._snapshot
+            fetched = snapshot.builds.get(self.name) if snapshot else None
+            if fetched is None or fetched[0] > build_number:
+                return None
+            return fetched[1]
+
+        poll_count, oldest, builds = self._builds_snapshot
+        if poll_count != self.jenkins._poll_count or oldest > build_number:
+            builds = self.jenkins._fetch_builds(self.name, build_number)
+            self._builds_snapshot = (self.jenkins._poll_count, build_number, builds)
+        return builds
 
     def job_status(self):
         """Result, progress and latest buildnumber info for the JOB, NOT the invocation
@@ -284,27 +1517,21 @@ class ApiJob(object):
         for qid in queue_item_ids:
             try:
                 self.jenkins.post('/queue/cancelItem', id=repr(qid))
-            except errors.ResourceNotFound:
+            except ResourceNotFound:
                 # Job is no longer queued, so just ignore
                 # NOTE: bug https://issues.jenkins-ci.org/browse/JENKINS-21311 also brings us here!
                 pass
 
         # Abort running builds
-        query = "builds[number,result]"
-        response = self.jenkins.get("/job/" + self.name + "/api/json", tree=query)
-        dct = json.loads(response.body_string())
-        for build in dct['builds']:
-            _result, progress = _result_and_progress(build)
-            if progress != Progress.IDLE:
-                build_number = build['number']
-                try:
-                    self.jenkins.post(self._path + '/' + repr(build_number) + '/stop')
-                except errors.ResourceNotFound:  # pragma: no cover
-                    # Build was deleted, just ignore
-                    pass
+        for build_number in self.jenkins._fetch_running_builds().get(self.name) or []:  # pylint: disable=protected-access
+            try:
+                self.jenkins.post(self._path + '/' + repr(build_number) + '/stop')
+            except ResourceNotFound:  # pragma: no cover
+                # Build was deleted, just ignore
+                pass
 
     def update_config(self, config_xml):
-        self.jenkins.post("/job/" + self.name + "/config.xml", payload=config_xml)
+        self.jenkins.post(self._path + "/config.xml", payload=config_xml)
 
     def __repr__(self):
         return str(dict(name=self.name, dct=self.dct))
@@ -337,26 +1564,36 @@ class Invocation(ApiInvocationMixin):
         if self.build_number == _dequeued:
             return (BuildResult.DEQUEUED, Progress.IDLE)
 
+        notified = self.job._notified_results.get(self.build_number, _not_notified)  # pylint: disable=protected-access
+        if notified not in (None, _not_notified):
+            return (BuildResult[notified], Progress.IDLE)
+
         # It seems that even after the executor has been assigned a number in the queue item, the lastBuild might not yet exist
         dct = self.job.dct.get('lastBuild')
         last_number = dct['number'] if dct else None
-        if last_number is None:
-            return (BuildResult.UNKNOWN, Progress.QUEUED)
-
         if last_number == self.build_number:
             return _result_and_progress(dct)
 
+        if notified is None:
+            # Notified as started, the polled state is older, no need to look up the build
+            return (BuildResult.UNKNOWN, Progress.RUNNING)
+
+        if last_number is None:
+            return (BuildResult.UNKNOWN, Progress.QUEUED)
+
         if last_number < self.build_number:
             # TODO: Why does this happen?
             pass  # pragma: no cover
 
         # Latest build is not ours, get the correct build
-        query = "builds[number,result]"
-        response = self.job.jenkins.get("/job/" + self.job.name + "/api/json", tree=query)
-        dct = json.loads(response.body_string())
-        for build in dct['builds']:
-            if build['number'] == self.build_number:
-                return _result_and_progress(build)
+        builds = self.job._builds(self.build_number)  # pylint: disable=protected-access
+        if builds is None:
+            # Not yet fetched by the background poller
+            return (BuildResult.UNKNOWN, Progress.RUNNING)
+
+        build = builds.get(self.build_number)
+        if build:
+            return _result_and_progress(build)
 
         raise Exception("Build deleted while flow running? This may happen if you invoke more builds than the job is configured to keep. " + repr(self))
 
@@ -366,9 +1603,14 @@ class Invocation(ApiInvocationMixin):
             return
 
         build_url = self.job._path + '/' + repr(self.build_number)
+        if self.job.jenkins._description_writer:  # pylint: disable=protected-access
+            self.job.jenkins._description_writer.put(build_url, self.description)  # pylint: disable=protected-access
+            return
+
         try:
-            self.job.jenkins.post(build_url + '/submitDescription', headers=_ct_url_enc, payload={'description': self.description})
-        except errors.ResourceNotFound as ex:
+            self.job.jenkins.post(build_url + '/submitDescription', headers=_ct_url_enc, payload={'description': self.description},
+                                  priority=RequestBudget.NORMAL)
+        except ResourceNotFound as ex:
             raise Exception("Build deleted while flow running? " + repr(build_url), ex)
 
     def stop(self, dequeue):
@@ -380,10 +1622,10 @@ class Invocation(ApiInvocationMixin):
 
             if self.build_number is None and dequeue:
                 # Job is queued
-                qid = self.queued_item_path.strip('/').split('/')[2]
-                self.job.jenkins.post('/queue/cancelItem', id=qid)
+                qid = _queue_id(self.queued_item_path)
+                self.job.jenkins.post('/queue/cancelItem', id=repr(qid))
                 self.build_number = _dequeued
-        except errors.ResourceNotFound as ex:  # pragma: no cover
+        except ResourceNotFound as ex:  # pragma: no cover
             # Job is no longer queued or running, except that it may have just changed from queued to running
             # We leave it up to the flow logic to handle that
             # NOTE: bug https://issues.jenkins-ci.org/browse/JENKINS-21311 also brings us here!
@@ -0,0 +1,62 @@
+# Copyright (c) 2012 - 2015 Lars Hupfeldt Nielsen, Hupfeldt IT
+# All rights reserved. This work is under a BSD license, see LICENSE.TXT.
+
+"""JSON decoders used by jenkins_api to decode the responses from Jenkins"""
+
+import json
+
+
+class JsonCodec(object):
+    """Decodes json with the standard library. Subclass and implement :py:meth:`decode` to use another json library.
+
+    Implementations must be thread safe, responses may be decoded from several threads at the same time.
+    """
+
+    name = 'json'
+
+    def decode(self, body):
+        """Decode a json document
+
+        Args:
+            body (str): The undecoded bytes of the document, utf-8 encoded as sent by Jenkins.
+
+        Raises:
+            ValueError: If body is not a valid json document.
+        """
+        return json.loads(body)
+
+
+class UjsonCodec(JsonCodec):
+    """Decodes json with ujson, which decodes directly from the bytes and is several times faster than the standard library"""
+
+    name = 'ujson'
+
+    def __init__(self):
+        import ujson
+        self._loads = ujson.loads
+
+    def decode(self, body):
+        return self._loads(body)
+
+
+class SimplejsonCodec(JsonCodec):
+    """Decodes json with simplejson, which is faster than the standard library of python 2 when its C speedups are compiled"""
+
+    name = 'simplejson'
+
+    def __init__(self):
+        import simplejson
+        self._loads = simplejson.loads
+
+    def decode(self, body):
+        return self._loads(body)
+
+
+def default_codec():
+    """Return the fastest codec which is installed"""
+    for codec_class in (UjsonCodec, SimplejsonCodec):
+        try:
+            return codec_class()
+        except ImportError:
+            pass
+    return JsonCodec()
@@ -0,0 +1,164 @@
+# Copyright (c) 2012 - 2015 Lars Hupfeldt Nielsen, Hupfeldt IT
+# All rights reserved. This work is under a BSD license, see LICENSE.TXT.
+
+"""Receive build notifications in the flow process, in the format sent by the Jenkins Notification plugin
+
+The Notification plugin must be configured on the jobs to send JSON over HTTP to the :py:attr:`NotificationReceiver.url`.
+The url contains a secret token, notifications posted to any other url are rejected.
+"""
+
+from __future__ import print_function
+
+import os, json, time, hmac, binascii, threading, urllib2
+from Queue import Queue, Empty
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from SocketServer import ThreadingMixIn
+
+from .api_base import job_path, job_name_from_url
+
+
+def notification_payload(job_name, build_number, phase, status=None, queue_id=None):
+    """Return a notification, as sent by the Notification plugin, as json
+
+    Args:
+        job_name (str): Name of the job.
+        build_number (int): The build number.
+        phase (str): 'QUEUED', 'STARTED', 'COMPLETED' or 'FINALIZED'.
+        status (str): The build result, e.g. 'SUCCESS', when phase is 'COMPLETED' or 'FINALIZED'.
+        queue_id (int): The id of the queue item the build was started from.
+    """
+    url = job_path(job_name)[1:] + '/'
+    build = dict(number=build_number, phase=phase, url=url + repr(build_number) + '/')
+    if status:
+        build['status'] = status
+    if queue_id is not None:
+        build['queue_id'] = queue_id
+    return json.dumps(dict(name=job_name.rpartition('/')[2], url=url, build=build))
+
+
+def send_notification(url, job_name, build_number, phase, status=None, queue_id=None):
+    """Post a notification to a receiver, like the Notification plugin does. See :py:func:`notification_payload` for the arguments."""
+    request = urllib2.Request(url, notification_payload(job_name, build_number, phase, status, queue_id), {'Content-Type': 'application/json'})
+    urllib2.urlopen(request).read()
+
+
+class _ThreadingServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _NotificationHandler(BaseHTTPRequestHandler):
+    def do_POST(self):  # pylint: disable=invalid-name
+        if not hmac.compare_digest(self.path.split('?')[0].strip('/'), self.server.receiver.token):
+            self.send_error(403, "Unknown notification url")
+            return
+
+        try:
+            body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+            event = json.loads(body)
+            build = event['build']
+            # The name is not the full name for jobs in folders
+            name = job_name_from_url(event['url']) if event.get('url') else event['name']
+            event = dict(name=str(name), number=build['number'], phase=build['phase'], status=build.get('status'),
+                         queue_id=build.get('queue_id'))
+        except (ValueError, KeyError, TypeError) as ex:
+            self.send_error(400, "Not a build notification: " + str(ex))
+            return
+
+        self.server.receiver._received(event)  # pylint: disable=protected-access
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *_args):
+        pass
+
+
+class NotificationReceiver(object):
+    """Embedded http server receiving build notifications, so that the flow learns about started and finished builds without polling
+
+    While notifications arrive, :py:meth:`jenkins_api.Jenkins.quick_poll` only polls Jenkins every 'reconcile_interval' seconds,
+    in case a notification was lost. Until the first notification arrives, and when no notification has arrived for 'silence_timeout'
+    seconds, Jenkins is polled normally.
+
+    Args:
+        host (str): Interface to listen on, default is 'localhost', which requires Jenkins to run on the same host as the flow.
+            Use '' to listen on all interfaces.
+        port (int): Port to listen on. Default 0 selects a free port, which is only useful for testing.
+        public_host (str): Host name used in :py:attr:`url`. Default is 'host', or 'localhost' if host is empty.
+        token (str): Secret part of :py:attr:`url`, so that only Jenkins, which is configured with the url, can post notifications.
+            Default is a random token.
+        reconcile_interval (float): Seconds between polls while notifications arrive.
+        silence_timeout (float): Seconds without notifications before falling back to normal polling.
+
+    Attributes:
+        url (str): The url, including the token, to configure in the Notification plugin. Available after :py:meth:`start`.
+        event_count (int): Number of notifications received.
+        last_event_time (float): Time of the latest notification.
+        queue_ids_seen (bool): True if the notifications contain the queue id, so that queued builds can be resolved without polling.
+    """
+
+    def __init__(self, host='localhost', port=0, public_host=None, token=None, reconcile_interval=30, silence_timeout=60):
+        self.host = host
+        self.port = port
+        self.public_host = public_host or host or 'localhost'
+        self.token = str(token) if token else binascii.hexlify(os.urandom(16))
+        self.reconcile_interval = reconcile_interval
+        self.silence_timeout = silence_timeout
+        self.url = None
+        self.event_count = 0
+        self.last_event_time = None
+        self.queue_ids_seen = False
+        self._events = Queue()
+        self._server = None
+        self._thread = None
+
+    def _received(self, event):
+        self._events.put(event)
+        self.last_event_time = time.time()
+        self.event_count += 1
+        if event['queue_id'] is not None:
+            self.queue_ids_seen = True
+
+    def start(self):
+        if self._server:
+            return
+        self._server = _ThreadingServer((self.host, self.port), _NotificationHandler)
+        self._server.receiver = self
+        self.url = 'http://' + self.public_host + ':' + repr(self._server.server_port) + '/' + self.token + '/'
+        self._thread = threading.Thread(target=self._server.serve_forever, name="jenkinsflow notification receiver")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        if not self._server:
+            return
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+        self._server = None
+
+    def events(self):
+        """Return the notifications received since last call, oldest first
+
+        Each notification is a dict with 'name', 'number', 'phase', 'status' and 'queue_id'. 'status' and 'queue_id' may be None.
+        """
+        events = []
+        while True:
+            try:
+                events.append(self._events.get_nowait())
+            except Empty:
+                return events
+
+    def poll_due(self, last_poll_time):
+        """Return True if Jenkins should be polled, when it was last polled at 'last_poll_time'"""
+        now = time.time()
+        if not self._server or self.last_event_time is None or now - self.last_event_time > self.silence_timeout:
+            return True
+        return last_poll_time is None or now - last_poll_time >= self.reconcile_interval
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
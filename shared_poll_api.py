@@ -0,0 +1,320 @@
+# Copyright (c) 2012 - 2015 Lars Hupfeldt Nielsen, Hupfeldt IT
+# All rights reserved. This work is under a BSD license, see LICENSE.TXT.
+
+"""Api for flows running on the same host to share the polling of Jenkins
+
+A poll daemon is started on demand by the first flow. It polls Jenkins once per interval for the jobs, queue items and builds
+that any flow has asked for, and serves the latest state to all flows over a Unix socket.
+The daemon exits when no flow has asked for anything for a while.
+Invoking and stopping builds is still done directly by each flow.
+"""
+
+from __future__ import print_function
+
+import sys, os, stat, errno, time, json, socket, hashlib, tempfile, threading, fcntl
+from collections import OrderedDict
+from SocketServer import ThreadingMixIn, UnixStreamServer, StreamRequestHandler
+
+from . import jenkins_api
+
+
+_username_env_var = 'JENKINSFLOW_POLL_DAEMON_USERNAME'
+_password_env_var = 'JENKINSFLOW_POLL_DAEMON_PASSWORD'
+_kinds = ('jobs', 'queue', 'builds')
+
+
+def default_socket_path(direct_uri, username=None):
+    """The socket path used by all flows on this host, for the same Jenkins and user"""
+    socket_dir = os.path.join(tempfile.gettempdir(), 'jenkinsflow-poll-' + repr(os.getuid()))
+    try:
+        os.makedirs(socket_dir, 0o700)
+    except OSError as ex:
+        if ex.errno != errno.EEXIST:
+            raise
+
+    # The directory name can be predicted, so it may have been created by another user, to receive the polls of our flows
+    st = os.lstat(socket_dir)
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or stat.S_IMODE(st.st_mode) != 0o700:
+        raise Exception("Refusing to use socket directory " + repr(socket_dir) + ", it must be a directory (not a symlink) owned by uid " +
+                        repr(os.getuid()) + " with mode 0700, got uid " + repr(st.st_uid) + " and mode " + oct(st.st_mode))
+    return os.path.join(socket_dir, hashlib.sha1(direct_uri + '\n' + (username or '')).hexdigest()[:16] + '.sock')
+
+
+def _older(oldest, other):
+    """The older of two 'oldest' build numbers, where None means all builds"""
+    if oldest is None or other is None:
+        return None
+    return min(oldest, other)
+
+
+class _ThreadingUnixServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+
+class _RequestHandler(StreamRequestHandler):
+    def handle(self):
+        # One json request per line, answered by one json line, until the flow disconnects
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            self.wfile.write(json.dumps(self.server.poll_daemon.answer(json.loads(line))) + '\n')
+            self.wfile.flush()
+
+
+class PollDaemon(object):
+    """Polls Jenkins for the union of what the flows have asked for
+
+    Args:
+        jenkins (jenkins_api.Jenkins): Used for getting the state from Jenkins.
+        socket_path (str): The Unix socket to serve on.
+        interval (float): Seconds between polls.
+        idle_timeout (float): Exit when no flow has sent a request for this many seconds.
+    """
+
+    def __init__(self, jenkins, socket_path, interval, idle_timeout):
+        self.jenkins = jenkins
+        self.socket_path = socket_path
+        self.interval = interval
+        self.idle_timeout = idle_timeout
+        # Anything not asked for in this many seconds is no longer polled
+        self.interest_timeout = max(3 * interval, 10)
+        self._lock = threading.Lock()
+        self._asked = dict((kind, {}) for kind in _kinds)
+        self._state = dict((kind, {}) for kind in _kinds)
+        # job_name -> the oldest build number any flow has asked for, None for all builds
+        self._oldest = {}
+        self._last_request_time = time.time()
+        self._server = None
+
+    def _fetch(self, kind, keys, oldest=None):
+        """Return dict key -> json friendly state. For builds, 'oldest' is the list of the oldest build numbers wanted for each job."""
+        jenkins = self.jenkins
+        if kind == 'jobs':
+            return dict(zip(keys, jenkins._map(jenkins._fetch_job_dct, keys)))  # pylint: disable=protected-access
+        if kind == 'queue':
+            queued_whys, build_numbers = jenkins._fetch_queue_state(keys)  # pylint: disable=protected-access
+            return dict((path, (queued_whys.get(path), build_numbers.get(path))) for path in keys)
+        builds = jenkins._map(lambda args: jenkins._fetch_builds(*args), zip(keys, oldest))  # pylint: disable=protected-access
+        return dict((job_name, job_builds.values()) for job_name, job_builds in zip(keys, builds))
+
+    def answer(self, request):
+        now = time.time()
+        self._last_request_time = now
+        response = {}
+        for kind in _kinds:
+            keys = request.get(kind)
+            if not keys:
+                continue
+
+            with self._lock:
+                for key in keys:
+                    self._asked[kind][key] = now
+                if kind == 'builds':
+                    # Asked for a dict job_name -> oldest build number
+                    for job_name, oldest in keys.items():
+                        current = self._oldest.get(job_name, oldest)
+                        self._oldest[job_name] = _older(oldest, current)
+                        if self._oldest[job_name] != current:
+                            # Older builds wanted than those polled
+                            self._state[kind].pop(job_name, None)
+                missing = [key for key in keys if key not in self._state[kind]]
+                oldest = [self._oldest.get(key) for key in missing]
+
+            if missing:
+                # Asked for the first time, get it now instead of waiting for the next poll
+                fetched = self._fetch(kind, missing, oldest)
+                with self._lock:
+                    self._state[kind].update(fetched)
+
+            with self._lock:
+                response[kind] = dict((key, self._state[kind].get(key)) for key in keys)
+        return response
+
+    def _poll(self):
+        now = time.time()
+        for kind in _kinds:
+            with self._lock:
+                asked = self._asked[kind]
+                for key, asked_time in asked.items():
+                    if now - asked_time > self.interest_timeout:
+                        del asked[key]
+                        self._state[kind].pop(key, None)
+                        if kind == 'builds':
+                            self._oldest.pop(key, None)
+                keys = list(asked)
+                if kind == 'queue':
+                    # Queue items which have become builds don't change
+                    keys = [path for path in keys if path not in self._state[kind] or self._state[kind][path][1] is None]
+                oldest = [self._oldest.get(key) for key in keys]
+
+            if keys:
+                fetched = self._fetch(kind, keys, oldest)
+                with self._lock:
+                    for key, key_oldest in zip(keys, oldest):
+                        # Not stored if older builds were asked for while polling, they have already been fetched
+                        if key in self._asked[kind] and (kind != 'builds' or self._oldest.get(key) == key_oldest):
+                            self._state[kind][key] = fetched[key]
+
+    def _poll_loop(self):
+        next_poll_time = time.time() + self.interval
+        while time.time() - self._last_request_time < self.idle_timeout:
+            if time.time() >= next_poll_time:
+                next_poll_time = time.time() + self.interval
+                try:
+                    self._poll()
+                except Exception as ex:  # pylint: disable=broad-except
+                    # Jenkins may be temporarily unavailable, the flows will retry
+                    print("Poll failed:", ex, file=sys.stderr)
+            time.sleep(max(0, min(next_poll_time - time.time(), self.idle_timeout / 2)))
+        self._server.shutdown()
+
+    def serve(self):
+        self._server = _ThreadingUnixServer(self.socket_path, _RequestHandler)
+        self._server.poll_daemon = self
+        poll_thread = threading.Thread(target=self._poll_loop, name="jenkinsflow poll daemon")
+        poll_thread.daemon = True
+        poll_thread.start()
+        try:
+            self._server.serve_forever()
+        finally:
+            os.unlink(self.socket_path)
+            self._server.server_close()
+
+
+class Jenkins(jenkins_api.Jenkins):
+    """Drop-in replacement for :py:class:`jenkins_api.Jenkins`, getting the job, queue and build state from a shared poll daemon
+
+    Polling is always flow scoped. Other arguments are the same as for :py:class:`jenkins_api.Jenkins`.
+
+    Args:
+        socket_path (str): The Unix socket of the daemon. Default is the same for all flows on this host using the same Jenkins and user.
+        interval (float): Seconds between polls of the daemon, if it is started by this flow. Default is the poll interval of the flow.
+        idle_timeout (float): Seconds without requests before the daemon exits, if it is started by this flow.
+    """
+
+    def __init__(self, direct_uri, job_prefix_filter=None, username=None, password=None, socket_path=None, interval=None, idle_timeout=60,
+                 **kwargs):
+        kwargs['flow_scoped_poll'] = True
+        super(Jenkins, self).__init__(direct_uri, job_prefix_filter, username, password, **kwargs)
+        self.socket_path = socket_path or default_socket_path(direct_uri, username)
+        self.interval = interval
+        self.idle_timeout = idle_timeout
+        self._daemon_socket = None
+        self._daemon_file = None
+        self._daemon_lock = threading.Lock()
+
+    def start_polling(self, interval):
+        if self.interval is None:
+            self.interval = interval
+        super(Jenkins, self).start_polling(interval)
+
+    def _start_daemon(self):
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join(sys.path)
+        # Don't let Jenkins kill the daemon when the flow job which started it finishes, other flows may still use it
+        env['BUILD_ID'] = env['JENKINS_NODE_COOKIE'] = 'dontKillMe'
+        if self.username:
+            env[_username_env_var] = self.username
+            env[_password_env_var] = self.password
+
+        import subprocess32 as subprocess
+        interval = self.interval if self.interval is not None else 1
+        args = [sys.executable, '-m', __name__, self.direct_uri, self.socket_path, repr(interval), repr(self.idle_timeout)]
+        with open(os.devnull, 'r+') as devnull, open(self.socket_path + '.log', 'a') as log:
+            subprocess.check_call(args, env=env, stdin=devnull, stdout=devnull, stderr=log, close_fds=True)
+
+    def _connect(self):
+        started = False
+        timeout = time.time() + 10
+        while True:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(self.socket_path)
+                self._daemon_socket = sock
+                self._daemon_file = sock.makefile('r')
+                return
+            except socket.error:
+                sock.close()
+                if time.time() > timeout:
+                    raise
+                if not started:
+                    self._start_daemon()
+                    started = True
+                time.sleep(0.05)
+
+    def _disconnect(self):
+        if self._daemon_socket:
+            self._daemon_file.close()
+            self._daemon_socket.close()
+        self._daemon_socket = self._daemon_file = None
+
+    def _ask(self, kind, keys):
+        """Return dict key -> state from the daemon. For builds, keys is a dict job_name -> the oldest build number wanted."""
+        if not keys:
+            return {}
+
+        with self._daemon_lock:
+            for retry in (False, True):
+                try:
+                    if not self._daemon_socket:
+                        self._connect()
+                    self._daemon_socket.sendall(json.dumps({kind: keys}) + '\n')
+                    line = self._daemon_file.readline()
+                    if not line:
+                        raise socket.error("Poll daemon closed connection")
+                    return json.loads(line)[kind]
+                except socket.error:
+                    # The daemon may have exited because it was idle, start a new one
+                    self._disconnect()
+                    if retry:
+                        raise
+
+    def _fetch_scoped_job_dcts(self):
+        job_names = self._due_flow_job_names()
+        job_dcts = self._ask('jobs', job_names)
+        # None if missing, or the job came and went
+        return OrderedDict((job_name, job_dcts[job_name]) for job_name in job_names if job_dcts.get(job_name) is not None)
+
+    def _fetch_queue_state(self, queued_item_paths):
+        queued_whys = {}
+        build_numbers = {}
+        for queued_item_path, (queued_why, build_number) in self._ask('queue', list(queued_item_paths)).items():
+            if build_number is not None:
+                build_numbers[queued_item_path] = build_number
+            else:
+                queued_whys[queued_item_path] = queued_why
+        return queued_whys, build_numbers
+
+    def _fetch_builds(self, job_name, oldest=None):
+        # The daemon reads back to the oldest build any flow wants, so there may be more builds than asked for
+        return dict((build['number'], build) for build in self._ask('builds', {job_name: oldest})[job_name])
+
+
+def main(direct_uri, socket_path, interval, idle_timeout):
+    """Start a poll daemon in the background, unless one is already serving 'socket_path'"""
+    # Detach, so that the starting flow can wait for this process and the daemon outlives the flow
+    if os.fork():
+        os._exit(0)  # pylint: disable=protected-access
+    os.setsid()
+
+    lock_file = open(socket_path + '.lock', 'w')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except IOError:
+        # Another daemon is serving or starting
+        return
+
+    if os.path.exists(socket_path):
+        # Left by a daemon that did not exit cleanly
+        os.unlink(socket_path)
+
+    # The daemon does not poll adaptively itself, but it must get the estimated duration of builds for the flows which do
+    jenkins = jenkins_api.Jenkins(direct_uri, username=os.environ.get(_username_env_var), password=os.environ.get(_password_env_var),
+                                  flow_scoped_poll=True, concurrent_requests=8, adaptive_poll_max_interval=interval)
+    jenkins.jobs = {}
+    PollDaemon(jenkins, socket_path, interval, idle_timeout).serve()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1], sys.argv[2], float(sys.argv[3]), float(sys.argv[4]))
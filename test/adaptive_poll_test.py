@@ -0,0 +1,81 @@
+# Copyright (c) 2012 - 2015 Lars Hupfeldt Nielsen, Hupfeldt IT
+# All rights reserved. This work is under a BSD license, see LICENSE.TXT.
+
+import time
+
+from jenkinsflow import jenkins_api
+from jenkinsflow.api_base import BuildResult, Progress
+
+from . import cfg as test_cfg
+from .cfg import ApiType
+from .framework.fake_jenkins import FakeJenkins
+
+
+def _invoke(api, job_name):
+    return api.get_job(job_name).invoke(securitytoken=None, build_params=None, cause=None, description=None)
+
+
+def _poll_until_done(api, invocations, timeout):
+    end = time.time() + timeout
+    while time.time() < end:
+        api.quick_poll()
+        if all(inv.status()[1] == Progress.IDLE for inv in invocations):
+            return
+        time.sleep(0.01)
+    raise Exception("Timeout waiting for " + repr(invocations))
+
+
+def test_adaptive_poll_long_build_polled_rarely():
+    if test_cfg.selected_api() != ApiType.JENKINS:
+        return
+
+    with FakeJenkins() as fake:
+        fake.job('long', queue_delay=0, exec_time=1.5)
+        fake.job('short', queue_delay=0, exec_time=0.2)
+        api = jenkins_api.Jenkins(fake.url, flow_scoped_poll=True, adaptive_poll_max_interval=10)
+        api.poll()
+        long_inv = _invoke(api, 'long')
+        short_inv = _invoke(api, 'short')
+
+        _poll_until_done(api, [short_inv], timeout=1)
+        assert short_inv.status() == (BuildResult.SUCCESS, Progress.IDLE)
+        assert long_inv.status() == (BuildResult.UNKNOWN, Progress.RUNNING)
+        short_polls = fake.request_paths().count('/job/short/api/json')
+        long_polls_while_short_ran = fake.request_paths().count('/job/long/api/json')
+        assert long_polls_while_short_ran < short_polls
+
+        # Detected long before adaptive_poll_max_interval after the build finished, although the build was rarely polled
+        _poll_until_done(api, [long_inv], timeout=3)
+        assert long_inv.status() == (BuildResult.SUCCESS, Progress.IDLE)
+        long_polls = fake.request_paths().count('/job/long/api/json')
+        assert long_polls < 25
+
+
+def test_adaptive_poll_listed_jobs_not_fetched_until_due():
+    if test_cfg.selected_api() != ApiType.JENKINS:
+        return
+
+    with FakeJenkins() as fake:
+        fake.job('j1', queue_delay=0, exec_time=1)
+        api = jenkins_api.Jenkins(fake.url, adaptive_poll_max_interval=0.2)
+        api.poll()
+        inv = _invoke(api, 'j1')
+
+        time.sleep(0.05)
+        api.quick_poll()
+        assert inv.status() == (BuildResult.UNKNOWN, Progress.RUNNING)
+
+        # Far from the end of the build, the job list is not fetched
+        del fake.requests[:]
+        for _ in range(10):
+            api.quick_poll()
+            time.sleep(0.01)
+        assert '/api/json' not in fake.request_paths()
+
+        # But it is fetched within the max interval
+        time.sleep(0.2)
+        api.quick_poll()
+        assert '/api/json' in fake.request_paths()
+
+        _poll_until_done(api, [inv], timeout=2)
+        assert inv.status() == (BuildResult.SUCCESS, Progress.IDLE)
@@ -0,0 +1,105 @@
+# Copyright (c) 2012 - 2015 Lars Hupfeldt Nielsen, Hupfeldt IT
+# All rights reserved. This work is under a BSD license, see LICENSE.TXT.
+
+import time
+
+from jenkinsflow import jenkins_api
+from jenkinsflow.api_base import BuildResult
+from jenkinsflow.flow import parallel
+
+from . import cfg as test_cfg
+from .cfg import ApiType
+from .framework.fake_jenkins import FakeJenkins, invoke_kwargs
+
+
+def test_free_executors():
+    if test_cfg.selected_api() != ApiType.JENKINS:
+        return
+
+    with FakeJenkins() as fake:
+        fake.executors = 3
+        fake.job('running', queue_delay=0, exec_time=100)
+        fake.job('queued', queue_delay=100, exec_time=100)
+        api = jenkins_api.Jenkins(fake.url)
+        api.poll()
+        assert api.free_executors() == 3
+
+        api.invoke_jobs([(api.get_job(job_name), invoke_kwargs()) for job_name in ('running', 'queued')])
+        time.sleep(0.05)
+        assert api.free_executors() == 1
+
+        fake.executors = 1
+        assert api.free_executors() == 0
+
+        # Agents provisioned on demand
+        fake.executors = 0
+        assert api.free_executors() is None
+
+
+def test_admission_control_holds_jobs_by_priority(capsys):
+    if test_cfg.selected_api() != ApiType.JENKINS:
+        return
+
+    with FakeJenkins() as fake:
+        fake.executors = 2
+        job_names = ['j' + repr(num) for num in range(5)]
+        for job_name in job_names:
+            fake.job(job_name, exec_time=0.3)
+        api = jenkins_api.Jenkins(fake.url)
+
+        with parallel(api, timeout=20, poll_interval=0.01, report_interval=0.1, admission_interval=0.02) as ctrl:
+            for job_name in job_names:
+                job = ctrl.invoke(job_name)
+                if job_name == 'j3':
+                    job.priority(5)
+                if job_name == 'j4':
+                    job.priority(10)
+
+        assert ctrl.result == BuildResult.SUCCESS
+        # Jenkins never had more builds in the queue than it had executors
+        assert fake.max_queue_length <= 2
+        invoked = [path.split('/')[2] for path in fake.request_paths('POST')]
+        assert sorted(invoked[:2]) == ['j3', 'j4']
+        assert sorted(invoked[2:4]) == ['j0', 'j1']
+        assert invoked[4] == 'j2'
+
+        sout, _ = capsys.readouterr()
+        assert "job: 'j2' Status QUEUED - Held by flow until Jenkins has a free executor" in sout
+
+
+def test_no_admission_control_queues_in_jenkins():
+    if test_cfg.selected_api() != ApiType.JENKINS:
+        return
+
+    with FakeJenkins() as fake:
+        fake.executors = 2
+        job_names = ['j' + repr(num) for num in range(5)]
+        for job_name in job_names:
+            fake.job(job_name, exec_time=0.1)
+        api = jenkins_api.Jenkins(fake.url)
+
+        with parallel(api, timeout=20, poll_interval=0.01) as ctrl:
+            for job_name in job_names:
+                ctrl.invoke(job_name)
+
+        assert ctrl.result == BuildResult.SUCCESS
+        assert fake.max_queue_length == 5
+
+
+def test_admission_control_no_executors():
+    if test_cfg.selected_api() != ApiType.JENKINS:
+        return
+
+    with FakeJenkins() as fake:
+        fake.executors = 0
+        job_names = ['j' + repr(num) for num in range(3)]
+        for job_name in job_names:
+            fake.job(job_name, exec_time=0.05)
+        api = jenkins_api.Jenkins(fake.url)
+
+        with parallel(api, timeout=20, poll_interval=0.01, admission_interval=0.02) as ctrl:
+            for job_name in job_names:
+                ctrl.invoke(job_name)
+
+        assert ctrl.result == BuildResult.SUCCESS
+        assert len(fake.request_paths('POST')) == 3
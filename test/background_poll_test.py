@@ -0,0 +1,63 @@
+# Copyright (c) 2012 - 2015 Lars Hupfeldt Nielsen, Hupfeldt IT
+# All rights reserved. This work is under a BSD license, see LICENSE.TXT.
+
+import time, threading
+
+from jenkinsflow import jenkins_api
+from jenkinsflow.api_base import BuildResult, Progress
+from jenkinsflow.flow import serial
+
+from . import cfg as test_cfg
+from .cfg import ApiType
+from .framework.fake_jenkins import FakeJenkins, request_threads
+
+
+def test_background_poll_slow_jenkins_does_not_block():
+    if test_cfg.selected_api() != ApiType.JENKINS:
+        return
+
+    with FakeJenkins() as fake:
+        fake.job('j1', queue_delay=0, exec_time=0.1)
+        api = jenkins_api.Jenkins(fake.url, background_poll=True)
+        api.poll()
+        job = api.get_job('j1')
+        inv = job.invoke(securitytoken=None, build_params=None, cause=None, description=None)
+
+        api.start_polling(0.01)
+        try:
+            fake.delay = 0.2
+            requests = request_threads(api)
+            for _ in range(5):
+                api.quick_poll()
+            # Only the background poller waits for Jenkins
+            assert threading.current_thread().name not in [thread_name for thread_name, _, _ in requests]
+
+            fake.delay = 0
+            for _ in range(100):
+                api.quick_poll()
+                if inv.status() == (BuildResult.SUCCESS, Progress.IDLE):
+                    break
+                time.sleep(0.02)
+            assert inv.status() == (BuildResult.SUCCESS, Progress.IDLE)
+        finally:
+            api.stop_polling()
+
+
+def test_background_poll_flow():
+    if test_cfg.selected_api() != ApiType.JENKINS:
+        return
+
+    with FakeJenkins() as fake:
+        fake.job('j1', exec_time=0.05)
+        fake.job('j2', exec_time=0.05, params=True)
+        api = jenkins_api.Jenkins(fake.url, background_poll=True)
+
+        with serial(api, timeout=20, poll_interval=0.01) as ctrl:
+            ctrl.invoke('j1')
+            ctrl.invoke('j2', force_result='SUCCESS')
+            # Second invocation of 'j1' in flow, invocation 1 is looked up through builds
+            ctrl.invoke('j1')
+
+        assert ctrl.result == BuildResult.SUCCESS
+        assert api._poller is None
+        assert [inv.build_number for inv in api.get_job('j1')._invocations.values()] == [1, 2]
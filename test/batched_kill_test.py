@@ -0,0 +1,89 @@
+# Copyright (c) 2012 - 2015 Lars Hupfeldt Nielsen, Hupfeldt IT
+# All rights reserved. This work is under a BSD license, see LICENSE.TXT.
+
+import time
+
+from jenkinsflow import jenkins_api
+from jenkinsflow.api_base import BuildResult, Progress
+from jenkinsflow.flow import parallel
+
+from . import cfg as test_cfg
+from .cfg import ApiType
+from .framework.fake_jenkins import FakeJenkins, invoke_kwargs
+
+
+def _start_builds(fake, api, job_names, queued_job_names):
+    for job_name in job_names:
+        fake.job(job_name, queue_delay=0, exec_time=100)
+    for job_name in queued_job_names:
+        fake.job(job_name, queue_delay=100, exec_time=100)
+    api.poll()
+    jobs = [api.get_job(job_name) for job_name in job_names + queued_job_names]
+    invocations = api.invoke_jobs([(job, invoke_kwargs()) for job in jobs])
+    # Start the builds which are not kept in the queue
+    time.sleep(0.05)
+    api.quick_poll()
+    return jobs, invocations
+
+
+def test_stop_all_jobs_concurrently():
+    if test_cfg.selected_api() != ApiType.JENKINS:
+        return
+
+    with FakeJenkins() as fake:
+        api = jenkins_api.Jenkins(fake.url, concurrent_requests=10)
+        jobs, invocations = _start_builds(fake, api, ['r' + repr(num) for num in range(6)], ['q' + repr(num) for num in range(4)])
+
+        fake.delay = 0.1
+        api.queue_poll()
+        del fake.requests[:]
+        cancelled, stopped = api.stop_all_jobs(jobs)
+        # One request for the running builds of all jobs, then all the cancel and stop requests at the same time
+        assert fake.max_concurrent_requests == 10
+        assert (cancelled, stopped) == (4, 6)
+        assert fake.request_paths() == ['/computer/api/json']
+        assert len(fake.request_paths('POST')) == 10
+
+        fake.delay = 0
+        api.quick_poll()
+        assert [inv.status()[0] for inv in invocations[:6]] == [BuildResult.ABORTED] * 6
+        assert not fake.queue
+
+
+def test_stop_invocations_concurrently():
+    if test_cfg.selected_api() != ApiType.JENKINS:
+        return
+
+    with FakeJenkins() as fake:
+        api = jenkins_api.Jenkins(fake.url, concurrent_requests=10)
+        _, invocations = _start_builds(fake, api, ['r' + repr(num) for num in range(6)], [])
+
+        fake.delay = 0.1
+        api.stop_invocations(invocations, dequeue=False)
+        assert fake.max_concurrent_requests == 6
+
+        fake.delay = 0
+        api.quick_poll()
+        assert all(inv.status() == (BuildResult.ABORTED, Progress.IDLE) for inv in invocations)
+
+
+def test_kill_all_flow_batched(capsys):
+    if test_cfg.selected_api() != ApiType.JENKINS:
+        return
+
+    with FakeJenkins() as fake:
+        api = jenkins_api.Jenkins(fake.url, concurrent_requests=10)
+        job_names = ['r' + repr(num) for num in range(5)]
+        _start_builds(fake, api, job_names, ['q1'])
+
+        with parallel(api, timeout=20, poll_interval=0.01, kill_all=True) as ctrl:
+            for job_name in job_names + ['q1']:
+                ctrl.invoke(job_name)
+
+        sout, _ = capsys.readouterr()
+        assert "Kill sent for 6 jobs, removed 1 queued and aborted 5 running builds," in sout
+        for job_name in job_names:
+            assert fake.jobs[job_name].builds[1][0] == 'ABORTED'
+        assert not fake.queue
+        # One stop per build, not repeated by the individual jobs
+        assert len(fake.request_paths('POST')) == 6 + 6
@@ -0,0 +1,84 @@
+# Copyright (c) 2012 - 2015 Lars Hupfeldt Nielsen, Hupfeldt IT
+# All rights reserved. This work is under a BSD license, see LICENSE.TXT.
+
+import time
+
+from jenkinsflow import jenkins_api
+from jenkinsflow.api_base import BuildResult, Progress
+
+from . import cfg as test_cfg
+from .cfg import ApiType
+from .framework.fake_jenkins import FakeJenkins
+
+
+def _history(num_builds):
+    return [(num, 'SUCCESS') for num in range(1, num_builds + 1)]
+
+
+def _builds_queries(fake):
+    return [query for method, path, query in fake.requests if method == 'GET' and path == '/job/j1/api/json' and 'builds' in query]
+
+
+def test_builds_fetched_in_widening_ranges():
+    if test_cfg.selected_api() != ApiType.JENKINS:
+        return
+
+    with FakeJenkins() as fake:
+        fake.job('j1', builds=_history(100))
+        api = jenkins_api.Jenkins(fake.url)
+        api.builds_window = 4
+
+        builds = api._fetch_builds('j1', 98)  # pylint: disable=protected-access
+        assert sorted(builds) == [97, 98, 99, 100]
+        assert len(_builds_queries(fake)) == 1
+
+        del fake.requests[:]
+        builds = api._fetch_builds('j1', 85)  # pylint: disable=protected-access
+        # Ranges {0,4}, {4,12}, {12,28}
+        assert len(builds) == 28
+        assert len(_builds_queries(fake)) == 3
+
+        del fake.requests[:]
+        builds = api._fetch_builds('j1', 0)  # pylint: disable=protected-access
+        assert sorted(builds) == range(1, 101)
+
+
+def test_invocation_status_reads_only_recent_builds():
+    if test_cfg.selected_api() != ApiType.JENKINS:
+        return
+
+    with FakeJenkins() as fake:
+        fake.job('j1', queue_delay=0, exec_time=0.2, builds=_history(1000))
+        api = jenkins_api.Jenkins(fake.url)
+        api.poll()
+        job = api.get_job('j1')
+        invocations = [job.invoke(securitytoken=None, build_params=None, cause=None, description=None) for _ in range(2)]
+        time.sleep(0.05)
+        api.quick_poll()
+        assert [inv.build_number for inv in invocations] == [1001, 1002]
+
+        del fake.requests[:]
+        assert invocations[0].status() == (BuildResult.UNKNOWN, Progress.RUNNING)
+        assert _builds_queries(fake) == ['tree=builds%5Bnumber%2Cresult%5D%7B0%2C16%7D']
+
+
+def test_stop_all_reads_running_builds():
+    if test_cfg.selected_api() != ApiType.JENKINS:
+        return
+
+    with FakeJenkins() as fake:
+        fake.job('j1', queue_delay=0, exec_time=100, builds=_history(1000))
+        fake.job('j2', queue_delay=0, exec_time=100)
+        api = jenkins_api.Jenkins(fake.url)
+        api.poll()
+        for job_name in ('j1', 'j2'):
+            api.get_job(job_name).invoke(securitytoken=None, build_params=None, cause=None, description=None)
+        time.sleep(0.05)
+
+        api.queue_poll()
+        del fake.requests[:]
+        api.get_job('j1').stop_all()
+        assert fake.request_paths() == ['/computer/api/json']
+        assert fake.request_paths('POST') == ['/job/j1/1001/stop']
+        assert fake.jobs['j1'].builds[1001][0] == 'ABORTED'
+        assert fake.jobs['j2'].builds[1][0] is None
@@ -0,0 +1,38 @@
+# Copyright (c) 2012 - 2015 Lars Hupfeldt Nielsen, Hupfeldt IT
+# All rights reserved. This work is under a BSD license, see LICENSE.TXT.
+
+import time
+
+from jenkinsflow import jenkins_api
+from jenkinsflow.api_base import BuildResult, Progress
+
+from . import cfg as test_cfg
+from .cfg import ApiType
+from .framework.fake_jenkins import FakeJenkins
+
+
+def test_builds_snapshot_one_request_per_job_per_poll():
+    if test_cfg.selected_api() != ApiType.JENKINS:
+        return
+
+    with FakeJenkins() as fake:
+        fake.job('j1', queue_delay=0, exec_time=0.2)
+
+        api = jenkins_api.Jenkins(fake.url)
+        api.poll()
+        job = api.get_job('j1')
+        invocations = [job.invoke(securitytoken=None, build_params=None, cause=None, description=None) for _ in range(3)]
+        time.sleep(0.05)
+        api.quick_poll()
+        assert [inv.build_number for inv in invocations] == [1, 2, 3]
+
+        del fake.requests[:]
+        assert [inv.status() for inv in invocations] == [(BuildResult.UNKNOWN, Progress.RUNNING)] * 3
+        assert [inv.status() for inv in invocations] == [(BuildResult.UNKNOWN, Progress.RUNNING)] * 3
+        assert fake.request_paths() == ['/job/j1/api/json']
+
+        time.sleep(0.3)
+        api.quick_poll()
+        del fake.requests[:]
+        assert [inv.status() for inv in invocations] == [(BuildResult.SUCCESS, Progress.IDLE)] * 3
+        assert fake.request_paths() == ['/job/j1/api/json']
@@ -0,0 +1,118 @@
+# Copyright (c) 2012 - 2015 Lars Hupfeldt Nielsen, Hupfeldt IT
+# All rights reserved. This work is under a BSD license, see LICENSE.TXT.
+
+import time
+
+from jenkinsflow import jenkins_api
+from jenkinsflow.api_base import BuildResult, Progress, UnknownJobException
+from jenkinsflow.flow import parallel
+
+from . import cfg as test_cfg
+from .cfg import ApiType
+from .framework.fake_jenkins import FakeJenkins, invoke_kwargs
+
+
+def _wait_for_builds(api, invocations):
+    for _ in range(200):
+        api.quick_poll()
+        if all(inv.status()[1] == Progress.IDLE for inv in invocations):
+            return
+        time.sleep(0.01)
+    raise Exception("Timeout waiting for " + repr(invocations))
+
+
+def test_bulk_trigger_one_request():
+    if test_cfg.selected_api() != ApiType.JENKINS:
+        return
+
+    with FakeJenkins() as fake:
+        job_names = ['j' + repr(num) for num in range(20)]
+        for job_name in job_names:
+            fake.job(job_name, params=job_name == 'j1')
+        fake.job('gone')
+        api = jenkins_api.Jenkins(fake.url, bulk_trigger=True)
+        api.poll()
+        jobs = [api.get_job(job_name) for job_name in job_names + ['gone']]
+        fake.delete_job('gone')
+
+        del fake.requests[:]
+        results = api.invoke_jobs([(job, invoke_kwargs({'force_result': 'SUCCESS'} if job.name == 'j1' else None, cause="Because")) for job in jobs])
+        # The job which could not be triggered by the script is invoked directly, to get the error
+        assert fake.request_paths('POST') == ['/scriptText', '/job/gone/build']
+        assert isinstance(results[-1], UnknownJobException)
+
+        invocations = results[:-1]
+        assert [inv.job.name for inv in invocations] == job_names
+        assert [inv.queued_item_path for inv in invocations] == ['/queue/item/' + repr(qid) + '/api/json' for qid in range(1, 21)]
+
+        _wait_for_builds(api, invocations)
+        assert all(inv.status() == (BuildResult.SUCCESS, Progress.IDLE) for inv in invocations)
+
+
+def test_bulk_trigger_not_allowed_falls_back():
+    if test_cfg.selected_api() != ApiType.JENKINS:
+        return
+
+    with FakeJenkins() as fake:
+        fake.script_console = False
+        fake.job('j1')
+        fake.job('j2')
+        api = jenkins_api.Jenkins(fake.url, bulk_trigger=True)
+        api.poll()
+        jobs = [api.get_job('j1'), api.get_job('j2')]
+
+        del fake.requests[:]
+        invocations = api.invoke_jobs([(job, invoke_kwargs(cause="Because")) for job in jobs])
+        assert fake.request_paths('POST') == ['/scriptText', '/job/j1/build', '/job/j2/build']
+
+        # The script console is not tried again
+        del fake.requests[:]
+        invocations = api.invoke_jobs([(job, invoke_kwargs(cause="Because")) for job in jobs])
+        assert fake.request_paths('POST') == ['/job/j1/build', '/job/j2/build']
+
+        _wait_for_builds(api, invocations)
+        assert all(inv.status() == (BuildResult.SUCCESS, Progress.IDLE) for inv in invocations)
+
+
+def test_bulk_trigger_script_failure_does_not_invoke_again():
+    if test_cfg.selected_api() != ApiType.JENKINS:
+        return
+
+    with FakeJenkins() as fake:
+        fake.script_fails_after = 1
+        fake.job('j1', queue_delay=100)
+        fake.job('j2', queue_delay=100)
+        api = jenkins_api.Jenkins(fake.url, bulk_trigger=True)
+        api.poll()
+        jobs = [api.get_job('j1'), api.get_job('j2')]
+
+        del fake.requests[:]
+        results = api.invoke_jobs([(job, invoke_kwargs(cause="Because")) for job in jobs])
+        # j1 was queued before the script failed, it must not be queued twice
+        assert fake.request_paths('POST') == ['/scriptText']
+        assert len(fake.queue) == 1
+        assert all(isinstance(result, ValueError) for result in results)
+        assert "MissingMethodException" in str(results[0])
+
+        # The script console is not tried again
+        del fake.requests[:]
+        api.invoke_jobs([(job, invoke_kwargs(cause="Because")) for job in jobs])
+        assert fake.request_paths('POST') == ['/job/j1/build', '/job/j2/build']
+
+
+def test_bulk_trigger_parallel_flow():
+    if test_cfg.selected_api() != ApiType.JENKINS:
+        return
+
+    with FakeJenkins() as fake:
+        job_names = ['j' + repr(num) for num in range(5)]
+        for job_name in job_names:
+            fake.job(job_name)
+        api = jenkins_api.Jenkins(fake.url, bulk_trigger=True)
+
+        with parallel(api, timeout=20, poll_interval=0.01) as ctrl:
+            for job_name in job_names:
+                ctrl.invoke(job_name)
+
+        assert ctrl.result == BuildResult.SUCCESS
+        assert fake.request_paths('POST') == ['/scriptText']
@@ -0,0 +1,131 @@
+# Copyright (c) 2012 - 2015 Lars Hupfeldt Nielsen, Hupfeldt IT
+# All rights reserved. This work is under a BSD license, see LICENSE.TXT.
+
+import os, re, signal
+
+from jenkinsflow import jenkins_api
+from jenkinsflow.transport import RequestFailed
+from jenkinsflow.api_base import BuildResult, UnknownJobException
+from jenkinsflow.flow import parallel
+
+from . import cfg as test_cfg
+from .cfg import ApiType
+from .framework.fake_jenkins import FakeJenkins, invoke_kwargs
+
+
+def test_invoke_jobs_concurrently():
+    if test_cfg.selected_api() != ApiType.JENKINS:
+        return
+
+    with FakeJenkins() as fake:
+        job_names = ['j' + repr(num) for num in range(10)]
+        for job_name in job_names:
+            fake.job(job_name, queue_delay=100)
+        api = jenkins_api.Jenkins(fake.url, concurrent_requests=10)
+        api.poll()
+        jobs = [api.get_job(job_name) for job_name in job_names]
+
+        fake.delay = 0.1
+        invocations = api.invoke_jobs([(job, invoke_kwargs()) for job in jobs])
+        # One round trip, not ten
+        assert fake.max_concurrent_requests == 10
+
+        assert [inv.job.name for inv in invocations] == job_names
+        assert len(set(inv.queued_item_path for inv in invocations)) == 10
+        assert len(api._queued_invocations) == 10  # pylint: disable=protected-access
+
+
+def test_invoke_jobs_concurrently_failures():
+    if test_cfg.selected_api() != ApiType.JENKINS:
+        return
+
+    with FakeJenkins() as fake:
+        fake.job('j1')
+        fake.job('gone')
+        api = jenkins_api.Jenkins(fake.url, concurrent_requests=4)
+        api.poll()
+        jobs = [api.get_job('j1'), api.get_job('gone')]
+        fake.delete_job('gone')
+
+        inv, ex = api.invoke_jobs([(job, invoke_kwargs()) for job in jobs])
+        assert inv.job.name == 'j1'
+        assert isinstance(ex, UnknownJobException)
+
+
+def test_invoke_jobs_failed_trigger_not_sent_again():
+    if test_cfg.selected_api() != ApiType.JENKINS:
+        return
+
+    with FakeJenkins() as fake:
+        fake.job('j1')
+        fake.job('j2')
+        # Jenkins may have queued the build before failing, triggering again could build twice
+        fake.trigger_error = 503
+        for concurrent_requests, job_names in ((4, ['j1', 'j2']), (1, ['j1'])):
+            api = jenkins_api.Jenkins(fake.url, concurrent_requests=concurrent_requests)
+            api.poll()
+            del fake.requests[:]
+            results = api.invoke_jobs([(api.get_job(job_name), invoke_kwargs()) for job_name in job_names])
+            assert all(isinstance(result, RequestFailed) and result.status_int == 503 for result in results)
+            assert sorted(fake.request_paths('POST')) == ['/job/' + job_name + '/build' for job_name in job_names]
+
+
+def test_parallel_flow_invokes_concurrently_in_order(capsys):
+    if test_cfg.selected_api() != ApiType.JENKINS:
+        return
+
+    with FakeJenkins() as fake:
+        job_names = ['j' + repr(num) for num in range(8)]
+        for job_name in job_names:
+            fake.job(job_name, exec_time=0.05)
+        api = jenkins_api.Jenkins(fake.url, concurrent_requests=8)
+
+        fake.delay = 0.05
+        with parallel(api, timeout=20, poll_interval=0.01) as ctrl:
+            for job_name in job_names:
+                ctrl.invoke(job_name)
+
+        assert ctrl.result == BuildResult.SUCCESS
+        sout, _ = capsys.readouterr()
+        invoked = re.findall(r"^Invoking Job .*/job/(j\d)", sout, re.MULTILINE)
+        assert invoked == job_names
+
+
+def test_parallel_flow_kill_stops_triggered_builds(capsys, monkeypatch):
+    if test_cfg.selected_api() != ApiType.JENKINS:
+        return
+
+    with FakeJenkins() as fake:
+        job_names = ['a', 'b', 'c']
+        for job_name in job_names:
+            fake.job(job_name, queue_delay=0, exec_time=100)
+        api = jenkins_api.Jenkins(fake.url, concurrent_requests=3)
+
+        # SIGTERM after the parallel flow triggered the builds, but before the jobs picked up the invocations
+        invoke_jobs = api.invoke_jobs
+        triggered = []
+
+        def invoke_jobs_then_kill(job_kwargs):
+            invocations = invoke_jobs(job_kwargs)
+            triggered.append(True)
+            return invocations
+
+        api.invoke_jobs = invoke_jobs_then_kill
+        job_poll = jenkins_api.ApiJob.poll
+
+        def poll(self):
+            if triggered and triggered.pop():
+                os.kill(os.getpid(), signal.SIGTERM)
+            job_poll(self)
+
+        monkeypatch.setattr(jenkins_api.ApiJob, 'poll', poll)
+
+        with parallel(api, timeout=20, poll_interval=0.01) as ctrl:
+            for job_name in job_names:
+                ctrl.invoke(job_name)
+
+        sout, _ = capsys.readouterr()
+        assert "Not invoked" not in sout
+        for job_name in job_names:
+            assert "Killing build: " + repr(job_name) in sout
+            assert fake.jobs[job_name].builds[1][0] == 'ABORTED'
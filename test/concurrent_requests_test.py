@@ -0,0 +1,72 @@
+# Copyright (c) 2012 - 2015 Lars Hupfeldt Nielsen, Hupfeldt IT
+# All rights reserved. This work is under a BSD license, see LICENSE.TXT.
+
+import time, threading
+from multiprocessing.pool import ThreadPool
+
+from jenkinsflow import jenkins_api
+from jenkinsflow.api_base import BuildResult
+from jenkinsflow.flow import parallel
+
+from . import cfg as test_cfg
+from .cfg import ApiType
+from .framework.fake_jenkins import FakeJenkins
+
+
+def test_concurrent_requests_poll_time():
+    if test_cfg.selected_api() != ApiType.JENKINS:
+        return
+
+    with FakeJenkins() as fake:
+        names = ['j' + str(num) for num in range(5)]
+        for name in names:
+            fake.job(name)
+
+        api = jenkins_api.Jenkins(fake.url, flow_scoped_poll=True, concurrent_requests=5)
+        api.poll()
+        for name in names:
+            api.get_job(name)
+
+        fake.delay = 0.1
+        api.quick_poll()
+        assert fake.max_concurrent_requests == 5
+        assert sorted(fake.request_paths()[-5:]) == ['/job/' + name + '/api/json' for name in names]
+
+
+def test_concurrent_requests_flow():
+    if test_cfg.selected_api() != ApiType.JENKINS:
+        return
+
+    with FakeJenkins() as fake:
+        for name in ('j1', 'j2', 'j3'):
+            fake.job(name, exec_time=0.05)
+        api = jenkins_api.Jenkins(fake.url, concurrent_requests=4)
+
+        with parallel(api, timeout=20, poll_interval=0.01) as ctrl:
+            ctrl.invoke('j1')
+            ctrl.invoke('j2')
+            ctrl.invoke('j3')
+            ctrl.invoke('j1')
+
+        assert ctrl.result == BuildResult.SUCCESS
+
+
+def test_concurrent_requests_one_pool(monkeypatch):
+    created = []
+
+    class SlowThreadPool(ThreadPool):
+        def __init__(self, processes):
+            time.sleep(0.05)
+            created.append(self)
+            super(SlowThreadPool, self).__init__(processes)
+
+    monkeypatch.setattr(jenkins_api, 'ThreadPool', SlowThreadPool)
+    api = jenkins_api.Jenkins('http://localhost:1', concurrent_requests=2)
+
+    # The flow, the background poller and the description writer may all be first to use the pool
+    threads = [threading.Thread(target=api._map, args=(abs, [-1, -2])) for _ in range(4)]  # pylint: disable=protected-access
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(created) == 1
@@ -0,0 +1,126 @@
+# Copyright (c) 2012 - 2015 Lars Hupfeldt Nielsen, Hupfeldt IT
+# All rights reserved. This work is under a BSD license, see LICENSE.TXT.
+
+from pytest import raises
+
+from jenkinsflow import jenkins_api
+from jenkinsflow.api_base import BuildResult
+from jenkinsflow.flow import parallel
+from jenkinsflow.transport import Unauthorized
+
+from . import cfg as test_cfg
+from .cfg import ApiType
+from .framework.fake_jenkins import FakeJenkins, invoke_kwargs
+
+
+def _invoke(api, job_names):
+    return api.invoke_jobs([(api.get_job(job_name), invoke_kwargs()) for job_name in job_names])
+
+
+def test_crumb_fetched_once():
+    if test_cfg.selected_api() != ApiType.JENKINS:
+        return
+
+    with FakeJenkins() as fake:
+        fake.crumb = 'abc'
+        job_names = ['j' + repr(num) for num in range(10)]
+        for job_name in job_names:
+            fake.job(job_name)
+        api = jenkins_api.Jenkins(fake.url, concurrent_requests=4)
+        api.poll()
+
+        del fake.requests[:]
+        invocations = _invoke(api, job_names)
+        assert [inv.job.name for inv in invocations] == job_names
+        assert fake.request_paths() == ['/crumbIssuer/api/json']
+        assert len(fake.request_paths('POST')) == 10
+
+
+def test_crumb_refreshed_when_rejected():
+    if test_cfg.selected_api() != ApiType.JENKINS:
+        return
+
+    with FakeJenkins() as fake:
+        fake.crumb = 'abc'
+        fake.job('j1')
+        api = jenkins_api.Jenkins(fake.url)
+        api.poll()
+        _invoke(api, ['j1'])
+
+        # E.g. Jenkins was restarted
+        fake.crumb = 'def'
+        del fake.requests[:]
+        _invoke(api, ['j1'])
+        assert fake.request_paths() == ['/crumbIssuer/api/json']
+        assert fake.request_paths('POST') == ['/job/j1/build', '/job/j1/build']
+
+
+def test_crumb_requests_within_budget():
+    if test_cfg.selected_api() != ApiType.JENKINS:
+        return
+
+    class RecordingBudget(jenkins_api.RequestBudget):
+        def __init__(self, rate):
+            super(RecordingBudget, self).__init__(rate)
+            self.priorities = []
+
+        def acquire(self, priority=jenkins_api.RequestBudget.NORMAL):
+            self.priorities.append(priority)
+            super(RecordingBudget, self).acquire(priority)
+
+    with FakeJenkins() as fake:
+        fake.crumb = 'abc'
+        fake.job('j1')
+        budget = RecordingBudget(1000)
+        api = jenkins_api.Jenkins(fake.url, request_budget=budget)
+        api.poll()
+
+        fake.crumb = 'def'
+        api._crumb = {'Jenkins-Crumb': 'abc'}  # pylint: disable=protected-access
+        del fake.requests[:]
+        del budget.priorities[:]
+        _invoke(api, ['j1'])
+        # Rejected POST, crumb and retried POST, all urgent and all counted
+        assert fake.request_paths() == ['/crumbIssuer/api/json']
+        assert len(fake.request_paths('POST')) == 2
+        assert budget.priorities == [jenkins_api.RequestBudget.URGENT] * 3
+
+
+def test_no_crumb_issuer():
+    if test_cfg.selected_api() != ApiType.JENKINS:
+        return
+
+    with FakeJenkins() as fake:
+        fake.script_console = False
+        fake.job('j1')
+        api = jenkins_api.Jenkins(fake.url)
+        api.poll()
+
+        del fake.requests[:]
+        _invoke(api, ['j1'])
+        _invoke(api, ['j1'])
+        assert fake.request_paths() == ['/crumbIssuer/api/json']
+
+        # Forbidden for other reasons
+        with raises(Unauthorized):
+            api.post('/scriptText', payload={'script': 'println 1'})
+
+
+def test_crumb_flow():
+    if test_cfg.selected_api() != ApiType.JENKINS:
+        return
+
+    with FakeJenkins() as fake:
+        fake.crumb = 'abc'
+        job_names = ['j' + repr(num) for num in range(4)]
+        for job_name in job_names:
+            fake.job(job_name)
+        api = jenkins_api.Jenkins(fake.url, concurrent_requests=4)
+
+        with parallel(api, timeout=20, poll_interval=0.01, description="Flow") as ctrl:
+            for job_name in job_names:
+                ctrl.invoke(job_name)
+
+        assert ctrl.result == BuildResult.SUCCESS
+        assert fake.request_paths().count('/crumbIssuer/api/json') == 1
+        assert [fake.jobs[job_name].descriptions for job_name in job_names] == [{1: "Flow"}] * 4
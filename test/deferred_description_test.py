@@ -0,0 +1,135 @@
+# Copyright (c) 2012 - 2015 Lars Hupfeldt Nielsen, Hupfeldt IT
+# All rights reserved. This work is under a BSD license, see LICENSE.TXT.
+
+import time, threading
+
+import bottle
+from pytest import raises
+
+from jenkinsflow import jenkins_api
+from jenkinsflow.api_base import BuildResult
+from jenkinsflow.flow import parallel, JobControlFailException
+
+from . import cfg as test_cfg
+from .cfg import ApiType
+from .framework.fake_jenkins import FakeJenkins, request_threads
+
+
+def _slow_descriptions(fake, delay, failures=0):
+    """Make description writes take 'delay' seconds, and fail the first 'failures' times"""
+    failed = []
+
+    @fake.app.post('/job/<name>/<num:int>/submitDescription')
+    def submit_description(name, num):
+        time.sleep(delay)
+        if len(failed) < failures:
+            failed.append(num)
+            bottle.abort(503, "Busy")
+        with fake.lock:
+            fake.jobs[name].descriptions[num] = bottle.request.forms.description
+        return ''
+
+
+def _invoke_and_resolve(api, job_name, description):
+    inv = api.get_job(job_name).invoke(securitytoken=None, build_params=None, cause=None, description=description)
+    for _ in range(100):
+        api.quick_poll()
+        if inv.build_number is not None:
+            return inv
+        time.sleep(0.01)
+    raise Exception("Not started: " + repr(inv))
+
+
+def test_deferred_description_does_not_delay_poll():
+    if test_cfg.selected_api() != ApiType.JENKINS:
+        return
+
+    with FakeJenkins() as fake:
+        fake.job('j1', queue_delay=0.02, exec_time=100)
+        _slow_descriptions(fake, delay=0.3, failures=1)
+        api = jenkins_api.Jenkins(fake.url, deferred_descriptions=True, concurrent_requests=4)
+        api._description_writer.retry_delay = 0.01  # pylint: disable=protected-access
+        api.poll()
+        requests = request_threads(api)
+
+        inv = _invoke_and_resolve(api, 'j1', "Hello")
+        assert fake.jobs['j1'].descriptions == {}
+
+        # Written after a retry, by the description writer
+        api.flush()
+        assert fake.jobs['j1'].descriptions == {inv.build_number: "Hello"}
+        description_threads = set(thread_name for thread_name, _, path in requests if path.endswith('/submitDescription'))
+        assert threading.current_thread().name not in description_threads
+
+
+def test_deferred_description_failure_raised_by_flush():
+    if test_cfg.selected_api() != ApiType.JENKINS:
+        return
+
+    with FakeJenkins() as fake:
+        fake.job('j1', queue_delay=0.02, exec_time=100)
+        _slow_descriptions(fake, delay=0, failures=3)
+        api = jenkins_api.Jenkins(fake.url, deferred_descriptions=True)
+        api._description_writer.retry_delay = 0.01  # pylint: disable=protected-access
+        api.poll()
+
+        _invoke_and_resolve(api, 'j1', "Hello")
+        with raises(jenkins_api.RequestFailed):
+            api.flush()
+        # Raised once
+        api.flush()
+
+
+def test_deferred_description_flushed_by_flow():
+    if test_cfg.selected_api() != ApiType.JENKINS:
+        return
+
+    with FakeJenkins() as fake:
+        job_names = ['j' + repr(num) for num in range(4)]
+        for job_name in job_names:
+            fake.job(job_name, exec_time=0.01)
+        _slow_descriptions(fake, delay=0.2)
+        api = jenkins_api.Jenkins(fake.url, deferred_descriptions=True, concurrent_requests=4)
+
+        with parallel(api, timeout=20, poll_interval=0.01, description="Flow") as ctrl:
+            for job_name in job_names:
+                ctrl.invoke(job_name)
+
+        assert ctrl.result == BuildResult.SUCCESS
+        assert [fake.jobs[job_name].descriptions for job_name in job_names] == [{1: "Flow"}] * 4
+
+
+def test_deferred_description_flush_timeout():
+    if test_cfg.selected_api() != ApiType.JENKINS:
+        return
+
+    with FakeJenkins() as fake:
+        fake.job('j1', queue_delay=0.02, exec_time=100)
+        _slow_descriptions(fake, delay=1)
+        api = jenkins_api.Jenkins(fake.url, deferred_descriptions=True)
+        api.poll()
+
+        _invoke_and_resolve(api, 'j1', "Hello")
+        with raises(Exception) as exinfo:
+            api.flush(timeout=0.1)
+        assert "Timeout" in str(exinfo.value)
+
+
+def test_deferred_description_failure_does_not_hide_flow_failure(capsys):
+    if test_cfg.selected_api() != ApiType.JENKINS:
+        return
+
+    with FakeJenkins() as fake:
+        fake.job('j1', exec_time=0.01, result='FAILURE')
+        fake.job('j2', exec_time=0.01)
+        _slow_descriptions(fake, delay=0, failures=6)
+        api = jenkins_api.Jenkins(fake.url, deferred_descriptions=True)
+        api._description_writer.retry_delay = 0.01  # pylint: disable=protected-access
+
+        with raises(JobControlFailException):
+            with parallel(api, timeout=20, poll_interval=0.01, description="Flow") as ctrl:
+                ctrl.invoke('j1')
+                ctrl.invoke('j2')
+
+        sout, _ = capsys.readouterr()
+        assert "ERROR: Failed writing build descriptions:" in sout
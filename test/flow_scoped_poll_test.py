@@ -0,0 +1,68 @@
+# Copyright (c) 2012 - 2015 Lars Hupfeldt Nielsen, Hupfeldt IT
+# All rights reserved. This work is under a BSD license, see LICENSE.TXT.
+
+from jenkinsflow import jenkins_api
+from jenkinsflow.flow import parallel
+
+from . import cfg as test_cfg
+from .cfg import ApiType
+from .framework.fake_jenkins import FakeJenkins
+
+
+def test_flow_scoped_poll_only_flow_jobs():
+    if test_cfg.selected_api() != ApiType.JENKINS:
+        return
+
+    with FakeJenkins() as fake:
+        for name in ('a', 'b', 'other1', 'other2'):
+            fake.job(name, builds=[(1, 'SUCCESS')])
+
+        api = jenkins_api.Jenkins(fake.url, flow_scoped_poll=True)
+        api.poll()
+        api.get_job('a')
+        api.get_job('b')
+
+        del fake.requests[:]
+        api.quick_poll()
+        assert fake.request_paths() == ['/job/a/api/json', '/job/b/api/json']
+
+
+def test_flow_scoped_poll_job_created_during_flow():
+    if test_cfg.selected_api() != ApiType.JENKINS:
+        return
+
+    with FakeJenkins() as fake:
+        api = jenkins_api.Jenkins(fake.url, flow_scoped_poll=True)
+        api.poll()
+        try:
+            api.get_job('late')
+            assert False, "Job should not exist yet"
+        except jenkins_api.UnknownJobException:
+            pass
+
+        api.quick_poll()
+        fake.job('late', params=True, builds=[(3, 'FAILURE')])
+        api.quick_poll()
+
+        job = api.get_job('late')
+        assert job.job_status() == (jenkins_api.BuildResult.FAILURE, jenkins_api.Progress.IDLE, 3)
+        assert job._build_trigger_path == '/job/late/buildWithParameters'
+
+
+def test_flow_scoped_poll_flow():
+    if test_cfg.selected_api() != ApiType.JENKINS:
+        return
+
+    with FakeJenkins() as fake:
+        fake.job('j1')
+        fake.job('j2', params=True)
+        fake.job('not_in_flow')
+
+        api = jenkins_api.Jenkins(fake.url, flow_scoped_poll=True)
+        with parallel(api, timeout=20, poll_interval=0.01) as ctrl:
+            ctrl.invoke('j1')
+            ctrl.invoke('j2', force_result='SUCCESS')
+
+        assert ctrl.result == jenkins_api.BuildResult.SUCCESS
+        assert fake.request_paths().count('/api/json') == 1
+        assert '/job/not_in_flow/api/json' not in fake.request_paths()
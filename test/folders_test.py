@@ -0,0 +1,100 @@
+# Copyright (c) 2012 - 2015 Lars Hupfeldt Nielsen, Hupfeldt IT
+# All rights reserved. This work is under a BSD license, see LICENSE.TXT.
+
+import json, time
+
+from jenkinsflow import jenkins_api
+from jenkinsflow.api_base import BuildResult, job_path, job_name_from_url
+from jenkinsflow.flow import parallel
+from jenkinsflow.notifications import notification_payload
+
+from . import cfg as test_cfg
+from .cfg import ApiType
+from .framework.fake_jenkins import FakeJenkins, invoke_kwargs
+
+
+def _folder_jobs(fake, **kwargs):
+    for job_name in ('top', 'team/a', 'team/sub/b', 'other/c', 'other/d'):
+        fake.job(job_name, **kwargs)
+
+
+def test_job_path_and_name():
+    assert job_path('j1') == '/job/j1'
+    assert job_path('team/sub/b') == '/job/team/job/sub/job/b'
+    assert job_name_from_url('http://localhost:8080/job/team/job/sub/job/b/') == 'team/sub/b'
+    assert job_name_from_url('job/team/job/a%20b/3/') == 'team/a b'
+    assert job_name_from_url(json.loads(notification_payload('team/a', 3, 'STARTED'))['build']['url']) == 'team/a'
+
+
+def test_get_job_in_folder():
+    if test_cfg.selected_api() != ApiType.JENKINS:
+        return
+
+    with FakeJenkins() as fake:
+        _folder_jobs(fake)
+        api = jenkins_api.Jenkins(fake.url)
+        api.poll()
+
+        job = api.get_job('team/sub/b')
+        assert job.name == 'team/sub/b'
+        assert job.public_uri == fake.url + '/job/team/job/sub/job/b'
+        assert '/job/team/job/sub/job/b/api/json' in fake.request_paths()
+
+
+def test_poll_only_folders_in_flow():
+    if test_cfg.selected_api() != ApiType.JENKINS:
+        return
+
+    with FakeJenkins() as fake:
+        _folder_jobs(fake, exec_time=100)
+        api = jenkins_api.Jenkins(fake.url, concurrent_requests=4)
+        api.poll()
+        jobs = [api.get_job(job_name) for job_name in ('top', 'team/a', 'team/sub/b')]
+        invocations = api.invoke_jobs([(job, invoke_kwargs()) for job in jobs])
+
+        del fake.requests[:]
+        for _ in range(100):
+            api.quick_poll()
+            if all(inv.build_number is not None for inv in invocations):
+                break
+            time.sleep(0.01)
+        assert [inv.build_number for inv in invocations] == [1, 1, 1]
+
+        polled = set(path for path in fake.request_paths() if not path.startswith('/queue/'))
+        assert polled == set(['/api/json', '/job/team/api/json', '/job/team/job/sub/api/json'])
+
+        api.queue_poll()
+        cancelled, stopped = api.stop_all_jobs(jobs)
+        assert (cancelled, stopped) == (0, 3)
+        assert [fake.jobs[job_name].builds[1][0] for job_name in ('top', 'team/a', 'team/sub/b')] == ['ABORTED'] * 3
+
+
+def test_queue_poll_folder_job_names():
+    if test_cfg.selected_api() != ApiType.JENKINS:
+        return
+
+    with FakeJenkins() as fake:
+        fake.job('team/a', queue_delay=100)
+        api = jenkins_api.Jenkins(fake.url)
+        api.poll()
+        api.get_job('team/a').invoke(**invoke_kwargs())
+
+        api.queue_poll()
+        assert api.queue_items == {'team/a': [1]}
+
+
+def test_flow_with_folder_jobs():
+    if test_cfg.selected_api() != ApiType.JENKINS:
+        return
+
+    with FakeJenkins() as fake:
+        _folder_jobs(fake)
+        api = jenkins_api.Jenkins(fake.url, flow_scoped_poll=True)
+
+        with parallel(api, timeout=20, poll_interval=0.01, job_name_prefix='team/') as ctrl:
+            ctrl.invoke('a')
+            ctrl.invoke('sub/b')
+
+        assert ctrl.result == BuildResult.SUCCESS
+        assert fake.request_paths('POST') == ['/job/team/job/a/build', '/job/team/job/sub/job/b/build']
+        assert not [path for path in fake.request_paths() if path.startswith('/job/other')]
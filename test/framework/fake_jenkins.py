@@ -0,0 +1,387 @@
+# Copyright (c) 2012 - 2015 Lars Hupfeldt Nielsen, Hupfeldt IT
+# All rights reserved. This work is under a BSD license, see LICENSE.TXT.
+
+# Minimal in process stand-in for the parts of the Jenkins remote api used by jenkins_api
+# Builds are simulated in real time, queue items start after 'queue_delay' and builds finish after 'exec_time'
+
+from __future__ import print_function
+
+import sys, re, json, base64, time, socket, threading, gzip
+from StringIO import StringIO
+from collections import OrderedDict
+from SocketServer import ThreadingMixIn
+from wsgiref.simple_server import make_server, WSGIServer, WSGIRequestHandler, ServerHandler
+
+import bottle
+
+
+def _gzip_middleware(app):
+    """Compress responses if the client accepts gzip, like Jenkins does"""
+
+    def gzip_app(environ, start_response):
+        if 'gzip' not in environ.get('HTTP_ACCEPT_ENCODING', ''):
+            return app(environ, start_response)
+
+        started = []
+
+        def capture(status, headers, exc_info=None):
+            started.append((status, headers))
+
+        body = ''.join(app(environ, capture))
+        status, headers = started[0]
+        headers = [(name, value) for name, value in headers if name.lower() != 'content-length']
+        if body:
+            buf = StringIO()
+            with gzip.GzipFile(fileobj=buf, mode='wb') as gz:
+                gz.write(body)
+            body = buf.getvalue()
+            headers.append(('Content-Encoding', 'gzip'))
+        headers.append(('Content-Length', str(len(body))))
+        start_response(status, headers)
+        return [body]
+
+    return gzip_app
+
+
+def _folder_middleware(app):
+    """Let the routes address jobs in folders, /job/<folder>/job/<name>/..., with a single <name> which is the full name with '/' quoted"""
+
+    def folder_app(environ, start_response):
+        path = environ['PATH_INFO']
+        environ['fake_jenkins.path'] = path
+        if path.startswith('/job/'):
+            environ['PATH_INFO'] = '/job/' + path[len('/job/'):].replace('/job/', '%2F')
+        return app(environ, start_response)
+
+    return folder_app
+
+
+class _KeepAliveServerHandler(ServerHandler):
+    http_version = '1.1'
+
+
+class _KeepAliveHandler(WSGIRequestHandler):
+    """Serve requests on the same connection until the client closes it, like Jenkins does"""
+
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately, don't let them wait for the ack of the client
+    disable_nagle_algorithm = True
+
+    def handle(self):
+        while True:
+            self.raw_requestline = self.rfile.readline(65537)
+            if not self.raw_requestline or not self.parse_request():
+                return
+
+            handler = _KeepAliveServerHandler(self.rfile, self.wfile, self.get_stderr(), self.get_environ())
+            handler.request_handler = self
+            handler.run(self.server.get_app())
+            if self.close_connection:
+                return
+
+    def log_message(self, *_args):
+        pass
+
+
+class _ThreadingServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+    # Many concurrent connects would overflow the default listen backlog of 5, delaying them by a second
+    request_queue_size = 128
+
+    def handle_error(self, request, client_address):
+        # Clients which time out close the connection before the response is written
+        if not isinstance(sys.exc_info()[1], socket.error):
+            WSGIServer.handle_error(self, request, client_address)
+
+
+def invoke_kwargs(build_params=None, cause=None, description=None):
+    """The keyword arguments for ApiJob.invoke and Jenkins.invoke_jobs"""
+    return dict(securitytoken=None, build_params=build_params, cause=cause, description=description)
+
+
+def request_threads(api):
+    """Record the requests sent through the transport of 'api'. Return the list of (thread name, method, path) recorded."""
+    requests = []
+    request = api.transport.request
+
+    def recording_request(method, path, *args, **kwargs):
+        requests.append((threading.current_thread().name, method, path))
+        return request(method, path, *args, **kwargs)
+
+    api.transport.request = recording_request
+    return requests
+
+
+class FakeJob(object):
+    def __init__(self, name, exec_time, queue_delay, result, params, builds):
+        self.name = name
+        self.exec_time = exec_time
+        self.queue_delay = queue_delay
+        self.result = result
+        self.params = params
+        # number -> [result, end_time], newest last
+        self.builds = OrderedDict((num, [res, None]) for num, res in builds)
+        self.next_build_number = max([num for num, _ in builds] or [0]) + 1
+        self.descriptions = {}
+
+    def dct(self, queue):
+        last_build = None
+        if self.builds:
+            num = next(reversed(self.builds))
+            result, end_time = self.builds[num]
+            start_time = end_time - self.exec_time if end_time is not None else 0
+            last_build = {'number': num, 'result': result, 'estimatedDuration': int(self.exec_time * 1000), 'timestamp': int(start_time * 1000)}
+        queue_item = None
+        for item in queue.values():
+            if item['job'] is self:
+                queue_item = {'why': item['why']}
+                break
+        actions = [{'parameterDefinitions': [{'name': 'force_result', 'type': 'StringParameterDefinition'}]}] if self.params else [{}]
+        builds = [{'number': num, 'result': res} for num, (res, _) in reversed(self.builds.items())]
+        return {'name': self.name.rpartition('/')[2], 'lastBuild': last_build, 'queueItem': queue_item, 'actions': actions, 'builds': builds}
+
+
+class FakeJenkins(object):
+    """Serve a fake Jenkins on localhost in a background thread. Use as a context manager."""
+
+    version = '1.600'
+
+    def __init__(self):
+        self.jobs = OrderedDict()
+        self.queue = OrderedDict()
+        self.left_queue = {}
+        self.cancelled = set()
+        self.next_queue_id = 1
+        self.requests = []
+        # Seconds to wait before answering each request, to simulate a slow Jenkins
+        self.delay = 0
+        # The most requests waiting in the delay at the same time, i.e. sent by the client without waiting for each other
+        self.max_concurrent_requests = 0
+        self._concurrent_requests = 0
+        # If False, the user is not allowed to use the script console
+        self.script_console = True
+        # If set, build triggers are answered with this error status, after the build was queued
+        self.trigger_error = None
+        # If set, the bulk trigger script fails with a stack trace after queueing this number of builds
+        self.script_fails_after = None
+        # If set, CSRF protection is enabled and all POSTs must send this crumb
+        self.crumb = None
+        # Queued builds start when one of the executors is free. With 0 executors, agents are provisioned for each queued build.
+        self.executors = 1000
+        self.max_queue_length = 0
+        self.lock = threading.RLock()
+        self.app = self._make_app()
+        self._server = None
+        self._thread = None
+        self.url = None
+
+    def job(self, name, exec_time=0.05, queue_delay=0.01, result='SUCCESS', params=False, builds=()):
+        with self.lock:
+            self.jobs[name] = FakeJob(name, exec_time, queue_delay, result, params, builds)
+
+    def delete_job(self, name):
+        with self.lock:
+            del self.jobs[name]
+
+    def request_paths(self, method='GET'):
+        return [path for meth, path, _ in self.requests if meth == method]
+
+    def __enter__(self):
+        self._server = make_server('localhost', 0, _gzip_middleware(_folder_middleware(self.app)), server_class=_ThreadingServer, handler_class=_KeepAliveHandler)
+        self.url = 'http://localhost:' + repr(self._server.server_port)
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def _running(self):
+        return sum(1 for job in self.jobs.values() for result, end_time in job.builds.values() if result is None and end_time is not None)
+
+    def _simulate(self):
+        now = time.time()
+        for job in self.jobs.values():
+            for build in job.builds.values():
+                if build[0] is None and build[1] is not None and build[1] <= now:
+                    build[0] = job.result
+
+        running = self._running()
+        for qid, item in self.queue.items():
+            if item['start_time'] <= now and (not self.executors or running < self.executors):
+                running += 1
+                job = item['job']
+                num = job.next_build_number
+                job.next_build_number += 1
+                job.builds[num] = [None, now + job.exec_time]
+                self.left_queue[qid] = (job, num)
+                del self.queue[qid]
+
+    def _enqueue(self, job):
+        qid = self.next_queue_id
+        self.next_queue_id += 1
+        self.queue[qid] = dict(job=job, why="Waiting for next available executor", start_time=time.time() + job.queue_delay)
+        self.max_queue_length = max(self.max_queue_length, len(self.queue))
+        return qid
+
+    def _task(self, job):
+        return {'name': job.name.rpartition('/')[2], 'url': self.url + '/job/' + '/job/'.join(job.name.split('/')) + '/'}
+
+    def _get_job(self, name):
+        job = self.jobs.get(name.replace('%2F', '/'))
+        if job is None:
+            bottle.abort(404, "No such job: " + repr(name))
+        return job
+
+    def _listing(self, folder):
+        """Return the dcts of the jobs and folders directly in 'folder', '' is the top level"""
+        prefix = folder + '/' if folder else ''
+        job_dcts = []
+        folders = OrderedDict()
+        for name, job in self.jobs.items():
+            if not name.startswith(prefix):
+                continue
+            sub_folder, _, _ = name[len(prefix):].partition('/')
+            if sub_folder != name[len(prefix):]:
+                folders[sub_folder] = True
+                continue
+            job_dcts.append(job.dct(self.queue))
+        return job_dcts + [{'name': sub_folder, 'jobs': None} for sub_folder in folders]
+
+    def _make_app(self):
+        app = bottle.Bottle()
+
+        @app.hook('before_request')
+        def record():
+            if self.delay:
+                with self.lock:
+                    self._concurrent_requests += 1
+                    self.max_concurrent_requests = max(self.max_concurrent_requests, self._concurrent_requests)
+                try:
+                    time.sleep(self.delay)
+                finally:
+                    with self.lock:
+                        self._concurrent_requests -= 1
+            # Read the whole request body, so that the next request on the connection can be read
+            bottle.request.body  # pylint: disable=pointless-statement
+            with self.lock:
+                self.requests.append((bottle.request.method, bottle.request.environ['fake_jenkins.path'], bottle.request.query_string))
+                self._simulate()
+            bottle.response.set_header('X-Jenkins', self.version)
+            if self.crumb and bottle.request.method == 'POST' and bottle.request.get_header('Jenkins-Crumb') != self.crumb:
+                bottle.abort(403, "No valid crumb was included in the request")
+
+        @app.route('/', method='HEAD')
+        def head():
+            return ''
+
+        @app.get('/crumbIssuer/api/json')
+        def crumb_issuer_api():
+            if not self.crumb:
+                bottle.abort(404, "Not found")
+            return {'crumb': self.crumb, 'crumbRequestField': 'Jenkins-Crumb'}
+
+        @app.get('/api/json')
+        def api():
+            with self.lock:
+                return {'jobs': self._listing(''), 'primaryView': {'url': self.url + '/'}}
+
+        @app.get('/job/<name>/api/json')
+        def job_api(name):
+            with self.lock:
+                folder = name.replace('%2F', '/')
+                if folder not in self.jobs and any(job_name.startswith(folder + '/') for job_name in self.jobs):
+                    return {'name': folder.rpartition('/')[2], 'jobs': self._listing(folder)}
+                dct = self._get_job(name).dct(self.queue)
+            # Range of builds, newest first
+            builds_range = re.search(r'builds\[[^\]]*\]\{(\d+),(\d+)\}', bottle.request.query.tree or '')
+            if builds_range:
+                dct['builds'] = dct['builds'][int(builds_range.group(1)):int(builds_range.group(2))]
+            return dct
+
+        @app.get('/job/<name>/<num:int>/api/json')
+        def build_api(name, num):
+            with self.lock:
+                job = self._get_job(name)
+                if num not in job.builds:
+                    bottle.abort(404, "No such build")
+                return {'number': num, 'result': job.builds[num][0], 'description': job.descriptions.get(num)}
+
+        @app.post('/job/<name>/<trigger:re:build|buildWithParameters>')
+        def invoke(name, trigger):
+            with self.lock:
+                job = self._get_job(name)
+                if job.params != (trigger == 'buildWithParameters'):
+                    bottle.abort(400 if job.params else 500, "Wrong build trigger for job " + repr(name))
+                qid = self._enqueue(job)
+            if self.trigger_error:
+                bottle.abort(self.trigger_error, "Error after queueing build")
+            bottle.response.status = 201
+            bottle.response.set_header('Location', self.url + '/queue/item/' + repr(qid) + '/')
+            return ''
+
+        @app.post('/scriptText')
+        def script_text():
+            # Only the bulk trigger script of jenkins_api is understood
+            if not self.script_console:
+                bottle.abort(403, "Overall/RunScripts permission required")
+            triggers = json.loads(base64.b64decode(re.search(r"'([A-Za-z0-9+/=]*)'\.decodeBase64\(\)", bottle.request.forms.script).group(1)))
+            if self.script_fails_after is not None:
+                triggers = triggers[:self.script_fails_after]
+            with self.lock:
+                queue_ids = [self._enqueue(self.jobs[trigger['job']]) if trigger['job'] in self.jobs else None for trigger in triggers]
+            bottle.response.content_type = 'text/plain'
+            if self.script_fails_after is not None:
+                return "groovy.lang.MissingMethodException: No signature of method: createValue() is applicable for argument types: (java.lang.String)\n"
+            return json.dumps(queue_ids) + '\n'
+
+        @app.get('/queue/api/json')
+        def queue_api():
+            with self.lock:
+                return {'items': [{'id': qid, 'why': item['why'], 'task': self._task(item['job']), 'buildable': True} for qid, item in self.queue.items()]}
+
+        @app.get('/computer/api/json')
+        def computer_api():
+            with self.lock:
+                # All running builds are on one node, the builds of pipelines would be on the oneOffExecutors
+                executors = [{'currentExecutable': {'number': num, 'url': self._task(job)['url'] + repr(num) + '/'}}
+                             for job in self.jobs.values() for num, (result, end_time) in job.builds.items() if result is None and end_time is not None]
+                return {'busyExecutors': self._running(), 'totalExecutors': self.executors, 'computer': [{'executors': executors, 'oneOffExecutors': []}]}
+
+        @app.get('/queue/item/<qid:int>/api/json')
+        def queue_item_api(qid):
+            with self.lock:
+                if qid in self.queue:
+                    return {'executable': None, 'why': self.queue[qid]['why']}
+                if qid in self.left_queue:
+                    return {'executable': {'number': self.left_queue[qid][1]}, 'why': None}
+                if qid in self.cancelled:
+                    return {'executable': None, 'why': None, 'cancelled': True}
+                bottle.abort(404, "No such queue item")
+
+        @app.post('/queue/cancelItem')
+        def cancel_item():
+            with self.lock:
+                qid = int(bottle.request.query.id)
+                if self.queue.pop(qid, None):
+                    self.cancelled.add(qid)
+            return ''
+
+        @app.post('/job/<name>/<num:int>/stop')
+        def stop(name, num):
+            with self.lock:
+                build = self._get_job(name).builds.get(num)
+                if build and build[0] is None:
+                    build[0] = 'ABORTED'
+            return ''
+
+        @app.post('/job/<name>/<num:int>/submitDescription')
+        def submit_description(name, num):
+            with self.lock:
+                self._get_job(name).descriptions[num] = bottle.request.forms.description
+            return ''
+
+        return app
@@ -6,7 +6,7 @@ import os
 from os.path import join as jp
 from collections import OrderedDict
 
-from jenkinsflow.api_base import BuildResult, Progress, UnknownJobException, ApiInvocationMixin
+from jenkinsflow.api_base import BuildResult, Progress, UnknownJobException, ApiInvocationMixin, ApiJenkinsMixin
 from jenkinsflow.mocked import hyperspeed
 
 from .base_test_api import TestJob, TestJenkins
@@ -15,7 +15,7 @@ from jenkinsflow.test.cfg import ApiType
 here = os.path.abspath(os.path.dirname(__file__))
 
 
-class MockApi(TestJenkins):
+class MockApi(TestJenkins, ApiJenkinsMixin):
     job_xml_template = jp(here, 'job.xml.tenjin')
     api_type = ApiType.MOCK
 
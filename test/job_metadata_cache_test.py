@@ -0,0 +1,126 @@
+# Copyright (c) 2012 - 2015 Lars Hupfeldt Nielsen, Hupfeldt IT
+# All rights reserved. This work is under a BSD license, see LICENSE.TXT.
+
+import os, json, tempfile, shutil
+
+from pytest import raises
+
+from jenkinsflow import jenkins_api
+from jenkinsflow.api_base import BuildResult
+from jenkinsflow.flow import serial
+
+from . import cfg as test_cfg
+from .cfg import ApiType
+from .framework.fake_jenkins import FakeJenkins
+
+
+def _cache_file():
+    return os.path.join(tempfile.mkdtemp(), 'sub', 'job_cache.json')
+
+
+def test_job_metadata_cache_flow_start():
+    if test_cfg.selected_api() != ApiType.JENKINS:
+        return
+
+    cache_file = _cache_file()
+    try:
+        with FakeJenkins() as fake:
+            fake.job('j1')
+            fake.job('j2', params=True)
+            for num in range(100):
+                fake.job('other' + str(num))
+
+            # First run lists all jobs and fills the cache
+            api = jenkins_api.Jenkins(fake.url, job_cache_file=cache_file)
+            api.poll()
+            with open(cache_file) as cf:
+                cached = json.load(cf)[fake.url]
+            assert cached['public_uri'] == fake.url
+            assert cached['ci_version'] == FakeJenkins.version
+            assert len(cached['jobs']) == 102
+
+            # Later runs only look up the jobs in the flow
+            del fake.requests[:]
+            api = jenkins_api.Jenkins(fake.url, job_cache_file=cache_file)
+            with serial(api, timeout=20, poll_interval=0.01) as ctrl:
+                ctrl.invoke('j1')
+                ctrl.invoke('j2', force_result='SUCCESS')
+
+            assert ctrl.result == BuildResult.SUCCESS
+            assert '/api/json' not in fake.request_paths()
+            assert set(path for path in fake.request_paths() if path.startswith('/job/')) == set(['/job/j1/api/json', '/job/j2/api/json'])
+            assert [path for path in fake.request_paths('POST') if path.startswith('/job/')] == [
+                '/job/j1/build', '/job/j2/buildWithParameters']
+
+            # The response cached for the job is not modified with the cached parameter definitions
+            api2 = jenkins_api.Jenkins(fake.url, job_cache_file=cache_file)
+            api2.poll()
+            api2.get_job('j1')
+            job_entries = [entry for key, entry in api2.response_cache._entries.items() if key.startswith('/job/j1/')]  # pylint: disable=protected-access
+            assert job_entries and all('parameterDefinitions' not in action for entry in job_entries for action in entry[3].get('actions', []))
+
+            # A deleted job is removed from the cache
+            fake.delete_job('j1')
+            api.poll()
+            with raises(jenkins_api.UnknownJobException):
+                api.get_job('j1')
+            with open(cache_file) as cf:
+                assert 'j1' not in json.load(cf)[fake.url]['jobs']
+    finally:
+        shutil.rmtree(os.path.dirname(os.path.dirname(cache_file)))
+
+
+def test_job_metadata_cache_revalidate_on_invoke():
+    if test_cfg.selected_api() != ApiType.JENKINS:
+        return
+
+    cache_file = _cache_file()
+    try:
+        with FakeJenkins() as fake:
+            fake.job('j1')
+            jenkins_api.Jenkins(fake.url, job_cache_file=cache_file).poll()
+
+            # The job gets parameters after it was cached
+            fake.jobs['j1'].params = True
+            api = jenkins_api.Jenkins(fake.url, job_cache_file=cache_file)
+            api.poll()
+            del fake.requests[:]
+            api.get_job('j1').invoke(securitytoken=None, build_params={'force_result': 'SUCCESS'}, cause=None, description=None)
+
+            assert fake.request_paths('POST') == ['/job/j1/build', '/job/j1/buildWithParameters']
+            with open(cache_file) as cf:
+                assert json.load(cf)[fake.url]['jobs']['j1'] == [{'name': 'force_result', 'type': 'StringParameterDefinition'}]
+    finally:
+        shutil.rmtree(os.path.dirname(os.path.dirname(cache_file)))
+
+
+def test_job_metadata_cache_flow_start_concurrent():
+    if test_cfg.selected_api() != ApiType.JENKINS:
+        return
+
+    cache_file = _cache_file()
+    try:
+        with FakeJenkins() as fake:
+            names = ['j' + str(num) for num in range(1, 5)]
+            for name in names:
+                fake.job(name)
+
+            api = jenkins_api.Jenkins(fake.url, job_cache_file=cache_file)
+            api.poll()
+
+            # The jobs of the flow are looked up together, not one request at a time when the flow starts them
+            fake.delay = 0.2
+            del fake.requests[:]
+            fake.max_concurrent_requests = 0
+            api = jenkins_api.Jenkins(fake.url, job_cache_file=cache_file, concurrent_requests=len(names))
+            api.poll()
+            api.prefetch_jobs(names + ['j1'])
+            assert sorted(path for path in fake.request_paths() if path.startswith('/job/')) == ['/job/' + name + '/api/json' for name in names]
+            assert fake.max_concurrent_requests == len(names)
+
+            del fake.requests[:]
+            for name in names:
+                assert api.get_job(name).name == name
+            assert not [path for path in fake.request_paths() if path.startswith('/job/')]
+    finally:
+        shutil.rmtree(os.path.dirname(os.path.dirname(cache_file)))
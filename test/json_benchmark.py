@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2012 - 2015 Lars Hupfeldt Nielsen, Hupfeldt IT
+# All rights reserved. This work is under a BSD license, see LICENSE.TXT.
+
+"""Compare the decode time of the installed json codecs for large /api/json responses
+
+Run with: python -m jenkinsflow.test.json_benchmark [recorded_api_json_file ...]
+
+A response can be recorded with: curl -o jobs.json '<jenkins>/api/json?tree=jobs[name,lastBuild[number,result],queueItem[why]]'
+Without files, a response for a Jenkins with 12000 jobs is generated.
+"""
+
+from __future__ import print_function
+
+import sys, json, time
+
+from jenkinsflow.json_codec import JsonCodec, UjsonCodec, SimplejsonCodec
+
+from .framework.fake_jenkins import FakeJob
+
+
+def generated_payload(num_jobs):
+    jobs = []
+    for num in range(num_jobs):
+        job = FakeJob('job' + str(num), exec_time=100, queue_delay=0, result='SUCCESS', params=num % 2, builds=[(num % 50 + 1, 'SUCCESS')])
+        jobs.append(job.dct({}))
+    return json.dumps({'jobs': jobs, 'primaryView': {'url': 'http://localhost:8080/'}})
+
+
+def benchmark(codec, body, repeat):
+    before = time.time()
+    for _ in range(repeat):
+        codec.decode(body)
+    return (time.time() - before) / repeat
+
+
+def main(file_names):
+    payloads = [(file_name, open(file_name, 'rb').read()) for file_name in file_names] or [('12000 generated jobs', generated_payload(12000))]
+
+    codecs = [JsonCodec()]
+    for codec_class in (UjsonCodec, SimplejsonCodec):
+        try:
+            codecs.append(codec_class())
+        except ImportError:
+            print(codec_class.name, "not installed, skipping")
+
+    for name, body in payloads:
+        print("{name} ({size:.1f} MB):".format(name=name, size=len(body) / 1e6))
+        # Warm up
+        codecs[0].decode(body)
+        baseline = None
+        for codec in codecs:
+            seconds = benchmark(codec, body, 5)
+            baseline = baseline or seconds
+            print("{name:>12}: {ms:8.1f} ms {speedup:6.1f}x".format(name=codec.name, ms=seconds * 1000, speedup=baseline / seconds))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
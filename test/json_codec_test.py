@@ -0,0 +1,62 @@
+# Copyright (c) 2012 - 2015 Lars Hupfeldt Nielsen, Hupfeldt IT
+# All rights reserved. This work is under a BSD license, see LICENSE.TXT.
+
+import json
+
+from pytest import raises
+
+from jenkinsflow import jenkins_api
+from jenkinsflow.json_codec import JsonCodec, UjsonCodec, SimplejsonCodec, default_codec
+
+from . import cfg as test_cfg
+from .cfg import ApiType
+from .framework.fake_jenkins import FakeJenkins
+
+
+class _CountingCodec(JsonCodec):
+    def __init__(self):
+        self.decoded = 0
+
+    def decode(self, body):
+        self.decoded += 1
+        return super(_CountingCodec, self).decode(body)
+
+
+def _installed_codecs():
+    codecs = [JsonCodec()]
+    for codec_class in (UjsonCodec, SimplejsonCodec):
+        try:
+            codecs.append(codec_class())
+        except ImportError:
+            pass
+    return codecs
+
+
+def test_json_codecs_decode_the_same():
+    body = json.dumps({'jobs': [{'name': u'j\xe6', 'lastBuild': {'number': 1, 'result': None}, 'queueItem': None, 'actions': [{}]}]})
+    for codec in _installed_codecs():
+        assert codec.decode(body) == json.loads(body)
+        with raises(ValueError):
+            codec.decode('{"jobs": [')
+
+
+def test_json_codec_default():
+    installed = _installed_codecs()
+    # The first of the faster codecs which is installed, if any
+    assert default_codec().name == (installed[1:] or installed)[0].name
+
+
+def test_json_codec_used_for_responses():
+    if test_cfg.selected_api() != ApiType.JENKINS:
+        return
+
+    with FakeJenkins() as fake:
+        fake.job('j1', exec_time=100)
+        codec = _CountingCodec()
+        api = jenkins_api.Jenkins(fake.url, flow_scoped_poll=True, json_codec=codec)
+        api.poll()
+        api.get_job('j1')
+
+        api.quick_poll()
+        assert codec.decoded == 1
+        assert api.get_job('j1').job_status()[2] is None
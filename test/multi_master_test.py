@@ -0,0 +1,89 @@
+# Copyright (c) 2012 - 2015 Lars Hupfeldt Nielsen, Hupfeldt IT
+# All rights reserved. This work is under a BSD license, see LICENSE.TXT.
+
+import re
+
+from pytest import raises
+
+from jenkinsflow import jenkins_api
+from jenkinsflow.api_base import BuildResult
+from jenkinsflow.flow import parallel, serial
+
+from . import cfg as test_cfg
+from .cfg import ApiType
+from .framework.fake_jenkins import FakeJenkins
+
+
+def test_flow_on_two_masters(capsys):
+    if test_cfg.selected_api() != ApiType.JENKINS:
+        return
+
+    with FakeJenkins() as fake1, FakeJenkins() as fake2:
+        for fake in fake1, fake2:
+            for job_name in ('j1', 'j2', 'j3'):
+                fake.job(job_name)
+        api1 = jenkins_api.Jenkins(fake1.url, concurrent_requests=4)
+        api2 = jenkins_api.Jenkins(fake2.url, concurrent_requests=4)
+
+        with serial(api1, timeout=20, poll_interval=0.01) as ctrl1:
+            ctrl1.invoke('j1')
+            with ctrl1.parallel() as ctrl2:
+                ctrl2.invoke('j1').master(api2)
+                ctrl2.invoke('j2').master(api2)
+                ctrl2.invoke('j2')
+            ctrl1.invoke('j3').master(api2)
+
+        assert ctrl1.result == BuildResult.SUCCESS
+        assert fake1.request_paths('POST') == ['/job/j1/build', '/job/j2/build']
+        assert sorted(fake2.request_paths('POST')) == ['/job/j1/build', '/job/j2/build', '/job/j3/build']
+
+        sout, _ = capsys.readouterr()
+        assert re.search(r"^SUCCESS: 'j3' - build: " + fake2.url + "/job/j3/1/console", sout, re.MULTILINE)
+
+
+def test_kill_all_on_two_masters(capsys):
+    if test_cfg.selected_api() != ApiType.JENKINS:
+        return
+
+    with FakeJenkins() as fake1, FakeJenkins() as fake2:
+        api1 = jenkins_api.Jenkins(fake1.url)
+        api2 = jenkins_api.Jenkins(fake2.url)
+        for fake, api in (fake1, api1), (fake2, api2):
+            fake.job('j1', queue_delay=0, exec_time=100)
+            api.poll()
+            api.get_job('j1').invoke(securitytoken=None, build_params=None, cause=None, description=None)
+
+        with parallel(api1, timeout=20, poll_interval=0.01, kill_all=True) as ctrl:
+            ctrl.invoke('j1')
+            ctrl.invoke('j1').master(api2)
+
+        sout, _ = capsys.readouterr()
+        assert "Kill sent for 2 jobs, removed 0 queued and aborted 2 running builds," in sout
+        assert fake1.jobs['j1'].builds[1][0] == fake2.jobs['j1'].builds[1][0] == 'ABORTED'
+
+
+def test_flow_start_polling_fails_on_second_master():
+    if test_cfg.selected_api() != ApiType.JENKINS:
+        return
+
+    with FakeJenkins() as fake1, FakeJenkins() as fake2:
+        for fake in fake1, fake2:
+            fake.job('j1')
+        api1 = jenkins_api.Jenkins(fake1.url, background_poll=True)
+        api2 = jenkins_api.Jenkins(fake2.url)
+
+        stopped = []
+        def start_polling(interval):
+            raise RuntimeError("Failed starting " + repr(interval))
+        api2.start_polling = start_polling
+        api2.stop_polling = lambda: stopped.append(api2)
+
+        with raises(RuntimeError):
+            with serial(api1, timeout=20, poll_interval=0.01) as ctrl:
+                ctrl.invoke('j1')
+                ctrl.invoke('j1').master(api2)
+
+        # The poller started on the first master is stopped, and the master which failed starting is cleaned up
+        assert api1._poller is None  # pylint: disable=protected-access
+        assert stopped == [api2]
+        assert fake1.request_paths('POST') == fake2.request_paths('POST') == []
@@ -0,0 +1,131 @@
+# Copyright (c) 2012 - 2015 Lars Hupfeldt Nielsen, Hupfeldt IT
+# All rights reserved. This work is under a BSD license, see LICENSE.TXT.
+
+import time, urllib2
+
+from pytest import raises
+from click.testing import CliRunner
+
+from jenkinsflow import jenkins_api
+from jenkinsflow.api_base import BuildResult, Progress
+from jenkinsflow.notifications import NotificationReceiver, send_notification
+from jenkinsflow.cli.cli import cli
+
+from . import cfg as test_cfg
+from .cfg import ApiType
+from .framework.fake_jenkins import FakeJenkins
+
+
+def _invoke(api, job_name):
+    return api.get_job(job_name).invoke(securitytoken=None, build_params=None, cause=None, description=None)
+
+
+def test_notifications_update_invocation():
+    if test_cfg.selected_api() != ApiType.JENKINS:
+        return
+
+    with FakeJenkins() as fake, NotificationReceiver(reconcile_interval=100) as receiver:
+        fake.job('j1', queue_delay=100, exec_time=100)
+        fake.job('j2', queue_delay=100, exec_time=100)
+        api = jenkins_api.Jenkins(fake.url, notifications=receiver)
+        api.poll()
+        api.start_polling(0.01)
+        inv1 = _invoke(api, 'j1')
+        inv2 = _invoke(api, 'j2')
+
+        # No notifications yet, Jenkins is polled
+        del fake.requests[:]
+        api.quick_poll()
+        assert fake.request_paths()
+
+        send_notification(receiver.url, 'j1', 7, 'STARTED', queue_id=1)
+        result = CliRunner().invoke(cli, ['notify', '--url', receiver.url, '--job-name', 'j2', '--build-number', '3', '--phase', 'STARTED', '--queue-id', '2'])
+        assert result.exit_code == 0, result.output
+        del fake.requests[:]
+        api.quick_poll()
+        assert (inv1.build_number, inv2.build_number) == (7, 3)
+        assert inv1.status() == (BuildResult.UNKNOWN, Progress.RUNNING)
+
+        send_notification(receiver.url, 'j1', 7, 'COMPLETED', status='UNSTABLE', queue_id=1)
+        send_notification(receiver.url, 'j2', 3, 'FINALIZED', status='SUCCESS', queue_id=2)
+        api.quick_poll()
+        assert inv1.status() == (BuildResult.UNSTABLE, Progress.IDLE)
+        assert inv2.status() == (BuildResult.SUCCESS, Progress.IDLE)
+
+        # Notifications arrive, so Jenkins was not polled
+        assert fake.request_paths() == []
+        assert receiver.event_count == 4
+
+
+def test_notifications_fall_back_to_polling():
+    if test_cfg.selected_api() != ApiType.JENKINS:
+        return
+
+    with FakeJenkins() as fake, NotificationReceiver(reconcile_interval=100, silence_timeout=0.2) as receiver:
+        fake.job('j1', queue_delay=0, exec_time=0.05)
+        api = jenkins_api.Jenkins(fake.url, notifications=receiver)
+        api.poll()
+        api.start_polling(0.01)
+
+        send_notification(receiver.url, 'j1', 17, 'FINALIZED', status='SUCCESS')
+        api.quick_poll()
+        inv = _invoke(api, 'j1')
+
+        # Notifications without queue id, the queue must be polled
+        time.sleep(0.02)
+        api.quick_poll()
+        assert inv.build_number == 1
+
+        # Notification seen recently, no polling
+        del fake.requests[:]
+        time.sleep(0.1)
+        api.quick_poll()
+        assert fake.request_paths() == []
+
+        # Silence, back to polling
+        time.sleep(0.2)
+        api.quick_poll()
+        assert fake.request_paths()
+        assert inv.status() == (BuildResult.SUCCESS, Progress.IDLE)
+
+
+def test_notifications_bad_payload():
+    with NotificationReceiver() as receiver:
+        with raises(urllib2.HTTPError) as exinfo:
+            urllib2.urlopen(receiver.url, '{"name": "j1"}')
+        assert exinfo.value.code == 400
+        assert receiver.event_count == 0
+
+
+def test_notifications_require_token():
+    with NotificationReceiver() as receiver:
+        assert receiver.host == 'localhost'
+        with raises(urllib2.HTTPError) as exinfo:
+            send_notification(receiver.url.replace(receiver.token, 'guess'), 'j1', 1, 'COMPLETED', status='SUCCESS')
+        assert exinfo.value.code == 403
+        assert receiver.event_count == 0
+
+        send_notification(receiver.url, 'j1', 1, 'COMPLETED', status='SUCCESS')
+        assert receiver.event_count == 1
+
+
+def test_notifications_stopped_with_polling():
+    if test_cfg.selected_api() != ApiType.JENKINS:
+        return
+
+    with FakeJenkins() as fake:
+        fake.job('j1')
+        receiver = NotificationReceiver(reconcile_interval=100)
+        api = jenkins_api.Jenkins(fake.url, notifications=receiver)
+        api.poll()
+        api.start_polling(0.01)
+        send_notification(receiver.url, 'j1', 1, 'STARTED')
+
+        api.stop_polling()
+        with raises(urllib2.URLError):
+            send_notification(receiver.url, 'j1', 1, 'COMPLETED', status='SUCCESS')
+
+        # Without a receiver, Jenkins is polled directly
+        del fake.requests[:]
+        api.quick_poll()
+        assert fake.request_paths()
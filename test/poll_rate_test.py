@@ -0,0 +1,92 @@
+# Copyright (c) 2012 - 2015 Lars Hupfeldt Nielsen, Hupfeldt IT
+# All rights reserved. This work is under a BSD license, see LICENSE.TXT.
+
+import bottle
+
+from jenkinsflow import jenkins_api
+from jenkinsflow.api_base import BuildResult
+from jenkinsflow.flow import serial
+
+from . import cfg as test_cfg
+from .cfg import ApiType
+from .framework.fake_jenkins import FakeJenkins
+
+
+def test_poll_rate_backs_off_and_recovers():
+    if test_cfg.selected_api() != ApiType.JENKINS:
+        return
+
+    with FakeJenkins() as fake:
+        fake.job('j1', builds=[(1, 'SUCCESS')])
+        poll_rate = jenkins_api.PollRateController(max_interval=0.5, latency_threshold=0.03, recover_step=0.1)
+        api = jenkins_api.Jenkins(fake.url, poll_rate=poll_rate)
+        api.poll()
+        api.start_polling(0.01)
+        api.quick_poll()
+        assert api.poll_interval(0.01) == 0.01
+
+        # Slow Jenkins, the interval is doubled for each poll, up to the max
+        fake.delay = 0.05
+        intervals = []
+        for _ in range(4):
+            api.quick_poll()
+            intervals.append(api.poll_interval(0.01))
+        assert intervals == [0.1, 0.2, 0.4, 0.5]
+        assert poll_rate.latency > 0.03
+
+        # Recovered, the interval is decreased linearly, down to the flow interval
+        fake.delay = 0
+        intervals = []
+        for _ in range(6):
+            api.quick_poll()
+            intervals.append(round(api.poll_interval(0.01), 3))
+        assert intervals == [0.4, 0.3, 0.2, 0.1, 0.01, 0.01]
+
+        status = api.poll_status()
+        assert 'poll interval 0.01s' in status
+        assert 'response time' in status and 'errors 0%' in status
+
+
+def test_poll_rate_backs_off_on_server_errors():
+    if test_cfg.selected_api() != ApiType.JENKINS:
+        return
+
+    with FakeJenkins() as fake:
+        fake.job('j1', builds=[(1, 'SUCCESS')])
+        poll_rate = jenkins_api.PollRateController(max_interval=1, recover_step=0.1)
+        api = jenkins_api.Jenkins(fake.url, poll_rate=poll_rate)
+        api.poll()
+        api.start_polling(0.01)
+
+        # Missing jobs are not errors
+        try:
+            api.get_job('nosuch')
+        except jenkins_api.UnknownJobException:
+            pass
+        api.quick_poll()
+        assert api.poll_interval(0.01) == 0.01
+
+        fake.app.route('/api/json', 'GET', lambda: bottle.abort(503, "Overloaded"))
+        try:
+            api.quick_poll()
+        except jenkins_api.RequestFailed:
+            pass
+        poll_rate.update(0.01)
+        assert api.poll_interval(0.01) == 0.1
+        assert poll_rate.error_rate == 1.0
+
+
+def test_poll_rate_status_reported_by_flow(capsys):
+    if test_cfg.selected_api() != ApiType.JENKINS:
+        return
+
+    with FakeJenkins() as fake:
+        fake.job('j1', exec_time=0.3)
+        api = jenkins_api.Jenkins(fake.url, poll_rate=jenkins_api.PollRateController())
+
+        with serial(api, timeout=20, poll_interval=0.01, report_interval=0.1) as ctrl:
+            ctrl.invoke('j1')
+
+        assert ctrl.result == BuildResult.SUCCESS
+        sout, _ = capsys.readouterr()
+        assert "Polling Jenkins: poll interval" in sout
@@ -0,0 +1,43 @@
+# Copyright (c) 2012 - 2015 Lars Hupfeldt Nielsen, Hupfeldt IT
+# All rights reserved. This work is under a BSD license, see LICENSE.TXT.
+
+import time
+
+from jenkinsflow import jenkins_api
+
+from . import cfg as test_cfg
+from .cfg import ApiType
+from .framework.fake_jenkins import FakeJenkins
+
+
+def test_queue_resolution_single_queue_request():
+    if test_cfg.selected_api() != ApiType.JENKINS:
+        return
+
+    with FakeJenkins() as fake:
+        names = ['j' + str(num) for num in range(5)]
+        for name in names:
+            fake.job(name, queue_delay=0.3, exec_time=10)
+
+        api = jenkins_api.Jenkins(fake.url)
+        api.poll()
+        invocations = [api.get_job(name).invoke(securitytoken=None, build_params=None, cause=None, description=None) for name in names]
+
+        del fake.requests[:]
+        api.quick_poll()
+        assert [path for path in fake.request_paths() if path.startswith('/queue')] == ['/queue/api/json']
+        assert [inv.build_number for inv in invocations] == [None] * 5
+        assert invocations[0].queued_why == "Waiting for next available executor"
+
+        time.sleep(0.4)
+        del fake.requests[:]
+        api.quick_poll()
+        queue_paths = [path for path in fake.request_paths() if path.startswith('/queue')]
+        assert queue_paths[0] == '/queue/api/json'
+        assert len(queue_paths) == 6
+        assert [inv.build_number for inv in invocations] == [1] * 5
+
+        # All resolved, the queue is no longer polled
+        del fake.requests[:]
+        api.quick_poll()
+        assert [path for path in fake.request_paths() if path.startswith('/queue')] == []
@@ -0,0 +1,88 @@
+# Copyright (c) 2012 - 2015 Lars Hupfeldt Nielsen, Hupfeldt IT
+# All rights reserved. This work is under a BSD license, see LICENSE.TXT.
+
+import time, threading
+
+from jenkinsflow import jenkins_api
+from jenkinsflow.jenkins_api import RequestBudget
+from jenkinsflow.api_base import BuildResult
+
+from . import cfg as test_cfg
+from .cfg import ApiType
+from .framework.fake_jenkins import FakeJenkins
+
+
+def test_request_budget_limits_rate():
+    if test_cfg.selected_api() != ApiType.JENKINS:
+        return
+
+    with FakeJenkins() as fake:
+        fake.job('j1', builds=[(1, 'SUCCESS')])
+        budget = RequestBudget(rate=40, burst=5)
+        api = jenkins_api.Jenkins(fake.url, flow_scoped_poll=True, concurrent_requests=4, request_budget=budget)
+        api.poll()
+        api.get_job('j1')
+
+        del fake.requests[:]
+        requests = budget.requests
+        before = time.time()
+        for _ in range(10):
+            api.quick_poll()
+        elapsed = time.time() - before
+
+        # All requests went through the budget, and after the burst no more than 'rate' per second were sent
+        assert budget.requests - requests == len(fake.requests)
+        assert elapsed >= (len(fake.requests) - budget.burst) / budget.rate * 0.9
+        assert budget.waited > 0
+
+
+def test_request_budget_urgent_first():
+    if test_cfg.selected_api() != ApiType.JENKINS:
+        return
+
+    budget = RequestBudget(rate=20, burst=1)
+    stop = threading.Event()
+
+    def poll():
+        while not stop.is_set():
+            budget.acquire(RequestBudget.NORMAL)
+
+    pollers = [threading.Thread(target=poll) for _ in range(5)]
+    for poller in pollers:
+        poller.start()
+    try:
+        time.sleep(0.2)
+        waits = []
+        for _ in range(3):
+            before = time.time()
+            budget.acquire(RequestBudget.URGENT)
+            waits.append(time.time() - before)
+        # Each urgent request waits for at most the next token, not behind the five waiting polls
+        assert max(waits) < 2.0 / budget.rate
+    finally:
+        stop.set()
+        for poller in pollers:
+            poller.join()
+
+
+def test_request_budget_invoke_and_stop():
+    if test_cfg.selected_api() != ApiType.JENKINS:
+        return
+
+    with FakeJenkins() as fake:
+        fake.job('j1', queue_delay=0, exec_time=100)
+        budget = RequestBudget(rate=1000)
+        api = jenkins_api.Jenkins(fake.url, request_budget=budget)
+        api.poll()
+        inv = api.get_job('j1').invoke(securitytoken=None, build_params=None, cause=None, description="desc")
+
+        for _ in range(100):
+            api.quick_poll()
+            if inv.build_number is not None:
+                break
+            time.sleep(0.01)
+        inv.stop(dequeue=False)
+        api.quick_poll()
+
+        assert inv.status()[0] == BuildResult.ABORTED
+        assert budget.requests == len(fake.requests)
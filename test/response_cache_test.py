@@ -0,0 +1,95 @@
+# Copyright (c) 2012 - 2015 Lars Hupfeldt Nielsen, Hupfeldt IT
+# All rights reserved. This work is under a BSD license, see LICENSE.TXT.
+
+import bottle
+
+from jenkinsflow import jenkins_api
+
+from . import cfg as test_cfg
+from .cfg import ApiType
+from .framework.fake_jenkins import FakeJenkins
+
+
+def test_response_cache_unchanged_body():
+    if test_cfg.selected_api() != ApiType.JENKINS:
+        return
+
+    with FakeJenkins() as fake:
+        fake.job('j1', builds=[(1, 'SUCCESS')])
+        api = jenkins_api.Jenkins(fake.url)
+        api.poll()
+        misses = api.response_cache.misses
+
+        api.quick_poll()
+        api.quick_poll()
+        assert api.response_cache.misses == misses + 1
+        assert api.response_cache.hits == 1
+
+        # Changed job list, and the new job is fetched
+        fake.job('j2')
+        api.quick_poll()
+        assert api.response_cache.misses == misses + 3
+        assert api.get_job('j2')
+
+
+def test_response_cache_not_modified():
+    if test_cfg.selected_api() != ApiType.JENKINS:
+        return
+
+    with FakeJenkins() as fake:
+        @fake.app.get('/etag/api/json')
+        def etag():  # pylint: disable=unused-variable
+            if bottle.request.headers.get('If-None-Match') == '"v1"':
+                bottle.response.status = 304
+                return ''
+            bottle.response.set_header('ETag', '"v1"')
+            return {'value': 17}
+
+        api = jenkins_api.Jenkins(fake.url)
+        assert api._get_json('/etag/api/json', tree='value') == {'value': 17}
+        assert api._get_json('/etag/api/json', tree='value') == {'value': 17}
+        assert (api.response_cache.hits, api.response_cache.misses) == (1, 1)
+
+
+
+def test_response_cache_not_modified_entry_evicted():
+    if test_cfg.selected_api() != ApiType.JENKINS:
+        return
+
+    with FakeJenkins() as fake:
+        api = jenkins_api.Jenkins(fake.url)
+
+        @fake.app.get('/etag/api/json')
+        def etag():  # pylint: disable=unused-variable
+            if bottle.request.headers.get('If-None-Match') == '"v1"':
+                # The entry is evicted while the request is being answered
+                api.response_cache._entries.clear()  # pylint: disable=protected-access
+                bottle.response.status = 304
+                return ''
+            bottle.response.set_header('ETag', '"v1"')
+            return {'value': 17}
+
+        assert api._get_json('/etag/api/json', tree='value') == {'value': 17}
+        assert api._get_json('/etag/api/json', tree='value') == {'value': 17}
+        assert fake.request_paths().count('/etag/api/json') == 3
+        assert (api.response_cache.hits, api.response_cache.misses) == (0, 2)
+
+def test_response_cache_evicts_least_recently_used():
+    cache = jenkins_api.ResponseCache(max_entries=2)
+
+    class Response(object):
+        status_int = 200
+        headers = {}
+
+        def __init__(self, body):
+            self.body = body
+
+        def body_string(self):
+            return self.body
+
+    cache.decode('/a', Response('{"a": 1}'))
+    cache.decode('/b', Response('{"b": 1}'))
+    assert cache.decode('/a', Response('{"a": 1}')) == {'a': 1}
+    cache.decode('/queue/item/1', Response('{"q": 1}'))
+    assert list(cache._entries) == ['/a', '/queue/item/1']  # pylint: disable=protected-access
+    assert (cache.hits, cache.misses) == (1, 3)
@@ -0,0 +1,134 @@
+# Copyright (c) 2012 - 2015 Lars Hupfeldt Nielsen, Hupfeldt IT
+# All rights reserved. This work is under a BSD license, see LICENSE.TXT.
+
+import os, stat, time, urllib, tempfile, shutil
+
+from pytest import raises
+
+from jenkinsflow import jenkins_api, shared_poll_api
+from jenkinsflow.api_base import BuildResult
+from jenkinsflow.flow import parallel
+
+from . import cfg as test_cfg
+from .cfg import ApiType
+from .framework.fake_jenkins import FakeJenkins
+
+
+def _wait_for_daemon_exit(socket_path):
+    for _ in range(100):
+        if not os.path.exists(socket_path):
+            return
+        time.sleep(0.05)
+    assert not os.path.exists(socket_path)
+
+
+
+def test_default_socket_path_refuses_unsafe_dir(monkeypatch):
+    tmp_dir = tempfile.mkdtemp()
+    monkeypatch.setattr(tempfile, 'gettempdir', lambda: tmp_dir)
+    socket_dir = os.path.join(tmp_dir, 'jenkinsflow-poll-' + repr(os.getuid()))
+    try:
+        socket_path = shared_poll_api.default_socket_path('http://jenkins')
+        assert os.path.dirname(socket_path) == socket_dir
+        assert stat.S_IMODE(os.lstat(socket_dir).st_mode) == 0o700
+
+        # Writable by others
+        os.chmod(socket_dir, 0o755)
+        with raises(Exception) as exinfo:
+            shared_poll_api.default_socket_path('http://jenkins')
+        assert socket_dir in str(exinfo.value)
+
+        # A symlink to a directory, which may be changed by whoever created the link
+        os.rmdir(socket_dir)
+        other_dir = tempfile.mkdtemp(dir=tmp_dir)
+        os.chmod(other_dir, 0o700)
+        os.symlink(other_dir, socket_dir)
+        with raises(Exception):
+            shared_poll_api.default_socket_path('http://jenkins')
+    finally:
+        shutil.rmtree(tmp_dir)
+
+def test_shared_poll_api_one_master_poll_for_many_flows():
+    if test_cfg.selected_api() != ApiType.JENKINS:
+        return
+
+    socket_dir = tempfile.mkdtemp()
+    socket_path = os.path.join(socket_dir, 'poll.sock')
+    try:
+        with FakeJenkins() as fake:
+            fake.job('j1', queue_delay=0, exec_time=100)
+            flows = [shared_poll_api.Jenkins(fake.url, socket_path=socket_path, interval=100, idle_timeout=0.5) for _ in range(5)]
+            for api in flows:
+                api.poll()
+                api.get_job('j1')
+
+            del fake.requests[:]
+            for _ in range(3):
+                for api in flows:
+                    api.quick_poll()
+            # The daemon asked Jenkins once, when the job was first asked for
+            assert fake.request_paths() == ['/job/j1/api/json']
+
+            invocations = [api.get_job('j1').invoke(securitytoken=None, build_params=None, cause=None, description=None) for api in flows]
+            time.sleep(0.01)
+            for api in flows:
+                api.quick_poll()
+            assert [inv.build_number for inv in invocations] == [1, 2, 3, 4, 5]
+
+            # Not used, the daemon exits by itself
+            _wait_for_daemon_exit(socket_path)
+    finally:
+        shutil.rmtree(socket_dir)
+
+
+def test_shared_poll_api_flow():
+    if test_cfg.selected_api() != ApiType.JENKINS:
+        return
+
+    socket_dir = tempfile.mkdtemp()
+    socket_path = os.path.join(socket_dir, 'poll.sock')
+    try:
+        with FakeJenkins() as fake:
+            fake.job('j1', exec_time=0.05)
+            fake.job('j2', exec_time=0.05)
+            api = shared_poll_api.Jenkins(fake.url, socket_path=socket_path, idle_timeout=0.5)
+
+            with parallel(api, timeout=20, poll_interval=0.01) as ctrl:
+                ctrl.invoke('j1')
+                ctrl.invoke('j2')
+                ctrl.invoke('j1')
+
+            assert ctrl.result == BuildResult.SUCCESS
+            assert api.interval == 0.01
+            _wait_for_daemon_exit(socket_path)
+    finally:
+        shutil.rmtree(socket_dir)
+
+
+def test_poll_daemon_reads_builds_back_to_oldest_asked_for():
+    if test_cfg.selected_api() != ApiType.JENKINS:
+        return
+
+    with FakeJenkins() as fake:
+        fake.job('j1', builds=[(num, 'SUCCESS') for num in range(1, 101)])
+        daemon = shared_poll_api.PollDaemon(jenkins_api.Jenkins(fake.url), socket_path=None, interval=100, idle_timeout=100)
+
+        def builds_queries():
+            queries = [urllib.unquote(query) for _, path, query in fake.requests if path == '/job/j1/api/json']
+            del fake.requests[:]
+            return queries
+
+        builds = daemon.answer({'builds': {'j1': 95}})['builds']['j1']
+        assert min(build['number'] for build in builds) <= 95
+        assert builds_queries() == ['tree=builds[number,result]{0,16}']
+
+        # Newer than already polled
+        daemon.answer({'builds': {'j1': 98}})
+        assert builds_queries() == []
+
+        # Older builds are read when asked for, and polled from then on
+        builds = daemon.answer({'builds': {'j1': 70}})['builds']['j1']
+        assert min(build['number'] for build in builds) <= 70
+        assert builds_queries() == ['tree=builds[number,result]{0,16}', 'tree=builds[number,result]{16,48}']
+        daemon._poll()  # pylint: disable=protected-access
+        assert builds_queries() == ['tree=builds[number,result]{0,16}', 'tree=builds[number,result]{16,48}']
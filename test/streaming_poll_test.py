@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2012 - 2015 Lars Hupfeldt Nielsen, Hupfeldt IT
+# All rights reserved. This work is under a BSD license, see LICENSE.TXT.
+
+import json
+
+from pytest import raises
+
+from jenkinsflow import jenkins_api
+
+from . import cfg as test_cfg
+from .cfg import ApiType
+from .framework.fake_jenkins import FakeJenkins
+
+
+def _chunked(text, size):
+    return [text[ii:ii + size] for ii in range(0, len(text), size)]
+
+
+def test_streaming_poll_parse_one_byte_chunks():
+    doc = {
+        'primaryView': {'url': 'http://x/'},
+        'jobs': [{'name': u'j\xe6' + str(num), 'lastBuild': {'number': 1234567 + num, 'result': None}, 'queueItem': None} for num in range(3)],
+        'count': 12345,
+        'nothing': None,
+    }
+    text = json.dumps(doc, indent=1)
+
+    for size in 1, 2, 7, len(text):
+        other_members = {}
+        jobs = list(jenkins_api._iter_json_array_member(_chunked(text, size), 'jobs', other_members))
+        assert jobs == doc['jobs']
+        assert other_members == dict(primaryView=doc['primaryView'], count=12345, nothing=None)
+
+
+def test_streaming_poll_parse_empty():
+    other_members = {}
+    assert list(jenkins_api._iter_json_array_member(['{}'], 'jobs', other_members)) == []
+    assert list(jenkins_api._iter_json_array_member(['{"jobs": [ ] }'], 'jobs', other_members)) == []
+    assert other_members == {}
+
+    with raises(ValueError):
+        list(jenkins_api._iter_json_array_member(['{"jobs": [{"name": "a"}'], 'jobs', other_members))
+
+    with raises(ValueError):
+        list(jenkins_api._iter_json_array_member(['{"jobs": []}', ' x'], 'jobs', other_members))
+
+
+def test_streaming_poll_prefix_filter():
+    if test_cfg.selected_api() != ApiType.JENKINS:
+        return
+
+    with FakeJenkins() as fake:
+        for num in range(2000):
+            fake.job('other' + str(num), params=True)
+        fake.job('mine1', params=True)
+        fake.job('mine2')
+
+        api = jenkins_api.Jenkins(fake.url, job_prefix_filter='mine')
+        api.poll()
+        assert sorted(api.jobs) == ['mine1', 'mine2']
+        assert api.public_uri == fake.url
+        assert 'actions' not in api.jobs['mine1'].dct
+        assert api.jobs['mine1']._build_trigger_path == '/job/mine1/buildWithParameters'
+        assert api.jobs['mine2']._build_trigger_path == '/job/mine2/build'
+
+        # The connection is reused after the streamed response
+        api.quick_poll()
+        assert api.transport.connections_opened == 1
@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2012 - 2015 Lars Hupfeldt Nielsen, Hupfeldt IT
+# All rights reserved. This work is under a BSD license, see LICENSE.TXT.
+
+"""Compare requests per second for the jenkins_api transports, polling a local fake Jenkins
+
+Run with: python -m jenkinsflow.test.transport_benchmark [num_requests]
+"""
+
+from __future__ import print_function
+
+import sys, time
+
+from jenkinsflow.transport import PooledTransport, RestkitTransport
+
+from .framework.fake_jenkins import FakeJenkins
+
+
+def benchmark(transport, num_requests):
+    query = "jobs[name,lastBuild[number,result],queueItem[why]]"
+    before = time.time()
+    for _ in range(num_requests):
+        transport.request('GET', '/api/json', params={'tree': query})
+    return num_requests / (time.time() - before)
+
+
+def main(num_requests):
+    with FakeJenkins() as fake:
+        for num in range(20):
+            fake.job('job' + str(num), builds=[(1, 'SUCCESS')])
+
+        transports = [('pooled', PooledTransport(fake.url)), ('pooled, uncompressed', PooledTransport(fake.url, compress=False))]
+        try:
+            transports.append(('restkit', RestkitTransport(fake.url)))
+        except ImportError:
+            print("restkit not installed, skipping")
+        # No reuse, a new connection for every request
+        transports.append(('pooled, pool_size=0', PooledTransport(fake.url, pool_size=0)))
+
+        for name, transport in transports:
+            # Warm up
+            benchmark(transport, 10)
+            print("{name:>22}: {rps:8.1f} requests/s".format(name=name, rps=benchmark(transport, num_requests)))
+            transport.close()
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000)
@@ -0,0 +1,166 @@
+# Copyright (c) 2012 - 2015 Lars Hupfeldt Nielsen, Hupfeldt IT
+# All rights reserved. This work is under a BSD license, see LICENSE.TXT.
+
+import socket, threading, time, warnings
+
+from pytest import raises
+
+from jenkinsflow import jenkins_api
+from jenkinsflow.api_base import BuildResult, Progress
+from jenkinsflow.flow import parallel
+from jenkinsflow.transport import Transport, PooledTransport, RestkitTransport, ResourceNotFound
+
+from . import cfg as test_cfg
+from .cfg import ApiType
+from .framework.fake_jenkins import FakeJenkins
+
+
+def test_transport_keep_alive():
+    if test_cfg.selected_api() != ApiType.JENKINS:
+        return
+
+    with FakeJenkins() as fake:
+        fake.job('j1', builds=[(1, 'SUCCESS')])
+        api = jenkins_api.Jenkins(fake.url)
+        api.poll()
+        for _ in range(10):
+            api.quick_poll()
+        assert api.transport.connections_opened == 1
+
+
+
+def test_transport_closed_when_flow_ends():
+    if test_cfg.selected_api() != ApiType.JENKINS:
+        return
+
+    with FakeJenkins() as fake:
+        for job_name in 'j1', 'j2', 'j3':
+            fake.job(job_name)
+        threads = set(threading.enumerate())
+        api = jenkins_api.Jenkins(fake.url, concurrent_requests=3)
+        with parallel(api, timeout=20, poll_interval=0.01) as ctrl:
+            for job_name in 'j1', 'j2', 'j3':
+                ctrl.invoke(job_name)
+
+        assert ctrl.result == BuildResult.SUCCESS
+        assert api._pool is None  # pylint: disable=protected-access
+        assert api.transport._idle.empty()  # pylint: disable=protected-access
+        # Neither the request threads, nor the fake's threads serving the closed connections, are left running
+        for _ in range(100):
+            if not [thread for thread in threading.enumerate() if thread not in threads]:
+                break
+            time.sleep(0.01)
+        assert not [thread for thread in threading.enumerate() if thread not in threads]
+
+        # The api can still be used after the flow
+        connections_opened = api.transport.connections_opened
+        api.poll()
+        assert api.transport.connections_opened == connections_opened + 1
+
+def test_transport_not_found():
+    if test_cfg.selected_api() != ApiType.JENKINS:
+        return
+
+    with FakeJenkins() as fake:
+        for transport in PooledTransport(fake.url), RestkitTransport(fake.url):
+            with raises(ResourceNotFound) as exinfo:
+                transport.request('GET', '/job/nosuchjob/api/json')
+            assert exinfo.value.status_int == 404
+
+            # The connection can still be used
+            assert transport.request('GET', '/api/json').status_int == 200
+
+
+def test_transport_timeout():
+    if test_cfg.selected_api() != ApiType.JENKINS:
+        return
+
+    with FakeJenkins() as fake:
+        api = jenkins_api.Jenkins(fake.url, timeout=5)
+        api.poll()
+
+        fake.delay = 0.5
+        with raises(socket.timeout):
+            api.get('/api/json', timeout=0.1)
+
+
+def test_transport_timeout_not_retried():
+    if test_cfg.selected_api() != ApiType.JENKINS:
+        return
+
+    with FakeJenkins() as fake:
+        fake.job('j1')
+        api = jenkins_api.Jenkins(fake.url, timeout=5)
+        api.poll()
+
+        # A timed out request may have been handled by Jenkins, so it must not be sent again on a new connection
+        fake.delay = 0.3
+        with raises(socket.timeout):
+            api.transport.request('POST', '/job/j1/build', timeout=0.1)
+        with raises(socket.timeout):
+            api.transport.request('GET', '/api/json', timeout=0.1)
+        time.sleep(0.5)
+        assert len(fake.request_paths('POST')) == 1
+        assert fake.request_paths('GET').count('/api/json') == 2
+
+
+def test_transport_gzip():
+    if test_cfg.selected_api() != ApiType.JENKINS:
+        return
+
+    with FakeJenkins() as fake:
+        for num in range(100):
+            fake.job('job' + str(num), builds=[(1, 'SUCCESS')])
+
+        compressed = PooledTransport(fake.url).request('GET', '/api/json')
+        plain = PooledTransport(fake.url, compress=False).request('GET', '/api/json')
+
+        assert compressed.headers.get('Content-Encoding') == 'gzip'
+        assert plain.headers.get('Content-Encoding') is None
+        assert compressed.body_string() == plain.body_string()
+        assert len(compressed.body_string()) > 10000
+
+
+def test_transport_quotes_path():
+    if test_cfg.selected_api() != ApiType.JENKINS:
+        return
+
+    with FakeJenkins() as fake:
+        fake.job('my job', exec_time=0.01)
+        api = jenkins_api.Jenkins(fake.url)
+        api.poll()
+        job = api.get_job('my job')
+        inv = job.invoke(securitytoken=None, build_params=None, cause=None, description=None)
+        for _ in range(100):
+            api.quick_poll()
+            if inv.status()[1] == Progress.IDLE:
+                break
+            time.sleep(0.01)
+
+        assert inv.status() == (BuildResult.SUCCESS, Progress.IDLE)
+        assert fake.jobs['my job'].builds[1][0] == 'SUCCESS'
+
+
+def test_transport_restkit_options():
+    if test_cfg.selected_api() != ApiType.JENKINS:
+        return
+
+    with raises(TypeError):
+        Transport()  # pylint: disable=abstract-class-instantiated
+
+    with FakeJenkins() as fake:
+        fake.job('j1', builds=[(1, 'SUCCESS')])
+        # Restkit options are still accepted, with the restkit transport
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            api = jenkins_api.Jenkins(fake.url, filters=[], timeout=5)
+        assert [warning.category for warning in caught] == [DeprecationWarning]
+        assert isinstance(api.transport, RestkitTransport)
+        api.poll()
+        assert api.get_job('j1')
+
+        with raises(ValueError):
+            api.get('/api/json', timeout=0.1)
+
+        with raises(TypeError):
+            jenkins_api.Jenkins(fake.url, transport=PooledTransport(fake.url), filters=[])
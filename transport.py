@@ -0,0 +1,309 @@
+# Copyright (c) 2012 - 2015 Lars Hupfeldt Nielsen, Hupfeldt IT
+# All rights reserved. This work is under a BSD license, see LICENSE.TXT.
+
+"""HTTP transports used by jenkins_api to send requests to Jenkins"""
+
+import abc, base64, socket, urllib, urlparse, httplib, threading, zlib
+from Queue import LifoQueue, Empty, Full
+
+
+class RequestFailed(Exception):
+    """Jenkins answered with an error status
+
+    Attributes:
+        status_int (int): The http status.
+        response (Response): The error response.
+    """
+
+    def __init__(self, msg, status_int, response=None):
+        super(RequestFailed, self).__init__(msg)
+        self.status_int = status_int
+        self.response = response
+
+
+class ResourceNotFound(RequestFailed):
+    pass
+
+
+class Unauthorized(RequestFailed):
+    pass
+
+
+def _raise_for_status(response):
+    if response.status_int < 400:
+        return response
+    if response.status_int == 404:
+        raise ResourceNotFound(response.body_string(), response.status_int, response)
+    if response.status_int in (401, 403):
+        raise Unauthorized(response.body_string(), response.status_int, response)
+    raise RequestFailed(response.body_string(), response.status_int, response)
+
+
+_read_chunk_size = 64 * 1024
+
+
+def _iter_body(http_response):
+    """Yield the body in chunks as it is received, decompressing gzip"""
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS) if http_response.getheader('content-encoding') == 'gzip' else None
+    while True:
+        chunk = http_response.read(_read_chunk_size)
+        if not chunk:
+            break
+        yield decompressor.decompress(chunk) if decompressor else chunk
+    if decompressor:
+        yield decompressor.flush()
+
+
+def _encode(value):
+    return value.encode('utf-8') if isinstance(value, unicode) else value
+
+
+def _urlencode(dct):
+    return urllib.urlencode([(_encode(key), _encode(value)) for key, value in dct.items()])
+
+
+class Headers(dict):
+    """Response headers, keyed by lower case header name. Lookup with :py:meth:`get` is case insensitive."""
+
+    def __init__(self, items):
+        super(Headers, self).__init__((name.lower(), value) for name, value in items)
+
+    def __getitem__(self, name):
+        return super(Headers, self).__getitem__(name.lower())
+
+    def __contains__(self, name):
+        return super(Headers, self).__contains__(name.lower())
+
+    def get(self, name, default=None):
+        return super(Headers, self).get(name.lower(), default)
+
+
+class Response(object):
+    """A complete response, the body has been read"""
+
+    def __init__(self, status_int, headers, body):
+        self.status_int = status_int
+        self.headers = headers
+        self.location = headers.get('location')
+        self._body = body
+
+    def body_string(self):
+        return self._body
+
+    def iter_body(self):
+        """Yield the body in chunks"""
+        yield self._body
+
+
+class StreamedResponse(Response):
+    """A response where the body is read while iterating over :py:meth:`iter_body`
+
+    The connection is not used for other requests until the body has been read.
+    """
+
+    def __init__(self, status_int, headers, chunks, done):
+        super(StreamedResponse, self).__init__(status_int, headers, None)
+        self._chunks = chunks
+        self._done = done
+
+    def body_string(self):
+        if self._body is None:
+            self._body = ''.join(self.iter_body())
+        return self._body
+
+    def iter_body(self):
+        if self._chunks is None:
+            raise Exception("Body has already been read")
+
+        chunks = self._chunks
+        self._chunks = None
+        complete = False
+        try:
+            for chunk in chunks:
+                yield chunk
+            complete = True
+        finally:
+            self._done(complete)
+
+
+class Transport(object):
+    """Sends requests to Jenkins. Subclass and implement :py:meth:`request` to use another http client.
+
+    Implementations must be thread safe, requests may be sent from several threads at the same time.
+    """
+
+    __metaclass__ = abc.ABCMeta
+
+    @abc.abstractmethod
+    def request(self, method, path, headers=None, payload=None, params=None, timeout=None, stream=False):
+        """Send a request and return the Response
+
+        Args:
+            method (str): 'GET', 'POST' or 'HEAD'.
+            path (str): Path relative to the uri of the Jenkins.
+            headers (dict): Extra request headers.
+            payload (str or dict): Request body, a dict is sent form encoded.
+            params (dict): Query parameters.
+            timeout (float): Seconds to wait for Jenkins, None means the transport default.
+            stream (bool): If True, the body may be returned before it is read, as a :py:class:`StreamedResponse`,
+                so that it can be processed while it is received.
+
+        Raises:
+            RequestFailed: If Jenkins answered with an error status (400 or above), ResourceNotFound for 404, Unauthorized for 401 and 403.
+        """
+
+    def close(self):
+        """Close any open connections"""
+        pass
+
+
+def _closed_while_idle(ex, sent, method):
+    """True if a request on a reused connection failed because Jenkins had closed the connection, so that it was never handled
+
+    A timeout or a failure after a POST was sent may have happened after Jenkins handled the request, e.g. triggered a build.
+    """
+    if isinstance(ex, socket.timeout):
+        return False
+    return not sent or (method != 'POST' and isinstance(ex, httplib.BadStatusLine))
+
+
+class PooledTransport(Transport):
+    """Default transport using httplib, keeping connections to Jenkins open between requests
+
+    Args:
+        uri (str): The uri of the Jenkins, may include a path prefix.
+        username (str): If given, requests are sent with basic authentication.
+        password (str): Password of user.
+        pool_size (int): Max number of idle connections kept open. More connections are opened if needed, but only this many are kept.
+            If 0, a new connection is used for every request.
+        timeout (float): Default seconds to wait for Jenkins, None means wait forever.
+        compress (bool): Ask Jenkins to gzip the responses to GET requests. The json from Jenkins compresses well,
+            so this saves a lot of transfer time if Jenkins is not on a fast local network.
+
+    Attributes:
+        connections_opened (int): Number of connections opened, for statistics.
+    """
+
+    def __init__(self, uri, username=None, password=None, pool_size=10, timeout=None, compress=True):
+        parsed = urlparse.urlparse(uri)
+        self._connection_class = httplib.HTTPSConnection if parsed.scheme == 'https' else httplib.HTTPConnection
+        self._netloc = parsed.netloc.rpartition('@')[2]
+        self._prefix = parsed.path.rstrip('/')
+        self._headers = {}
+        if username or password:
+            self._headers['Authorization'] = 'Basic ' + base64.b64encode(_encode(username) + ':' + _encode(password))
+        self.timeout = timeout
+        self.compress = compress
+        self.pool_size = pool_size
+        self._idle = LifoQueue(pool_size)
+        self._lock = threading.Lock()
+        self.connections_opened = 0
+
+    def _connection(self):
+        try:
+            return self._idle.get_nowait(), True
+        except Empty:
+            with self._lock:
+                self.connections_opened += 1
+            return self._connection_class(self._netloc, timeout=self.timeout), False
+
+    def _release(self, connection):
+        if self.pool_size < 1:
+            connection.close()
+            return
+
+        try:
+            self._idle.put_nowait(connection)
+        except Full:
+            connection.close()
+
+    def request(self, method, path, headers=None, payload=None, params=None, timeout=None, stream=False):
+        # Job names may contain spaces and non ascii characters
+        url = self._prefix + urllib.quote(_encode(path), safe='/')
+        if params:
+            url += '?' + _urlencode(params)
+
+        all_headers = dict(self._headers)
+        if self.compress and method == 'GET':
+            all_headers['Accept-Encoding'] = 'gzip'
+        if headers:
+            all_headers.update(headers)
+        if isinstance(payload, dict):
+            payload = _urlencode(payload)
+        elif payload is None and method == 'POST':
+            # Make sure Content-Length is sent
+            payload = ''
+
+        while True:
+            connection, reused = self._connection()
+            sent = False
+            try:
+                connection.timeout = self.timeout if timeout is None else timeout
+                if connection.sock:
+                    connection.sock.settimeout(connection.timeout)
+                connection.request(method, url, payload, all_headers)
+                sent = True
+                http_response = connection.getresponse()
+                if not stream or http_response.status >= 400:
+                    body = ''.join(_iter_body(http_response))
+            except (httplib.HTTPException, socket.error) as ex:
+                connection.close()
+                if reused and _closed_while_idle(ex, sent, method):
+                    # Jenkins closed the idle connection, retry on a new connection
+                    continue
+                raise
+
+            if not stream or http_response.status >= 400:
+                self._done(connection, http_response, complete=True)
+                return _raise_for_status(Response(http_response.status, Headers(http_response.getheaders()), body))
+
+            def done(complete, connection=connection, http_response=http_response):
+                self._done(connection, http_response, complete)
+
+            return StreamedResponse(http_response.status, Headers(http_response.getheaders()), _iter_body(http_response), done)
+
+    def _done(self, connection, http_response, complete):
+        if complete and not http_response.will_close:
+            self._release(connection)
+        else:
+            connection.close()
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except Empty:
+                return
+
+
+class RestkitTransport(Transport):
+    """Transport using restkit, the http client used by earlier versions of jenkinsflow
+
+    Args:
+        uri (str): The uri of the Jenkins.
+        username (str): If given, requests are sent with basic authentication.
+        password (str): Password of user.
+        **kwargs: Options for restkit.Resource. The timeout of all requests is set with the 'timeout' option, restkit has no timeout per request.
+    """
+
+    def __init__(self, uri, username=None, password=None, **kwargs):
+        import restkit
+
+        if username or password:
+            filters = kwargs.get('filters', [])
+            filters.append(restkit.BasicAuth(username, password))
+            kwargs['filters'] = filters
+        self._errors = restkit.errors
+        self._resource = restkit.Resource(uri, **kwargs)
+
+    def request(self, method, path, headers=None, payload=None, params=None, timeout=None, stream=False):
+        # The body is always read before returning, which 'stream' allows
+        if timeout is not None:
+            raise ValueError("RestkitTransport does not support a timeout per request, use the 'timeout' option when creating the transport")
+        try:
+            response = self._resource.request(method, path=path, payload=payload, headers=headers, params_dict=params)
+        except self._errors.ResourceError as ex:
+            # The body has already been read into the message
+            response = ex.response
+            return _raise_for_status(Response(response.status_int, Headers(response.headers.items()), ex.msg))
+        return Response(response.status_int, Headers(response.headers.items()), response.body_string())